@@ -1,27 +1,181 @@
 #!/usr/bin/env python3
 import argparse
+import json
 import os
 import sys
+from collections import Counter
 
-from tools.validate_sch import validate_schematron, print_failure
+from tools.batch import validate_documents, validate_phases_parallel
+from tools.benchmark import run_benchmarks, compare_results, format_comparison, DEFAULT_SCALES, DEFAULT_REPEAT, DEFAULT_THRESHOLD
+from tools.validate_sch import print_failure, print_failure_group, validate_schematron, Validator, ENGINES, ENGINE_XSLT
+from tools.profile_sch import format_profile, profile_to_dict
+from tools.result_cache import ResultCache, DEFAULT_MAX_SIZE, DEFAULT_MAX_AGE
 from tools.generate_sch import generate_sch
 from tools.clean_xml import clean_files
+from tools.compile_sch import REPORT_LEAN, REPORT_FULL
+from tools.corpus import find_documents, validate_corpus, DOCUMENT_EXTENSION
+from tools.constants import SCH_NSMAP
+from tools.server import serve
+from tools.stream import run_stream
+from tools.synthetic import generate_document, COLLECTIONS
 
 
 def validate_schematrons(args):
+    # a single phase is compiled on its own, pruned to its patterns, see tools.validate_sch._split_phase_selection
+    if args.phase is not None and len(args.phase) == 1:
+        args.phase = args.phase[0]
+
+    if args.stream and (args.output is not None or args.jobs != 1 or args.result_cache or args.profile or args.profile_output
+                        or args.split_phases or args.aggregate or args.manifest is not None):
+        parser_validate.error('--stream can not be used with --output, --jobs, --result-cache, --profile, --split-phases, --aggregate or --manifest')
+
+    if args.aggregate and (args.profile or args.profile_output or args.split_phases):
+        parser_validate.error('--aggregate can not be used with --profile or --split-phases')
+
+    if args.stream:
+        num_invalid = run_stream(
+            args.schematron,
+            sys.stdin.buffer,
+            sys.stdout,
+            phase=args.phase,
+            strict_context=args.strict,
+            engine=args.engine
+        )
+        sys.exit(1 if num_invalid > 0 else 0)
+
+    if not args.documents:
+        parser_validate.error('at least one document is required unless using --stream')
+
+    try:
+        args.documents = find_documents(args.documents, recursive=args.recursive)
+    except Exception as e:
+        parser_validate.error(str(e))
+
+    if args.manifest is not None and (args.output is not None or args.aggregate or args.profile or args.profile_output or args.split_phases):
+        parser_validate.error('--manifest can not be used with --output, --aggregate, --profile or --split-phases')
+
+    if args.engine != ENGINE_XSLT and (args.output is not None or args.profile or args.profile_output):
+        parser_validate.error(f'--output and --profile require the {ENGINE_XSLT} engine')
+
+    if args.result_cache and (args.output is not None or args.profile or args.profile_output or args.split_phases):
+        parser_validate.error('--result-cache can not be used with --output, --profile or --split-phases')
+
+    if args.profile or args.profile_output:
+        profile_schematrons(args)
+
+    if args.split_phases:
+        split_phases(args)
+
+    result_cache = None
+    if args.result_cache:
+        result_cache = ResultCache(
+            args.result_cache_dir,
+            max_size=int(args.result_cache_max_size * 1024 * 1024),
+            max_age=args.result_cache_max_age * 24 * 60 * 60,
+        )
+
+    num_errors = 0
+    if args.manifest is not None:
+        results = validate_manifest_corpus(args, result_cache)
+    else:
+        results = validate_documents(
+            args.schematron,
+            args.documents,
+            jobs=args.jobs,
+            result_path=args.output,
+            phase=args.phase,
+            strict_context=args.strict,
+            engine=args.engine,
+            aggregate=args.aggregate,
+            result_cache=result_cache
+        )
+    for doc, failures in results:
+        if args.aggregate:
+            for group in failures:
+                if group.role == 'ERROR':
+                    num_errors += group.count
+                print_failure_group(doc, group, colored=args.color, verbose=args.verbose)
+            continue
+        for f in failures:
+            if f.role == 'ERROR':
+                num_errors += 1
+            print_failure(doc, f, colored=args.color, verbose=args.verbose)
+
+    if num_errors > 0:
+        sys.exit(1)
+    sys.exit(0)
+
+
+def validate_manifest_corpus(args, result_cache):
+    """
+    Yields the failures of each document, only validating the documents that
+    changed since they were recorded in the manifest
+    """
+    num_validated = 0
+    results = validate_corpus(
+        args.schematron,
+        args.documents,
+        manifest_path=args.manifest,
+        jobs=args.jobs,
+        phase=args.phase,
+        strict_context=args.strict,
+        engine=args.engine,
+        result_cache=result_cache
+    )
+    for doc, failures, validated in results:
+        num_validated += validated
+        yield doc, failures
+    print(f'INFO: validated {num_validated} new or changed of {len(args.documents)} documents', file=sys.stderr)
+
+
+def split_phases(args):
+    if args.phase is not None or args.output is not None:
+        parser_validate.error('--phase and --output can not be used with --split-phases')
+
     num_errors = 0
     for doc in args.documents:
-        failures = validate_schematron(
+        failures = validate_phases_parallel(
+            args.schematron,
+            doc,
+            jobs=args.jobs,
+            strict_context=args.strict,
+            engine=args.engine
+        )
+        for f in failures:
+            if f.role == 'ERROR':
+                num_errors += 1
+            print_failure(doc, f, colored=args.color, verbose=args.verbose)
+
+    if num_errors > 0:
+        sys.exit(1)
+    sys.exit(0)
+
+
+def profile_schematrons(args):
+    if args.output is not None:
+        parser_validate.error('--output can not be used with --profile')
+
+    num_errors = 0
+    profiles = {}
+    for doc in args.documents:
+        failures, profile = validate_schematron(
             args.schematron,
             doc,
-            result_path=args.output,
             phase=args.phase,
-            strict_context=args.strict
+            strict_context=args.strict,
+            profile=True
         )
         for f in failures:
             if f.role == 'ERROR':
                 num_errors += 1
             print_failure(doc, f, colored=args.color, verbose=args.verbose)
+        print(f'\nProfile of {doc}\n')
+        print(format_profile(profile, limit=None if args.verbose else 10))
+        profiles[doc] = profile_to_dict(profile)
+
+    if args.profile_output is not None:
+        with open(args.profile_output, 'w') as f:
+            json.dump(profiles, f, indent=2)
 
     if num_errors > 0:
         sys.exit(1)
@@ -31,7 +185,9 @@ def validate_schematrons(args):
 def generate_schematron(args):
     if args.exemplary_xml is None:
         print('INFO: No exemplary xml file provided - will not be able to check for potential unfired rule contexts')
-    generate_sch(args.source_csv, args.output, args.exemplary_xml)
+    scan_counts = Counter()
+    generate_sch(args.source_csv, args.output, args.exemplary_xml, scan_counts=scan_counts)
+    print(f'INFO: anchored {scan_counts["anchored"]} descendant scans in {args.source_csv} ({scan_counts["ambiguous"]} left as ambiguous)')
 
 
 def generate_all_schematron(args):
@@ -88,6 +244,97 @@ def clean_all_files(args):
     sys.exit(0)
 
 
+def precompile_all_schematron(args):
+    """
+    Compiles every schematron under schematron/ (except the lib directory, which
+    only holds included patterns) and stores the results in the on-disk cache so
+    later validations can skip compilation. Validations which save the svrl
+    result (--output) use the full report, which is only compiled with --full-report.
+    """
+    report_modes = [REPORT_LEAN, REPORT_FULL] if args.full_report else [REPORT_LEAN]
+    base_dir = 'schematron/'
+    lib_dir = os.path.join(base_dir, 'lib')
+    for root, _, files in os.walk(base_dir):
+        if os.path.commonpath([root, lib_dir]) == os.path.normpath(lib_dir):
+            continue
+        for name in sorted(files):
+            if not name.endswith('.sch'):
+                continue
+            filename = os.path.join(root, name)
+            try:
+                validators = [Validator(filename, report_mode=report_mode) for report_mode in report_modes]
+            except Exception as e:
+                print(f'WARNING: failed to compile {filename}: {e}')
+                continue
+            print(filename)
+            if args.all_phases:
+                for phase in validators[0].schematron_tree.xpath('//sch:phase/@id', namespaces=SCH_NSMAP):
+                    for report_mode in report_modes:
+                        Validator(filename, phase=phase, report_mode=report_mode)
+                    print(f'{filename} (phase: {phase})')
+
+    sys.exit(0)
+
+
+def synthesize_document(args):
+    scales = {}
+    for scale in args.scale:
+        collection, _, factor = scale.partition('=')
+        try:
+            scales[collection] = float(factor)
+        except ValueError:
+            parser_synthesize.error(f'invalid scale "{scale}", expected <collection>=<factor>')
+        if collection not in COLLECTIONS:
+            parser_synthesize.error(f'unknown collection "{collection}", expected one of: {", ".join(COLLECTIONS)}')
+
+    tree = generate_document(args.source, scales, seed=args.seed)
+    tree.write(args.output, xml_declaration=True, encoding='UTF-8', pretty_print=True)
+    sys.exit(0)
+
+
+def run_benchmark_suite(args):
+    try:
+        scales = [float(scale) for scale in args.scales.split(',')]
+    except ValueError:
+        parser_benchmark.error(f'invalid scales "{args.scales}", expected comma separated numbers')
+
+    results = run_benchmarks(
+        'schematron',
+        scales=scales,
+        repeat=args.repeat,
+        progress=lambda name: print(f'INFO: benchmarking {name}', file=sys.stderr)
+    )
+    for name, error in results['errors'].items():
+        print(f'WARNING: failed to benchmark {name}: {error}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_results(baseline, results, threshold=args.threshold)
+        print(format_comparison(comparison))
+        if any(c['regression'] for c in comparison):
+            print(f'Found benchmarks more than {args.threshold:.0%} slower than the baseline')
+            sys.exit(1)
+    elif args.output is None:
+        print(json.dumps(results, indent=2))
+    sys.exit(0)
+
+
+def serve_schematrons(args):
+    serve(
+        'schematron/',
+        host=args.host,
+        port=args.port,
+        socket_path=args.socket,
+        max_concurrency=args.max_concurrency,
+        reload_interval=args.reload_interval,
+    )
+
+
 # Construct Parsers
 parser = argparse.ArgumentParser(description='Tool for validating and generating Schematron documents')
 subparsers = parser.add_subparsers()
@@ -104,7 +351,7 @@ parser_validate.add_argument(
     'documents',
     metavar='doc',
     type=str,
-    nargs='+',
+    nargs='*',
     help='one or more documents to test'
 )
 parser_validate.add_argument(
@@ -124,8 +371,9 @@ parser_validate.add_argument(
     '-p',
     '--phase',
     type=str,
+    action='append',
     default=None,
-    help='id of phase to run'
+    help='id of phase to run, may be repeated to run several phases in one pass'
 )
 parser_validate.add_argument(
     '-s',
@@ -133,6 +381,81 @@ parser_validate.add_argument(
     action='store_true',
     help='reports, as errors, rules that were not applied to the document (ie context did not match)'
 )
+parser_validate.add_argument(
+    '-j',
+    '--jobs',
+    type=int,
+    default=1,
+    help='number of processes used to validate documents in parallel (0 uses one per CPU)'
+)
+parser_validate.add_argument(
+    '--engine',
+    choices=ENGINES,
+    default=ENGINE_XSLT,
+    help='how the schematron is run: compiled to xslt, or with its rules evaluated as xpath directly (faster, also accepts the csv a schematron is generated from)'
+)
+parser_validate.add_argument(
+    '--split-phases',
+    action='store_true',
+    help='validate each document with its phases split across --jobs processes, for very large documents'
+)
+parser_validate.add_argument(
+    '--stream',
+    action='store_true',
+    help='read document paths (or a byte count line followed by that many bytes of xml) from stdin until EOF and print one json result per line; '
+         'as a line of only digits is a byte count, give paths made only of digits as ./<path>'
+)
+parser_validate.add_argument(
+    '-r',
+    '--recursive',
+    action='store_true',
+    help=f'validate every {DOCUMENT_EXTENSION} document under the directories given; documents may also be glob patterns (quoted, ** matches any number of directories)'
+)
+parser_validate.add_argument(
+    '--manifest',
+    type=str,
+    default=None,
+    help='path of a manifest of the results of every document; documents unchanged since they were recorded are not validated again, and an interrupted run resumes where it stopped'
+)
+parser_validate.add_argument(
+    '--aggregate',
+    action='store_true',
+    help='print each failing assert once per rule, with the number of failures, the range of lines and (with --verbose) example locations'
+)
+parser_validate.add_argument(
+    '--result-cache',
+    action='store_true',
+    help='return the failures of documents validated before (ignoring formatting) from an on-disk cache, and cache the results of the others'
+)
+parser_validate.add_argument(
+    '--result-cache-dir',
+    type=str,
+    default=None,
+    help='directory of the result cache, defaults to $BSYNC_RESULT_CACHE_DIR or ~/.cache/bsync_testsuite/results'
+)
+parser_validate.add_argument(
+    '--result-cache-max-size',
+    type=float,
+    default=DEFAULT_MAX_SIZE / (1024 * 1024),
+    help='size in MB above which the least recently used results are removed from the cache'
+)
+parser_validate.add_argument(
+    '--result-cache-max-age',
+    type=float,
+    default=DEFAULT_MAX_AGE / (24 * 60 * 60),
+    help='days after which unused results are removed from the cache'
+)
+parser_validate.add_argument(
+    '--profile',
+    action='store_true',
+    help='profile the validation and print the time and match counts of the hottest phases, patterns, rules and asserts'
+)
+parser_validate.add_argument(
+    '--profile-output',
+    type=str,
+    default=None,
+    help='path to file to save the complete profile as json (implies --profile)'
+)
 parser_validate.add_argument(
     '-v',
     '--verbose',
@@ -190,8 +513,122 @@ parser_clean_files.set_defaults(func=_clean_files)
 parser_clean_all_files = subparsers.add_parser('clean_all', description='Command for formatting all *.xml and *.sch files')
 parser_clean_all_files.set_defaults(func=clean_all_files)
 
+# Precompile command
+parser_precompile = subparsers.add_parser('precompile', description='Command for compiling all schematron files under schematron/ into the on-disk cache')
+parser_precompile.add_argument(
+    '-a',
+    '--all-phases',
+    action='store_true',
+    help='also compile each phase of every schematron separately'
+)
+parser_precompile.add_argument(
+    '--full-report',
+    action='store_true',
+    help='also compile the full svrl report used when saving the validation result with validate --output'
+)
+parser_precompile.set_defaults(func=precompile_all_schematron)
+
+# Serve command
+parser_serve = subparsers.add_parser('serve', description='Command for running a local HTTP server which validates POSTed documents against the schematron under schematron/')
+parser_serve.add_argument(
+    '--host',
+    type=str,
+    default='127.0.0.1',
+    help='host to listen on'
+)
+parser_serve.add_argument(
+    '--port',
+    type=int,
+    default=8080,
+    help='port to listen on'
+)
+parser_serve.add_argument(
+    '--socket',
+    type=str,
+    default=None,
+    help='path of a unix socket to listen on instead of host and port'
+)
+parser_serve.add_argument(
+    '--max-concurrency',
+    type=int,
+    default=4,
+    help='maximum number of documents validated at the same time'
+)
+parser_serve.add_argument(
+    '--reload-interval',
+    type=float,
+    default=2.0,
+    help='seconds between checks for modified schematron files (0 disables reloading)'
+)
+parser_serve.set_defaults(func=serve_schematrons)
+
+# Benchmark command
+parser_benchmark = subparsers.add_parser('benchmark', description='Command for timing schematron compilation, validation and failure extraction for every schematron in v2.0.0 and v2.2.0, as well as generate_all and clean_all')
+parser_benchmark.add_argument(
+    '-o',
+    '--output',
+    type=str,
+    default=None,
+    help='path to save the results as json, e.g. to use as a baseline'
+)
+parser_benchmark.add_argument(
+    '--compare',
+    type=str,
+    default=None,
+    help='path of a baseline saved with --output; exits with an error if any benchmark regressed'
+)
+parser_benchmark.add_argument(
+    '--threshold',
+    type=float,
+    default=DEFAULT_THRESHOLD,
+    help='relative slowdown compared to the baseline which counts as a regression'
+)
+parser_benchmark.add_argument(
+    '--scales',
+    type=str,
+    default=','.join(str(scale) for scale in DEFAULT_SCALES),
+    help='comma separated factors by which every collection of the validated documents is scaled'
+)
+parser_benchmark.add_argument(
+    '--repeat',
+    type=int,
+    default=DEFAULT_REPEAT,
+    help='number of times each measurement is taken, the fastest is used'
+)
+parser_benchmark.set_defaults(func=run_benchmark_suite)
+
+# Synthesize command
+parser_synthesize = subparsers.add_parser('synthesize', description='Command for generating a large BuildingSync document for load testing by scaling collections of an existing document')
+parser_synthesize.add_argument(
+    'source',
+    type=str,
+    help='document to start from, e.g. an exemplary file or templates/BuildingSync_template_L100.xml'
+)
+parser_synthesize.add_argument(
+    '-o',
+    '--output',
+    type=str,
+    required=True,
+    help='path to save the generated document'
+)
+parser_synthesize.add_argument(
+    '--scale',
+    type=str,
+    action='append',
+    default=[],
+    help=f'<collection>=<factor>, multiplies the number of items in the collection by factor; can be given multiple times. Collections: {", ".join(COLLECTIONS)}'
+)
+parser_synthesize.add_argument(
+    '--seed',
+    type=int,
+    default=0,
+    help='seed for choosing which items are copied when a factor is not a whole number'
+)
+parser_synthesize.set_defaults(func=synthesize_document)
+
 # command with no sub-commands should just print help
 parser.set_defaults(func=lambda _: parser.print_help())
 
-args = parser.parse_args()
-args.func(args)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.func(args)
@@ -1,15 +1,35 @@
 import copy
+import functools
 import os
 import pprint
 
+import pytest
 from lxml import etree
 
+from tools import validate_sch
 from tools.constants import BSYNC_NSMAP
+from tools.failure_set import FailureSet
+from tools.sch_lib import SchematronLibrary
+from tools.validate_sch import get_validator
 
 SCH_LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
 v2_0_0_SCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'v2.0.0')
 v2_2_0_SCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'v2.2.0')
 
+# parses each lib file and instantiates each abstract pattern once per test session
+SCH_LIB = SchematronLibrary(SCH_LIB_DIR)
+
+# size of the get_validator cache during the test session, large enough that
+# no schematron and phase validated with is ever evicted, see cached_validator
+SESSION_VALIDATOR_CACHE_SIZE = 1024
+
+
+@pytest.fixture(scope='session', autouse=True)
+def session_validator_cache():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(validate_sch, 'VALIDATOR_CACHE_SIZE', SESSION_VALIDATOR_CACHE_SIZE)
+        yield
+
 
 class AssertFailureRolesMixin:
     def assert_failure_counts(self, actual_failures, expected_dict):
@@ -19,7 +39,7 @@ class AssertFailureRolesMixin:
         :param actual_failures: list of Failures
         :param expected_dict: dict, keys are roles and values are the number of occurrences of that failure role
         """
-        actual = failures_by_role(copy.deepcopy(actual_failures))
+        actual = failures_by_role(actual_failures)
         expected = copy.deepcopy(expected_dict)
         for expected_role in list(expected.keys()):
             if expected[expected_role] != 0:
@@ -38,7 +58,7 @@ class AssertFailureRolesMixin:
         :param actual_failures: list of Failures
         :param expected_dict: dict, keys are roles and values lists of assertion messages
         """
-        actual = failures_by_role(copy.deepcopy(actual_failures))
+        actual = failures_by_role(actual_failures)
         expected = copy.deepcopy(expected_dict)
         for expected_role in expected:
             if len(expected[expected_role]) != 0:
@@ -52,30 +72,62 @@ class AssertFailureRolesMixin:
 
 
 def failures_by_role(failures):
-    """Returns a dict of array of failures, keyed by failure role
+    """Returns a dict of failures, keyed by failure role
 
     :param failures: list of Failures
-    :return: dict
+    :return: dict, {role: FailureSet}
     """
-    res = {}
-    for failure in failures:
-        if failure.role in res:
-            res[failure.role].append(failure)
-        else:
-            res[failure.role] = [failure]
+    return FailureSet(failures).group_by_role()
+
 
-    return res
+@functools.lru_cache(maxsize=None)
+def _pristine_exemplary_tree(name, version):
+    """Parses the exemplary file once per test session. The tree must never be
+    modified, see exemplary_tree for a copy which can be
+    """
+    exemplary_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), version, 'exemplary_files', f'{name}.xml')
+    return etree.parse(exemplary_file)
 
 
 def exemplary_tree(name, version):
-    """Returns parsed lxml tree of the exemplary file
+    """Returns parsed lxml tree of the exemplary file. The file is only parsed once
+    per test session, each call returns a fresh copy which is safe to modify
 
     :param name: str, name of the file, without any file extension
     :param version: str, version directory
     :return: lxml.etree
     """
-    exemplary_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), version, 'exemplary_files', f'{name}.xml')
-    return etree.parse(exemplary_file)
+    return copy.deepcopy(_pristine_exemplary_tree(name, version))
+
+
+def cached_validator(schematron, phase=None):
+    """Returns the compiled Validator for the schematron and phase, compiled once per
+    test session. It is the validator of tools.validate_sch.get_validator (so the
+    same one validate_schematron uses), whose cache is made large enough for the
+    session that a suite with many schematron and phases never compiles one twice
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param phase: str | None
+    :return: Validator
+    """
+    return get_validator(schematron, phase=phase)
+
+
+@functools.lru_cache(maxsize=None)
+def exemplary_failures(schematron, name, version, phase=None, strict_context=False):
+    """Returns the failures of the unmodified exemplary file, validated once per test
+    session. Use it for checking the exemplary file is valid before modifying a copy
+    of it
+
+    :param schematron: str, path to sch file
+    :param name: str, name of the exemplary file, without any file extension
+    :param version: str, version directory
+    :param phase: str | None
+    :param strict_context: bool
+    :return: tuple of Failures
+    """
+    validator = cached_validator(schematron, phase)
+    return tuple(validator.validate(_pristine_exemplary_tree(name, version), strict_context=strict_context))
 
 
 def remove_element(tree, xpath, expected_removals=1):
@@ -105,34 +157,17 @@ def sch_from_imported_pattern(lib_filename, pattern_id):
     :param pattern_id: str, pattern ID to use from file
     :return: str
     """
-    return f"""<schema xmlns="http://purl.oclc.org/dsdl/schematron">
-    <ns prefix="auc" uri="http://buildingsync.net/schemas/bedes-auc/2019"/>
-    <phase id="Tests">
-        <active pattern="{pattern_id}"/>
-    </phase>
-    <include href="{SCH_LIB_DIR}/{lib_filename}#{pattern_id}"/>
-</schema>"""
+    return SCH_LIB.schema([SCH_LIB.pattern(lib_filename, pattern_id)])
 
 
 def sch_from_imported_abstract_pattern(lib_filename, pattern_id, params):
     """
-    Creates a schematron document which only includes the specified abastract pattern
+    Creates a schematron document which only contains the specified abastract pattern,
+    instantiated with the params
 
     :param lib_filename: str, filename to use (e.g. buildingElements.sch)
     :param pattern_id: str, pattern ID to use from file
     :param params: dict, parameters for abstract pattern, where keys are the parameter name and values are their values
     :return: str
     """
-    pattern_instance_id = f'inst.{pattern_id}'
-    param_strings = [f'<param name="{key}" value="{val}"/>' for key, val in params.items()]
-    joined_param_strings = '\n        '.join(param_strings)
-    return f"""<schema xmlns="http://purl.oclc.org/dsdl/schematron">
-    <ns prefix="auc" uri="http://buildingsync.net/schemas/bedes-auc/2019"/>
-    <phase id="Tests">
-        <active pattern="{pattern_instance_id}"/>
-    </phase>
-    <pattern id="{pattern_instance_id}" is-a="{pattern_id}">
-        {joined_param_strings}
-    </pattern>
-    <include href="{SCH_LIB_DIR}/{lib_filename}#{pattern_id}"/>
-</schema>"""
+    return SCH_LIB.schema([SCH_LIB.instantiate(lib_filename, pattern_id, params)])
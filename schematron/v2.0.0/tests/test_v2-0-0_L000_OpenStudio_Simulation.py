@@ -1,8 +1,7 @@
 import os
 
 
-from tools.validate_sch import validate_schematron
-from schematron.conftest import AssertFailureRolesMixin, v2_0_0_SCH_DIR
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, v2_0_0_SCH_DIR
 
 
 class TestV200L000OpenStudio(AssertFailureRolesMixin):
@@ -12,7 +11,7 @@ class TestV200L000OpenStudio(AssertFailureRolesMixin):
 
     def test_example_file_1_is_valid_with_info_messages(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.example_file_1)
+        failures = cached_validator(self.schematron).validate(self.example_file_1)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -25,7 +24,7 @@ class TestV200L000OpenStudio(AssertFailureRolesMixin):
 
     def test_example_file_2_is_valid_with_info_messages(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.example_file_2)
+        failures = cached_validator(self.schematron).validate(self.example_file_2)
 
         # -- Assert
         self.assert_failure_messages(failures, {
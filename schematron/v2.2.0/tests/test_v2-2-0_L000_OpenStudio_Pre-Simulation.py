@@ -1,8 +1,7 @@
 import os
 
 from tools.constants import BSYNC_NSMAP
-from tools.validate_sch import validate_schematron
-from schematron.conftest import AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
 
 
 class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
@@ -12,7 +11,7 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = cached_validator(self.schematron).validate(self.exemplary_file)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -22,14 +21,14 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the address
         tree = remove_element(tree, '//auc:Building/auc:Address')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -42,7 +41,7 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         scenario_xpath = '//auc:Scenarios/auc:Scenario[auc:ScenarioType/auc:CurrentBuilding/auc:CalculationMethod/auc:Modeled/auc:SimulationCompletionStatus/text()="Not Started"]'
@@ -53,7 +52,7 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
         tree = remove_element(tree, scenario_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # Only worry about the first failure
@@ -69,7 +68,7 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         scenario_linked_building_xpath = '//auc:Scenarios/auc:Scenario[auc:ScenarioType/auc:CurrentBuilding/auc:CalculationMethod/auc:Modeled/auc:SimulationCompletionStatus/text()="Not Started"]/auc:LinkedPremises/auc:Building'
@@ -80,7 +79,7 @@ class TestL000OpenStudioSimulation01(AssertFailureRolesMixin):
         tree = remove_element(tree, scenario_linked_building_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -98,7 +97,7 @@ class TestL000OpenStudioSimulation02(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = cached_validator(self.schematron).validate(self.exemplary_file)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -108,14 +107,14 @@ class TestL000OpenStudioSimulation02(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the climate zone
         tree = remove_element(tree, '//auc:Building/auc:ClimateZoneType')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
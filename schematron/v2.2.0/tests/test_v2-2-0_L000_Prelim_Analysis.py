@@ -1,8 +1,7 @@
 import os
 
 
-from tools.validate_sch import validate_schematron
-from schematron.conftest import AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
 
 
 class TestL000PrelimAnalysis(AssertFailureRolesMixin):
@@ -11,7 +10,7 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = cached_validator(self.schematron).validate(self.exemplary_file)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -21,14 +20,14 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = exemplary_tree('L000_Prelim_Analysis', 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the measured scenario
         tree = remove_element(tree, '//auc:Scenario[auc:ScenarioType/auc:CurrentBuilding/auc:CalculationMethod/auc:Measured]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -43,14 +42,14 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = exemplary_tree('L000_Prelim_Analysis', 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the measured scenario
         tree = remove_element(tree, '//auc:Scenario[auc:ScenarioType/auc:Benchmark]/auc:LinkedPremises/auc:Building/auc:LinkedBuildingID')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -64,14 +63,14 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = exemplary_tree('L000_Prelim_Analysis', 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the benchmark scenario
         tree = remove_element(tree, '//auc:Scenario/auc:ScenarioType/auc:Benchmark')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -86,14 +85,14 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = exemplary_tree('L000_Prelim_Analysis', 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the benchmark scenario
         tree = remove_element(tree, '//auc:Scenario[auc:ScenarioType/auc:Benchmark]/auc:LinkedPremises/auc:Building/auc:LinkedBuildingID')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -107,7 +106,7 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = exemplary_tree('L000_Prelim_Analysis', 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove the benchmark scenario
@@ -115,7 +114,7 @@ class TestL000PrelimAnalysis(AssertFailureRolesMixin):
         tree = remove_element(tree, '//auc:Building/auc:ClimateZoneType')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -6,9 +6,8 @@ import pytest
 from lxml import etree
 
 from tools.constants import BSYNC_NSMAP, BSYNC_NS
-from tools.validate_sch import validate_schematron
 
-from schematron.conftest import AssertFailureRolesMixin, exemplary_tree, remove_element, replace_element, v2_2_0_SCH_DIR
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, exemplary_tree, exemplary_failures, remove_element, replace_element, v2_2_0_SCH_DIR
 
 
 class TestL100Audit(AssertFailureRolesMixin):
@@ -17,7 +16,7 @@ class TestL100Audit(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -27,7 +26,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # remove any resource uses that aren't electricity (and their linked utilities)
@@ -41,7 +40,7 @@ class TestL100Audit(AssertFailureRolesMixin):
             expected_removals=2)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # need to ignore errors that are related to calculated elements we broke when
@@ -54,7 +53,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # remove any resource uses that are electricity (as well as it's linked auc:Utility)
@@ -62,7 +61,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, '//auc:ResourceUses/auc:ResourceUse[auc:EnergyResource/text() = "Electricity"]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # need to ignore errors that are related to calculated elements we broke when
@@ -77,7 +76,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # duplicate one of the existing resource uses
@@ -93,7 +92,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         assert len(tree.xpath(resource_use_xpath, namespaces=BSYNC_NSMAP)) == 2, 'Expect there to be 2 duplicate ResourceUses'
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # only look at first failure as it's the one we should have caused
@@ -115,7 +114,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # remove the electricity specific required element
@@ -124,7 +123,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -148,7 +147,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace the existing rate schedule with a valid TimeOfUseRate schedule
@@ -188,7 +187,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         replace_element(tree, xpath_to_replace, valid_tou_rate_elem)
 
         # verify updated tree is valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # finally, remove the target element to invalidate the document
@@ -197,7 +196,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -221,7 +220,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace the existing rate schedule with a valid TieredRates schedule
@@ -261,7 +260,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         replace_element(tree, xpath_to_replace, valid_tiered_raw)
 
         # verify updated tree is valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # finally, remove the target element to invalidate the document
@@ -270,7 +269,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -282,7 +281,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace SiteEnergyUse with a bad value
@@ -294,7 +293,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # first failure should be the error message
@@ -307,7 +306,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace SiteEnergyUse with a bad value
@@ -321,7 +320,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -333,7 +332,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace BuildingEnergyUse with a bad value
@@ -345,7 +344,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # first failure should be the error message
@@ -358,7 +357,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace BuildingEnergyUse with a bad value
@@ -372,7 +371,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -384,7 +383,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace OnsiteEnergyProductionConsistentUnits with a bad value
@@ -396,7 +395,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # first failure should be the error message
@@ -410,7 +409,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace ExportedEnergyConsistentUnits with a bad value
@@ -422,7 +421,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # first failure should be the error message
@@ -436,7 +435,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace ImportedEnergyConsistentUnits with a bad value
@@ -448,7 +447,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         elem.text = bad_value
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # first failure should be the error message
@@ -462,7 +461,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # verify classification is Mixed use commercial or Residential
@@ -474,7 +473,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, '//auc:Building/auc:SpatialUnits')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -489,7 +488,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         tree = exemplary_tree('L100_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L100_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # change BuildingClassification
@@ -501,7 +500,7 @@ class TestL100Audit(AssertFailureRolesMixin):
         remove_element(tree, '//auc:Building/auc:SpatialUnits')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -2,8 +2,7 @@ import os
 
 
 from tools.constants import BSYNC_NSMAP
-from tools.validate_sch import validate_schematron
-from schematron.conftest import AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, exemplary_tree, remove_element, v2_2_0_SCH_DIR
 
 
 class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
@@ -13,7 +12,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = cached_validator(self.schematron).validate(self.exemplary_file)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -23,7 +22,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # ensure sections exist as expected
@@ -35,7 +34,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = remove_element(tree, '//auc:Sections/auc:Section[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -44,7 +43,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = remove_element(tree, '//auc:Sections/auc:Section[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -58,7 +57,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # ensure hvac systems exist as expected
@@ -70,7 +69,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = remove_element(tree, '//auc:HVACSystems/auc:HVACSystem[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -84,7 +83,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # ensure simulation status exists as expected
@@ -96,7 +95,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = remove_element(tree, measure_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -110,7 +109,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # ensure simulation status exists as expected
@@ -121,7 +120,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         simulation_element.text = 'Finished'
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -135,7 +134,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         tree = exemplary_tree(self.exemplary_file_name, 'v2.2.0')
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # ensure simulation status exists as expected
@@ -146,7 +145,7 @@ class TestL100OpenStudioSimulation(AssertFailureRolesMixin):
         simulation_element.text = 'Finished'
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -4,9 +4,8 @@ from lxml import etree
 import pytest
 
 from tools.constants import BSYNC_NSMAP, BSYNC_NS
-from tools.validate_sch import validate_schematron
 
-from schematron.conftest import AssertFailureRolesMixin, v2_2_0_SCH_DIR, exemplary_tree, replace_element, remove_element
+from schematron.conftest import cached_validator, AssertFailureRolesMixin, v2_2_0_SCH_DIR, exemplary_tree, exemplary_failures, replace_element, remove_element
 
 
 def qname(tag):
@@ -63,7 +62,7 @@ class TestL200AuditMiscellaneous(AssertFailureRolesMixin):
 
     def test_exemplary_file_is_valid(self):
         # -- Act
-        failures = validate_schematron(self.schematron, self.exemplary_file)
+        failures = exemplary_failures(self.schematron, 'L200_Audit', 'v2.2.0')
 
         # -- Assert
         self.assert_failure_messages(failures, {})
@@ -73,7 +72,7 @@ class TestL200AuditMiscellaneous(AssertFailureRolesMixin):
         tree = exemplary_tree('L200_Audit', 'v2.2.0')
 
         # make sure it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = exemplary_failures(self.schematron, 'L200_Audit', 'v2.2.0')
         self.assert_failure_messages(failures, {})
 
         # replace a ScheduleCategory with something that will be different from
@@ -84,7 +83,7 @@ class TestL200AuditMiscellaneous(AssertFailureRolesMixin):
         elem.text = 'Bogus Category'
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -96,10 +95,8 @@ class TestL200AuditMiscellaneous(AssertFailureRolesMixin):
         tree = exemplary_tree('L200_Audit', 'v2.2.0')
 
         # -- Act
-        failures = validate_schematron(
-            self.schematron,
+        failures = cached_validator(self.schematron, 'multigeneration_and_onsite_renewable_energy_systems').validate(
             tree,
-            phase='multigeneration_and_onsite_renewable_energy_systems',
             # using strict here requires that all rule contexts are fired (ie none can be skipped)
             strict_context=True)
 
@@ -135,14 +132,14 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         replace_element(section_elem, 'auc:Sides', _sides_factory(footprint_shape, window_id='Window-A-Original'))
 
         # make sure it's valid with substituted elements
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove an auc:Side to make it invalid
         remove_element(section_elem, 'auc:Sides/auc:Side[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         expected_sides = len(sides_by_footprint[footprint_shape])
@@ -155,10 +152,8 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         tree = exemplary_tree('L200_Audit', 'v2.2.0')
 
         # -- Act
-        failures = validate_schematron(
-            self.schematron,
+        failures = cached_validator(self.schematron, 'building_envelope_-_fenestration').validate(
             tree,
-            phase='building_envelope_-_fenestration',
             # using strict here requires that all rule contexts are fired (ie none can be skipped)
             strict_context=True)
 
@@ -182,7 +177,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         replace_element(tree, ground_coupling_xpath, new_coupling_tree)
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove an element from the coupling
@@ -190,7 +185,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(tree, remove_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -215,7 +210,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         replace_element(tree, ground_coupling_xpath, new_coupling_tree)
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove an element from the coupling
@@ -223,7 +218,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(tree, remove_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -251,7 +246,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         replace_element(tree, ground_coupling_xpath, new_coupling_tree)
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove an element from the coupling
@@ -259,7 +254,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(tree, remove_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -287,7 +282,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         replace_element(tree, ground_coupling_xpath, new_coupling_tree)
 
         # verify it's valid
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
         self.assert_failure_messages(failures, {})
 
         # remove an element from the coupling
@@ -295,7 +290,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(tree, remove_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -314,7 +309,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(building_elem, 'auc:Sections/auc:Section[auc:SectionType = "Whole building"]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # This breaks many things, but just want to make sure it breaks.  Only checking first error.
@@ -340,7 +335,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         assert len(roof_elem) == 0
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         # Same error as previous
@@ -363,7 +358,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(side_elem[0], 'auc:WallIDs/auc:WallID[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -388,7 +383,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(side_elem_0, 'auc:WindowIDs/auc:WindowID[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -399,7 +394,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(side_elem_1, 'auc:WindowIDs/auc:WindowID[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -422,7 +417,7 @@ class TestL200AuditEnvelopeSystems(AssertFailureRolesMixin):
         remove_element(foundation_elem, 'auc:FoundationID[1]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree)
+        failures = cached_validator(self.schematron).validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -449,7 +444,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_year_installed')
+        failures = cached_validator(self.schematron, 'hvac_year_installed').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -472,7 +467,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_design_capacity')
+        failures = cached_validator(self.schematron, 'hvac_design_capacity').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -494,7 +489,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_condition')
+        failures = cached_validator(self.schematron, 'hvac_condition').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -513,7 +508,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_sources')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_sources').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -536,7 +531,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_central_plant')
+        failures = cached_validator(self.schematron, 'hvac_central_plant').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -550,7 +545,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, '//auc:Delivery[1]/auc:CoolingSourceID')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_sources')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_sources').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -572,7 +567,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         source_id_elem.set('IDref', 'bogus')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_sources')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_sources').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -585,7 +580,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, '//auc:Deliveries/auc:Delivery/auc:DeliveryType/auc:CentralAirDistribution/auc:AirDeliveryType')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_delivery_type_air_delivery')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_delivery_type_air_delivery').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -604,7 +599,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, f'//auc:Systems/auc:FanSystems/auc:FanSystem[auc:LinkedSystemIDs/auc:LinkedSystemID/@IDref = "{delivery_id}"]')
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_delivery_type_air_delivery')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_delivery_type_air_delivery').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -622,7 +617,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_delivery_type_air_delivery')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_delivery_type_air_delivery').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -639,7 +634,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_delivery_outdoor_air_control')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_delivery_outdoor_air_control').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -657,7 +652,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_distribution_system_delivery_type_water_delivery')
+        failures = cached_validator(self.schematron, 'hvac_distribution_system_delivery_type_water_delivery').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -675,7 +670,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_controls_type')
+        failures = cached_validator(self.schematron, 'hvac_controls_type').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -693,7 +688,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_controls_type')
+        failures = cached_validator(self.schematron, 'hvac_controls_type').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -711,7 +706,7 @@ class TestL200AuditHvacSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='hvac_building_automation_system')
+        failures = cached_validator(self.schematron, 'hvac_building_automation_system').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -735,7 +730,7 @@ class TestL200AuditDhwSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='domestic_hot_water_system')
+        failures = cached_validator(self.schematron, 'domestic_hot_water_system').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -753,7 +748,7 @@ class TestL200AuditDhwSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='dhw_operating_condition')
+        failures = cached_validator(self.schematron, 'dhw_operating_condition').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -767,7 +762,7 @@ class TestL200AuditDhwSystems(AssertFailureRolesMixin):
         remove_element(tree, condition_xpath)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='dhw_general_condition')
+        failures = cached_validator(self.schematron, 'dhw_general_condition').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -791,7 +786,7 @@ class TestL200AuditLightingSystems(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='lighting')
+        failures = cached_validator(self.schematron, 'lighting').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -813,7 +808,7 @@ class TestL200AuditLoads(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='process_loads')
+        failures = cached_validator(self.schematron, 'process_loads').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -830,7 +825,7 @@ class TestL200AuditLoads(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='plug_loads')
+        failures = cached_validator(self.schematron, 'plug_loads').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -847,7 +842,7 @@ class TestL200AuditLoads(AssertFailureRolesMixin):
         remove_element(tree, xpath_to_remove)
 
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='conveyance_equipment')
+        failures = cached_validator(self.schematron, 'conveyance_equipment').validate(tree)
 
         # -- Assert
         self.assert_failure_messages(failures, {
@@ -1019,12 +1014,12 @@ class TestL200AuditSectionSystems(AssertFailureRolesMixin):
         occ_classification_elem = occ_classification_elem[0]
         occ_classification_elem.text = section_occupancy_classification
         # verify it's valid initially
-        failures = validate_schematron(self.schematron, tree, phase='section_systems')
+        failures = cached_validator(self.schematron, 'section_systems').validate(tree)
         self.assert_failure_messages(failures, {})
         # change the ID of the section to "unlink" the systems and create errors
         section_elem = occ_classification_elem.getparent()
         section_elem.attrib['ID'] = 'Unlinked-Section'
         # -- Act
-        failures = validate_schematron(self.schematron, tree, phase='section_systems')
+        failures = cached_validator(self.schematron, 'section_systems').validate(tree)
         # -- Assert
         self.assert_failure_messages(failures, expected_errors)
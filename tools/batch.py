@@ -0,0 +1,433 @@
+import functools
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+from multiprocessing import shared_memory
+
+from lxml import etree
+
+from .catalog import build_catalog, expected_rules
+from .compile_sch import REPORT_FULL, REPORT_LEAN, expand_schematron
+from .constants import SCH_NSMAP
+from .failure_set import FailureSet
+from .validate_sch import (
+    Failure, get_validator, ENGINE_XSLT, _split_phase_selection, _parse_document, _find_unfired_rules, _unfired_rule_failure,
+)
+from .xpath_engine import _load_schematron
+
+# number of documents a worker process validates before it is replaced with a
+# fresh process. lxml does not always hand memory back to the OS, so recycling
+# workers keeps the memory use of long batch runs bounded
+MAX_TASKS_PER_WORKER = 200
+
+# state of a worker process, set by _init_worker
+_WORKER_VALIDATOR = None
+_WORKER_PHASES = None
+_WORKER_STRICT_CONTEXT = False
+_WORKER_AGGREGATE = False
+_WORKER_RESULT_CACHE = None
+_WORKER_REPORT_INVALID = False
+
+# state of a phase worker process, set by _init_phase_worker
+_PHASE_WORKER_SCHEMATRON = None
+_PHASE_WORKER_ENGINE = ENGINE_XSLT
+_PHASE_WORKER_DOCUMENT = None
+
+
+def _init_worker(schematron, phase, strict_context, report_mode=REPORT_LEAN, engine=ENGINE_XSLT, aggregate=False, result_cache=None, report_invalid=False):
+    """
+    Compiles the schematron once per worker process
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param phase: str | list of str | None, see tools.validate_sch._split_phase_selection
+    :param strict_context: bool
+    :param report_mode: str
+    :param engine: str
+    :param aggregate: bool
+    :param result_cache: tools.result_cache.ResultCache | None
+    :param report_invalid: bool, see validate_many
+    """
+    global _WORKER_VALIDATOR, _WORKER_PHASES, _WORKER_STRICT_CONTEXT, _WORKER_AGGREGATE, _WORKER_RESULT_CACHE, _WORKER_REPORT_INVALID
+    compiled_phase, _WORKER_PHASES = _split_phase_selection(phase)
+    _WORKER_STRICT_CONTEXT = strict_context
+    _WORKER_AGGREGATE = aggregate
+    _WORKER_REPORT_INVALID = report_invalid
+    if result_cache is not None:
+        # the schematron is only compiled (by the cache) once a document misses the cache
+        _WORKER_RESULT_CACHE = functools.partial(
+            result_cache.validate, schematron, phase=phase, strict_context=strict_context, engine=engine, aggregate=aggregate,
+        )
+    else:
+        _WORKER_VALIDATOR = get_validator(schematron, phase=compiled_phase, report_mode=report_mode, engine=engine)
+
+
+def _validate_in_worker(task):
+    """
+    Validates a single document in a worker process
+
+    :param task: tuple, (index, document, result_path)
+    :returns: tuple, (index, FailureSet), or (index, FailureGroup[]) when aggregating
+    """
+    index, document, result_path = task
+    try:
+        if _WORKER_RESULT_CACHE is not None:
+            failures = _WORKER_RESULT_CACHE(document)
+        else:
+            failures = _WORKER_VALIDATOR.validate(
+                document,
+                result_path=result_path,
+                strict_context=_WORKER_STRICT_CONTEXT,
+                phases=_WORKER_PHASES,
+                aggregate=_WORKER_AGGREGATE,
+            )
+    except etree.XMLSyntaxError as e:
+        if not _WORKER_REPORT_INVALID:
+            raise
+        failures = [_invalid_document_failure(e)]
+    if not _WORKER_AGGREGATE:
+        # much smaller to send back than a list of Failures
+        failures = FailureSet(failures)
+    return index, failures
+
+
+def _invalid_document_failure(error):
+    """
+    :param error: etree.XMLSyntaxError, raised parsing the document
+    :returns: Failure
+    """
+    return Failure(
+        line=error.lineno,
+        element=None,
+        message=f'Invalid xml: {error}',
+        role='ERROR',
+        location=None,
+        test=None,
+    )
+
+
+def _to_worker_payload(document):
+    """
+    Converts a document into something that can be sent to a worker process.
+    Paths and xml strings or bytes are sent as is, file objects are read and lxml
+    trees are serialized. Note that line numbers of failures in serialized trees
+    refer to the serialized document rather than the file the tree was parsed from.
+
+    :param document: str | bytes | file | etree._ElementTree | etree._Element
+    :returns: str | bytes
+    """
+    if isinstance(document, (str, bytes)):
+        return document
+    if isinstance(document, (etree._ElementTree, etree._Element)):
+        return etree.tostring(document)
+    if hasattr(document, 'read'):
+        return document.read()
+
+    raise Exception(f'Unrecognized type for `document`: {type(document)}. Expected file path, string or bytes of xml, file object, or lxml etree instance')
+
+
+def document_size(document):
+    """
+    Size used to dispatch the largest documents to the workers first
+
+    :param document: str | bytes | file | etree._ElementTree | etree._Element
+    :returns: int, size in bytes of the file at the path, 0 for anything else
+    """
+    try:
+        return os.path.getsize(document)
+    except (OSError, TypeError, ValueError):
+        return 0
+
+
+def _in_input_order(indexed_results):
+    """
+    Reorders (index, result) pairs, which arrive in any order, back into index
+    order, yielding each result as soon as all results before it are available
+
+    :param indexed_results: iterable of (int, any)
+    """
+    pending = []
+    next_index = 0
+    for index, result in indexed_results:
+        heapq.heappush(pending, (index, result))
+        while pending and pending[0][0] == next_index:
+            yield heapq.heappop(pending)
+            next_index += 1
+
+
+def validate_documents(schematron, documents, jobs=1, result_path=None, phase=None, strict_context=False, engine=ENGINE_XSLT, aggregate=False, result_cache=None):
+    """
+    Validates each document against the schematron, in parallel when jobs > 1.
+    Results are yielded in the same order as the documents.
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param documents: list of str, paths to xml files or strings containing document xml
+    :param jobs: int, number of worker processes; 0 uses one per CPU
+    :param result_path: str | None, path to save the svrl result of the last document
+    :param phase: str | list of str | None, id of the phase, or ids of several phases, to run, see tools.validate_sch._split_phase_selection
+    :param strict_context: bool, report rules that were not fired as failures
+    :param engine: str, see tools.validate_sch.get_validator
+    :param aggregate: bool, if True the failures of each document are grouped, see tools.validate_sch.aggregate_failures
+    :param result_cache: tools.result_cache.ResultCache | None, if given failures are returned from (or saved to) the cache
+    :returns: generator of (document, FailureSet), or of (document, FailureGroup[]) if aggregate is True
+    """
+    if result_cache is not None and result_path is not None:
+        raise Exception('Saving the svrl result is not supported with a result cache')
+    documents = list(documents)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(documents))
+
+    # as with validating the documents one after another, the saved svrl result
+    # is the one from the last document
+    tasks = [
+        (i, doc, result_path if i == len(documents) - 1 else None)
+        for i, doc in enumerate(documents)
+    ]
+
+    # the full svrl report is only needed when it's saved
+    report_mode = REPORT_LEAN if result_path is None else REPORT_FULL
+
+    if jobs <= 1:
+        if result_cache is not None:
+            for _, document, _ in tasks:
+                failures = result_cache.validate(schematron, document, phase=phase, strict_context=strict_context, engine=engine, aggregate=aggregate)
+                yield document, failures if aggregate else FailureSet(failures)
+            return
+
+        compiled_phase, phases = _split_phase_selection(phase)
+        validator = get_validator(schematron, phase=compiled_phase, report_mode=report_mode, engine=engine)
+        for _, document, task_result_path in tasks:
+            failures = validator.validate(document, result_path=task_result_path, strict_context=strict_context, phases=phases, aggregate=aggregate)
+            yield document, failures if aggregate else FailureSet(failures)
+        return
+
+    # dispatch the largest documents first so a big file picked up late does
+    # not leave the other workers idle at the end of the run
+    tasks.sort(key=lambda task: document_size(task[1]), reverse=True)
+    tasks = [(i, _to_worker_payload(doc), task_result_path) for i, doc, task_result_path in tasks]
+
+    with multiprocessing.Pool(
+        processes=jobs,
+        initializer=_init_worker,
+        initargs=(schematron, phase, strict_context, report_mode, engine, aggregate, result_cache),
+        maxtasksperchild=MAX_TASKS_PER_WORKER,
+    ) as pool:
+        results = pool.imap_unordered(_validate_in_worker, tasks)
+        for index, failures in _in_input_order(results):
+            yield documents[index], failures
+
+
+def validate_many(schematron, documents, phase=None, strict_context=False, jobs=1, engine=ENGINE_XSLT, result_cache=None, report_invalid=False):
+    """
+    Validates each document against the schematron, yielding the results as soon
+    as each document is finished. The schematron is compiled once (per worker
+    process when jobs > 1) and documents are consumed lazily from the iterable,
+    with only a few documents in flight at a time, so arbitrarily large corpora
+    can be validated with constant memory.
+
+    When jobs > 1 results are yielded in completion order rather than input order.
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param documents: iterable of str | bytes | file | etree._ElementTree | etree._Element
+    :param phase: str | list of str | None, id of the phase, or ids of several phases, to run, see tools.validate_sch._split_phase_selection
+    :param strict_context: bool, report rules that were not fired as failures
+    :param jobs: int, number of worker processes; 0 uses one per CPU
+    :param engine: str, see tools.validate_sch.get_validator
+    :param result_cache: tools.result_cache.ResultCache | None, if given failures are returned from (or saved to) the cache
+    :param report_invalid: bool, if True a document which is not well-formed xml is reported as a single ERROR failure rather than raising
+    :returns: generator of (document, FailureSet), where document is the object given in documents
+    """
+    documents = iter(documents)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        if result_cache is not None:
+            validate = functools.partial(result_cache.validate, schematron, phase=phase, strict_context=strict_context, engine=engine)
+        else:
+            compiled_phase, phases = _split_phase_selection(phase)
+            validator = get_validator(schematron, phase=compiled_phase, engine=engine)
+            validate = functools.partial(validator.validate, strict_context=strict_context, phases=phases)
+        for document in documents:
+            try:
+                failures = validate(document)
+            except etree.XMLSyntaxError as e:
+                if not report_invalid:
+                    raise
+                failures = [_invalid_document_failure(e)]
+            yield document, FailureSet(failures)
+        return
+
+    # keep each worker busy with one queued document, without reading ahead further
+    max_in_flight = jobs * 2
+    completed = queue.Queue()
+    in_flight = {}
+    indexes = itertools.count()
+
+    with multiprocessing.Pool(
+        processes=jobs,
+        initializer=_init_worker,
+        initargs=(schematron, phase, strict_context, REPORT_LEAN, engine, False, result_cache, report_invalid),
+        maxtasksperchild=MAX_TASKS_PER_WORKER,
+    ) as pool:
+        def submit(count):
+            for document in itertools.islice(documents, count):
+                index = next(indexes)
+                in_flight[index] = document
+                pool.apply_async(
+                    _validate_in_worker,
+                    ((index, _to_worker_payload(document), None),),
+                    callback=completed.put,
+                    error_callback=completed.put,
+                )
+
+        submit(max_in_flight)
+        while in_flight:
+            result = completed.get()
+            if isinstance(result, BaseException):
+                raise result
+            index, failures = result
+            document = in_flight.pop(index)
+            submit(1)
+            yield document, failures
+
+
+def _document_bytes(document):
+    """
+    :param document: str | bytes | file | etree._ElementTree | etree._Element
+    :returns: bytes, the serialized document
+    """
+    if isinstance(document, str) and os.path.isfile(document):
+        with open(document, 'rb') as f:
+            return f.read()
+    payload = _to_worker_payload(document)
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    return payload
+
+
+def _init_phase_worker(schematron, engine, shared_name, size):
+    """
+    Parses the document, shared by the parent process, once per worker process
+
+    :param schematron: str
+    :param engine: str
+    :param shared_name: str, name of the shared memory block holding the document
+    :param size: int, size of the document in bytes
+    """
+    global _PHASE_WORKER_SCHEMATRON, _PHASE_WORKER_ENGINE, _PHASE_WORKER_DOCUMENT
+    _PHASE_WORKER_SCHEMATRON = schematron
+    _PHASE_WORKER_ENGINE = engine
+    shared = shared_memory.SharedMemory(name=shared_name)
+    try:
+        _PHASE_WORKER_DOCUMENT = etree.ElementTree(etree.fromstring(bytes(shared.buf[:size])))
+    finally:
+        shared.close()
+
+
+def _validate_phase_in_worker(phase):
+    """
+    Validates the shared document with a single phase in a worker process
+
+    :param phase: str
+    :returns: tuple, (phase, Failure[], fired rule contexts)
+    """
+    # only the patterns of the phase are compiled, see tools.compile_sch.prune_schematron
+    validator = get_validator(_PHASE_WORKER_SCHEMATRON, phase=phase, engine=_PHASE_WORKER_ENGINE)
+    failures, fired_rules = validator._validate_with_fired_rules(_PHASE_WORKER_DOCUMENT)
+    return phase, failures, fired_rules
+
+
+def _phases_in_pattern_order(schematron_tree):
+    """
+    Returns the phases of the schematron such that running them one after another
+    runs every pattern exactly once and in the same order as running all patterns
+    at once, which is the case for all generated schematron
+
+    :param schematron_tree: etree._ElementTree, the included and expanded schematron
+    :returns: list of str | None, phase ids, None if the schematron can not be split by phase
+    """
+    pattern_positions = {
+        pattern.get('id'): i
+        for i, pattern in enumerate(schematron_tree.xpath('/sch:schema/sch:pattern', namespaces=SCH_NSMAP))
+    }
+    phases = []
+    for phase in schematron_tree.xpath('/sch:schema/sch:phase', namespaces=SCH_NSMAP):
+        positions = sorted(
+            pattern_positions[pattern_id]
+            for pattern_id in phase.xpath('sch:active/@pattern', namespaces=SCH_NSMAP)
+            if pattern_id in pattern_positions
+        )
+        if positions:
+            phases.append((positions, phase.get('id')))
+    phases.sort()
+
+    positions = [position for phase_positions, _ in phases for position in phase_positions]
+    if len(phases) < 2 or positions != list(range(len(pattern_positions))):
+        return None
+    return [phase_id for _, phase_id in phases]
+
+
+def validate_phases_parallel(schematron, document, jobs=0, strict_context=False, engine=ENGINE_XSLT):
+    """
+    Validates a single document with the phases of the schematron split across
+    worker processes, for large documents where one pass over all phases takes
+    too long. The document is handed to the workers once through shared memory
+    and parsed once per worker; each worker validates it with its own compiled
+    phases. The result is the same as validating with all phases at once: the
+    failures are merged in pattern order and unfired rules (with strict_context)
+    are found from the rules fired by all phases together.
+
+    Schematron whose phases do not run every pattern exactly once, in pattern
+    order, are validated in a single pass.
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param document: str | bytes | file | etree._ElementTree | etree._Element, see tools.validate_sch.Validator.validate
+    :param jobs: int, number of worker processes; 0 uses one per CPU
+    :param strict_context: bool, report rules that were not fired as failures
+    :param engine: str, see tools.validate_sch.get_validator
+    :returns: Failure[]
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    # the phases are ordered from the expanded schematron, the schematron is only
+    # compiled by the workers (or below when it is validated in a single pass)
+    schematron_tree = expand_schematron(_load_schematron(schematron))
+    phases = _phases_in_pattern_order(schematron_tree)
+    if jobs <= 1 or phases is None:
+        return get_validator(schematron, engine=engine).validate(document, strict_context=strict_context)
+
+    content = _document_bytes(document)
+    # the line numbers of failures should refer to the document as given, so a
+    # document that does not parse is reported here rather than in every worker
+    _parse_document(content)
+
+    shared = shared_memory.SharedMemory(create=True, size=len(content))
+    try:
+        shared.buf[:len(content)] = content
+        results = {}
+        with multiprocessing.Pool(
+            processes=min(jobs, len(phases)),
+            initializer=_init_phase_worker,
+            initargs=(schematron, engine, shared.name, len(content)),
+        ) as pool:
+            for phase, failures, fired_rules in pool.imap_unordered(_validate_phase_in_worker, phases):
+                results[phase] = (failures, fired_rules)
+    finally:
+        shared.close()
+        shared.unlink()
+
+    failures = []
+    fired_rules = []
+    for phase in phases:
+        failures += results[phase][0]
+        fired_rules += results[phase][1]
+
+    if strict_context:
+        rules = expected_rules(build_catalog(schematron_tree), None)
+        failures = [_unfired_rule_failure(rule) for rule in _find_unfired_rules(rules, fired_rules)] + failures
+
+    return failures
@@ -0,0 +1,227 @@
+import contextlib
+import io
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+from lxml import etree
+
+from .clean_xml import clean_files
+from .compile_sch import compile_schematron
+from .generate_sch import generate_sch
+from .synthetic import generate_document, COLLECTIONS
+from .validate_sch import Validator, _parse_schematron
+
+BENCHMARK_FORMAT_VERSION = 1
+SCHEMATRON_VERSIONS = ('v2.0.0', 'v2.2.0')
+DEFAULT_SCALES = (1, 4, 16)
+DEFAULT_REPEAT = 3
+# relative slowdown above which a benchmark is reported as a regression
+DEFAULT_THRESHOLD = 0.2
+# absolute slowdown, in seconds, below which differences are treated as noise
+DEFAULT_MIN_DELTA = 0.005
+
+# document used for schematron without an exemplary file of the same level
+_DEFAULT_DOCUMENT = os.path.join('v2.2.0', 'exemplary_files', 'L200_Audit.xml')
+
+
+def _time(func, repeat):
+    """
+    :returns: (dict, any), {'min', 'median'} of the times in seconds, and the result of the last call
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times)}, result
+
+
+def _source_document(base_dir, schematron_path):
+    """
+    Returns the exemplary file with the same name as the schematron (without its
+    version prefix), e.g. v2-2-0_L100_Audit.sch -> L100_Audit.xml, or the default
+    document if there is none
+    """
+    level = os.path.splitext(os.path.basename(schematron_path))[0].split('_', 1)[-1]
+    exemplary_dir = os.path.join(os.path.dirname(schematron_path), 'exemplary_files')
+    if os.path.isdir(exemplary_dir):
+        for name in sorted(os.listdir(exemplary_dir)):
+            if name.startswith(level) and name.endswith('.xml'):
+                return os.path.join(exemplary_dir, name)
+    return os.path.join(base_dir, _DEFAULT_DOCUMENT)
+
+
+def _find_schematron(base_dir):
+    paths = []
+    for version in SCHEMATRON_VERSIONS:
+        version_dir = os.path.join(base_dir, version)
+        for name in sorted(os.listdir(version_dir)):
+            if name.endswith('.sch'):
+                paths.append(os.path.join(version_dir, name))
+    return paths
+
+
+def benchmark_schematron(schematron_path, source_document, scales=DEFAULT_SCALES, repeat=DEFAULT_REPEAT):
+    """
+    Times compiling the schematron, then running it (the xslt transform) and
+    extracting the failures from its report for the source document scaled by
+    each of the scales (see tools.synthetic).
+
+    :param schematron_path: str
+    :param source_document: str, path to the document to scale
+    :param scales: iterable of float, factor applied to every collection of the document
+    :param repeat: int, number of times each measurement is taken
+    :returns: dict, {benchmark name: {'min', 'median'}}
+    """
+    results = {}
+    schematron_tree = _parse_schematron(schematron_path)
+    results['compile'], _ = _time(
+        lambda: etree.XSLT(compile_schematron(schematron_tree, use_cache=False)),
+        repeat
+    )
+
+    validator = Validator(schematron_path)
+    for scale in scales:
+        document = generate_document(source_document, {collection: scale for collection in COLLECTIONS})
+        validate_times, report = _time(lambda: validator._run(document, strict_context=False), repeat)
+        # failures are located lazily, so they are converted to tuples to include finding their elements
+        extract_times, failures = _time(lambda: [tuple(f) for f in validator._get_failures(document, report, strict_context=False)], repeat)
+        results[f'validate/x{scale:g}'] = dict(validate_times, bytes=len(etree.tostring(document)))
+        results[f'extract/x{scale:g}'] = dict(extract_times, failures=len(failures))
+
+    return results
+
+
+def benchmark_generate_sch(base_dir, repeat=DEFAULT_REPEAT):
+    """
+    Times generating the schematron for every csv under base_dir (without writing them)
+    """
+    csv_files = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(base_dir)
+        for name in files if name.endswith('.csv')
+    )
+
+    def generate_all():
+        for csv_file in csv_files:
+            generate_sch(csv_file, dry_run=True)
+
+    times, _ = _time(generate_all, repeat)
+    return times
+
+
+def benchmark_clean_files(base_dir, repeat=DEFAULT_REPEAT):
+    """
+    Times cleaning every xml and sch file under base_dir. The files are cleaned in
+    a temporary copy of the directory as clean_files rewrites them.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        copy_dir = os.path.join(tmp_dir, 'schematron')
+        shutil.copytree(base_dir, copy_dir)
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(copy_dir)
+            for name in names if name.endswith(('.xml', '.sch'))
+        )
+
+        def clean_all():
+            with contextlib.redirect_stdout(io.StringIO()):
+                for file_name in files:
+                    clean_files(file_name)
+
+        times, _ = _time(clean_all, repeat)
+    return times
+
+
+def run_benchmarks(base_dir, scales=DEFAULT_SCALES, repeat=DEFAULT_REPEAT, progress=None):
+    """
+    Runs all benchmarks
+
+    :param base_dir: str, the schematron directory of the repository
+    :param scales: iterable of float, document scales to validate, see benchmark_schematron
+    :param repeat: int, number of times each measurement is taken
+    :param progress: callable | None, called with the name of each benchmark before it runs
+    :returns: dict, json serializable results
+    """
+    benchmarks = {}
+    errors = {}
+    for schematron_path in _find_schematron(base_dir):
+        name = os.path.relpath(schematron_path, base_dir).replace(os.sep, '/')
+        if progress is not None:
+            progress(name)
+        try:
+            results = benchmark_schematron(schematron_path, _source_document(base_dir, schematron_path), scales, repeat)
+        except Exception as e:
+            errors[name] = str(e)
+            continue
+        for benchmark, result in results.items():
+            benchmarks[f'{name}/{benchmark}'] = result
+
+    if progress is not None:
+        progress('generate_sch')
+    benchmarks['generate_sch'] = benchmark_generate_sch(base_dir, repeat)
+    if progress is not None:
+        progress('clean_files')
+    benchmarks['clean_files'] = benchmark_clean_files(base_dir, repeat)
+
+    return {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'environment': {
+            'python': platform.python_version(),
+            'lxml': '.'.join(str(v) for v in etree.LXML_VERSION),
+            'libxslt': '.'.join(str(v) for v in etree.LIBXSLT_VERSION),
+            'machine': platform.machine(),
+        },
+        'scales': list(scales),
+        'repeat': repeat,
+        'benchmarks': benchmarks,
+        'errors': errors,
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD, min_delta=DEFAULT_MIN_DELTA):
+    """
+    Compares the minimum times of benchmarks found in both results
+
+    :param baseline: dict, from run_benchmarks
+    :param current: dict, from run_benchmarks
+    :param threshold: float, relative slowdown above which a benchmark regressed
+    :param min_delta: float, seconds, slowdowns smaller than this are never regressions
+    :returns: list of dict, {'name', 'baseline', 'current', 'ratio', 'regression'} for each benchmark
+    """
+    if baseline.get('version') != current.get('version'):
+        raise Exception(f'Baseline format version {baseline.get("version")} does not match {current.get("version")}, record a new baseline')
+
+    comparison = []
+    for name, result in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        old = baseline['benchmarks'][name]['min']
+        new = result['min']
+        ratio = new / old if old > 0 else float('inf')
+        comparison.append({
+            'name': name,
+            'baseline': old,
+            'current': new,
+            'ratio': ratio,
+            'regression': new - old > min_delta and ratio > 1 + threshold,
+        })
+    return comparison
+
+
+def format_comparison(comparison):
+    """
+    :param comparison: list of dict, from compare_results
+    :returns: str
+    """
+    name_width = max([len(c['name']) for c in comparison] + [len('benchmark')])
+    lines = [f'{"benchmark".ljust(name_width)}  baseline (s)  current (s)   ratio']
+    for c in comparison:
+        flag = '  REGRESSION' if c['regression'] else ''
+        lines.append(f'{c["name"].ljust(name_width)}  {c["baseline"]:>12.4f}  {c["current"]:>11.4f}  {c["ratio"]:>6.2f}{flag}')
+    return '\n'.join(lines)
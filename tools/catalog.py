@@ -0,0 +1,110 @@
+"""
+Rule catalogs: a compact json summary of a schematron, listing its phases with
+the patterns they activate, and every pattern with its rules (context, and the
+test and role of each assert). generate_sch writes one next to every schematron
+it generates, and the validator loads it rather than querying the schematron
+tree for phase lookups and the rules expected to fire in strict mode.
+
+A catalog records the sha256 of the schematron file it was built from, and is
+ignored once the schematron no longer matches.
+"""
+import hashlib
+import json
+import os
+
+from .constants import SCH_NS, SCH_NSMAP
+
+# bump this whenever the content of catalogs changes
+CATALOG_FORMAT_VERSION = 1
+
+
+def catalog_path(schematron_path):
+    """
+    :param schematron_path: str, path to the sch file
+    :returns: str, path to its catalog
+    """
+    return f'{os.path.splitext(schematron_path)[0]}.catalog.json'
+
+
+def build_catalog(schematron_tree, schematron_bytes=None):
+    """
+    :param schematron_tree: etree._ElementTree, the included and expanded schematron (schematron generated from csv have nothing to include or expand)
+    :param schematron_bytes: bytes | None, content of the sch file, for recognizing a stale catalog
+    :returns: dict
+    """
+    schema = schematron_tree.getroot()
+    phases = {
+        phase.get('id'): [str(pattern_id) for pattern_id in phase.xpath('sch:active/@pattern', namespaces=SCH_NSMAP)]
+        for phase in schema.iter(f'{{{SCH_NS}}}phase')
+    }
+    patterns = []
+    for pattern in schema.iter(f'{{{SCH_NS}}}pattern'):
+        if pattern.get('abstract') == 'true':
+            continue
+        rules = []
+        for rule in pattern.iterchildren(f'{{{SCH_NS}}}rule'):
+            rules.append({
+                'context': rule.get('context'),
+                'asserts': [
+                    {'test': assert_.get('test'), 'role': assert_.get('role')}
+                    for assert_ in rule.iterchildren(f'{{{SCH_NS}}}assert')
+                ],
+            })
+        patterns.append({'id': pattern.get('id'), 'rules': rules})
+
+    return {
+        'version': CATALOG_FORMAT_VERSION,
+        'schematron_sha256': None if schematron_bytes is None else hashlib.sha256(schematron_bytes).hexdigest(),
+        'phases': phases,
+        'patterns': patterns,
+    }
+
+
+def catalog_to_bytes(catalog):
+    """
+    :param catalog: dict, from build_catalog
+    :returns: bytes
+    """
+    return json.dumps(catalog, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def load_catalog(schematron_path):
+    """
+    Loads the catalog of the schematron file if it has one which is up to date
+
+    :param schematron_path: str, path to the sch file
+    :returns: dict | None
+    """
+    try:
+        with open(catalog_path(schematron_path), 'rb') as f:
+            catalog = json.loads(f.read())
+        with open(schematron_path, 'rb') as f:
+            schematron_sha256 = hashlib.sha256(f.read()).hexdigest()
+    except (OSError, ValueError):
+        return None
+
+    if catalog.get('version') != CATALOG_FORMAT_VERSION or catalog.get('schematron_sha256') != schematron_sha256:
+        return None
+    return catalog
+
+
+def expected_rules(catalog, phases):
+    """
+    Returns the contexts of the rules run for the phases, in schematron order
+
+    :param catalog: dict
+    :param phases: str | list of str | None, id of the phase run, or of each phase run, all patterns if None
+    :returns: list of str
+    """
+    if phases is None:
+        patterns = catalog['patterns']
+    else:
+        patterns_by_id = {pattern['id']: pattern for pattern in catalog['patterns']}
+        phases = [phases] if isinstance(phases, str) else phases
+        patterns = [
+            patterns_by_id[pattern_id]
+            for phase in phases
+            for pattern_id in catalog['phases'].get(phase, [])
+            if pattern_id in patterns_by_id
+        ]
+    return [rule['context'] for pattern in patterns for rule in pattern['rules']]
@@ -0,0 +1,380 @@
+import copy
+import hashlib
+import os
+import tempfile
+from urllib.parse import urljoin, urlparse, unquote
+
+from lxml import etree, isoschematron
+
+from .constants import SCH_NS, SCH_NSMAP, SVRL_NS, XSL_NS, XSL_NSMAP
+
+# environment variable which overrides the directory used for caching compiled
+# schematron. Setting it to an empty string disables the on-disk cache
+CACHE_DIR_ENV = 'BSYNC_SCH_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bsync_testsuite', 'compiled_sch')
+
+# bump this whenever the compile pipeline changes in a way that affects the output
+CACHE_FORMAT_VERSION = '4'
+
+# report modes of the compiled xslt
+# full: the standard svrl report, with an active-pattern element for every pattern
+#   and a fired-rule element for every matched rule context
+# lean: only failed-assert elements, plus fired-rule elements when the xslt is run
+#   with the FIRED_RULES_PARAM set to true()
+REPORT_FULL = 'full'
+REPORT_LEAN = 'lean'
+FIRED_RULES_PARAM = 'bsync_fired_rules'
+
+# parameter of the compiled xslt selecting the patterns to run, see make_selectable
+PATTERNS_PARAM = 'bsync_patterns'
+ALL_PATTERNS = '#ALL'
+
+
+def get_cache_dir():
+    """
+    Returns the directory for the on-disk cache of compiled schematron
+
+    :returns: str | None, None if the on-disk cache is disabled
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir is None:
+        return DEFAULT_CACHE_DIR
+    if cache_dir == '':
+        return None
+    return cache_dir
+
+
+def _href_to_path(href, base):
+    """
+    Resolves an include href to a local file path
+
+    :param href: str, href attribute of the include, possibly with a fragment
+    :param base: str | None, base url of the including element
+    :returns: str | None, None if the href does not refer to a local file
+    """
+    href = href.split('#', 1)[0]
+    if not href:
+        return None
+    url = urljoin(base, href) if base else href
+    parsed = urlparse(url)
+    if parsed.scheme in ('', 'file'):
+        return unquote(parsed.path)
+    # windows drive letters are parsed as a scheme
+    if len(parsed.scheme) == 1:
+        return url
+    return None
+
+
+def _hash_includes(schematron_tree, hasher, visited):
+    """
+    Adds the content of all files included (recursively) by the schematron to the hasher
+
+    :param schematron_tree: etree._ElementTree
+    :param hasher: hashlib hash object
+    :param visited: set, absolute paths already hashed
+    """
+    includes = schematron_tree.xpath('//sch:include/@href | //sch:extends/@href', namespaces=SCH_NSMAP)
+    for href in includes:
+        path = _href_to_path(href, href.getparent().base)
+        hasher.update(href.encode('utf-8'))
+        if path is None or not os.path.isfile(path):
+            continue
+        path = os.path.abspath(path)
+        if path in visited:
+            continue
+        visited.add(path)
+        with open(path, 'rb') as f:
+            content = f.read()
+        hasher.update(content)
+        _hash_includes(etree.parse(path), hasher, visited)
+
+
+def schematron_hash(schematron_tree, phase=None, report_mode=REPORT_FULL):
+    """
+    Returns a hash identifying the compiled form of the schematron. It covers the
+    schematron itself, every file it includes, the phase, the report mode and the
+    lxml, libxml2 and libxslt versions used for compiling.
+
+    :param schematron_tree: etree._ElementTree, the schematron (before include expansion)
+    :param phase: str | None
+    :param report_mode: str, REPORT_FULL or REPORT_LEAN
+    :returns: str
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f'{CACHE_FORMAT_VERSION}|{etree.LXML_VERSION}|{etree.LIBXML_VERSION}|{etree.LIBXSLT_VERSION}|{phase}|{report_mode}|'.encode('utf-8'))
+    hasher.update(etree.tostring(schematron_tree))
+    _hash_includes(schematron_tree, hasher, set())
+    return hasher.hexdigest()
+
+
+def _cache_paths(cache_dir, key):
+    return os.path.join(cache_dir, f'{key}.sch'), os.path.join(cache_dir, f'{key}.xsl')
+
+
+def _write_atomic(path, tree):
+    """
+    Writes the tree to path such that concurrent readers never see a partial file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            tree.write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_compiled(key, cache_dir=None):
+    """
+    Loads a compiled schematron from the on-disk cache
+
+    :param key: str, hash from schematron_hash
+    :param cache_dir: str | None, defaults to get_cache_dir()
+    :returns: etree._ElementTree | None, the validation xslt, or None if not cached
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if cache_dir is None:
+        return None
+    _, xsl_path = _cache_paths(cache_dir, key)
+    try:
+        return etree.parse(xsl_path)
+    except (OSError, etree.XMLSyntaxError):
+        return None
+
+
+def store_compiled(key, expanded_schematron, validator_xslt, cache_dir=None):
+    """
+    Stores a compiled schematron in the on-disk cache. Failing to write the cache
+    is not an error, the schematron will just be compiled again next time.
+
+    :param key: str, hash from schematron_hash
+    :param expanded_schematron: etree._ElementTree, the included and expanded schematron
+    :param validator_xslt: etree._ElementTree, the validation xslt
+    :param cache_dir: str | None, defaults to get_cache_dir()
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if cache_dir is None:
+        return
+    sch_path, xsl_path = _cache_paths(cache_dir, key)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write the xslt last, its presence marks the entry as complete
+        _write_atomic(sch_path, expanded_schematron)
+        _write_atomic(xsl_path, validator_xslt)
+    except OSError:
+        pass
+
+
+def _remove_preserving_tail(element):
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+    parent.remove(element)
+
+
+def make_lean(validator_xslt):
+    """
+    Modifies the validation xslt so its report only contains failed asserts. In
+    the standard svrl output every pattern adds an active-pattern element (which
+    also walks the whole document once more) and every matched rule context adds
+    a fired-rule element, so for mostly valid documents nearly all of the report
+    is never looked at. Fired rules, needed for strict context checks, can still
+    be requested at validation time with the FIRED_RULES_PARAM parameter.
+
+    :param validator_xslt: etree._ElementTree, xslt generated by the iso schematron skeleton
+    :returns: etree._ElementTree, the same tree, modified
+    """
+    stylesheet = validator_xslt.getroot()
+    for root_template in stylesheet.xpath('xsl:template[@match = "/" and not(@mode)]', namespaces=XSL_NSMAP):
+        for element in list(root_template.iter(
+                f'{{{SVRL_NS}}}active-pattern',
+                f'{{{SVRL_NS}}}ns-prefix-in-attribute-values',
+                f'{{{XSL_NS}}}comment')):
+            _remove_preserving_tail(element)
+
+    for fired_rule in list(stylesheet.iter(f'{{{SVRL_NS}}}fired-rule')):
+        emit_if = etree.Element(f'{{{XSL_NS}}}if', test=f'${FIRED_RULES_PARAM}')
+        emit_if.tail = fired_rule.tail
+        fired_rule.tail = None
+        fired_rule.addprevious(emit_if)
+        emit_if.append(fired_rule)
+
+    fired_rules_param = etree.Element(f'{{{XSL_NS}}}param', name=FIRED_RULES_PARAM, select='false()')
+    stylesheet.insert(0, fired_rules_param)
+
+    return validator_xslt
+
+
+def _pattern_modes(schematron_tree):
+    """
+    Returns the xslt mode of each pattern. The iso schematron skeleton names the
+    mode of a pattern after its position in the (expanded) schema.
+
+    :param schematron_tree: etree._ElementTree, the included and expanded schematron
+    :returns: dict, {mode: pattern element}
+    """
+    return {
+        f'M{len(pattern.xpath("preceding-sibling::*"))}': pattern
+        for pattern in schematron_tree.xpath('/sch:schema/sch:pattern', namespaces=SCH_NSMAP)
+    }
+
+
+def make_selectable(validator_xslt, expanded_schematron):
+    """
+    Modifies the validation xslt so the patterns it runs can be chosen when it is
+    run rather than when it is compiled. Every pattern is only run if its id is in
+    the PATTERNS_PARAM parameter, a space separated list of ids with a leading and
+    trailing space (e.g. " pattern_a pattern_b "), or if the parameter is
+    ALL_PATTERNS, its default.
+
+    :param validator_xslt: etree._ElementTree, xslt generated by the iso schematron skeleton
+    :param expanded_schematron: etree._ElementTree, the included and expanded schematron it was generated from
+    :returns: etree._ElementTree, the same tree, modified
+    """
+    stylesheet = validator_xslt.getroot()
+    patterns = _pattern_modes(expanded_schematron)
+    for root_template in stylesheet.xpath('xsl:template[@match = "/" and not(@mode)]', namespaces=XSL_NSMAP):
+        for apply_templates in list(root_template.iter(f'{{{XSL_NS}}}apply-templates')):
+            pattern = patterns.get(apply_templates.get('mode'))
+            if pattern is None:
+                continue
+            test = f"${PATTERNS_PARAM} = '{ALL_PATTERNS}'"
+            if pattern.get('id'):
+                test += f" or contains(${PATTERNS_PARAM}, ' {pattern.get('id')} ')"
+            run_if = etree.Element(f'{{{XSL_NS}}}if', test=test)
+            apply_templates.addprevious(run_if)
+            # the full report has an active-pattern element right before the pattern is run
+            previous = run_if.getprevious()
+            if previous is not None and previous.tag == f'{{{SVRL_NS}}}active-pattern':
+                run_if.append(previous)
+            run_if.append(apply_templates)
+
+    patterns_param = etree.Element(f'{{{XSL_NS}}}param', name=PATTERNS_PARAM, select=f"'{ALL_PATTERNS}'")
+    stylesheet.insert(0, patterns_param)
+
+    return validator_xslt
+
+
+def prune_schematron(schematron_tree, phase):
+    """
+    Returns a copy of the schematron reduced to what the phase needs: the phase
+    itself, the patterns it activates, the abstract patterns those are instances
+    of and the includes of any of them. Everything else at the top level of the
+    schema (namespaces, lets, keys, includes of whole files) is kept. Pruning
+    before includes are expanded keeps a single phase of a large schematron
+    cheap to compile.
+
+    :param schematron_tree: etree._ElementTree, the schematron (before include expansion)
+    :param phase: str, id of the phase
+    :returns: etree._ElementTree, a new tree with the same base url
+    """
+    pruned = copy.deepcopy(schematron_tree)
+    schema = pruned.getroot()
+    phase_elem = schema.find(f'{{{SCH_NS}}}phase[@id="{phase}"]')
+    if phase_elem is None:
+        raise Exception(f'Found no phase with provided id of "{phase}"')
+
+    patterns = {pattern.get('id'): pattern for pattern in schema.iterchildren(f'{{{SCH_NS}}}pattern')}
+    needed = set()
+    pending = [str(pattern_id) for pattern_id in phase_elem.xpath('sch:active/@pattern', namespaces=SCH_NSMAP)]
+    while pending:
+        pattern_id = pending.pop()
+        if pattern_id in needed:
+            continue
+        needed.add(pattern_id)
+        pattern = patterns.get(pattern_id)
+        if pattern is not None and pattern.get('is-a'):
+            pending.append(pattern.get('is-a'))
+
+    for child in list(schema):
+        if child.tag == f'{{{SCH_NS}}}phase':
+            remove = child is not phase_elem
+        elif child.tag == f'{{{SCH_NS}}}pattern':
+            remove = child.get('id') not in needed
+        elif child.tag == f'{{{SCH_NS}}}include':
+            # includes of a single element are referenced by its id after the #
+            _, _, fragment = child.get('href', '').partition('#')
+            remove = fragment != '' and fragment not in needed
+        else:
+            remove = False
+        if remove:
+            schema.remove(child)
+
+    return pruned
+
+
+def _include_and_expand(schematron_tree):
+    expanded = isoschematron.iso_dsdl_include(schematron_tree)
+    return isoschematron.iso_abstract_expand(expanded)
+
+
+def expand_schematron(schematron_tree, phase=None, report_mode=REPORT_FULL, use_cache=True):
+    """
+    Returns the schematron with includes and abstract patterns expanded, loading
+    it from the on-disk cache when the schematron has already been compiled.
+
+    :param schematron_tree: etree._ElementTree, the schematron to expand
+    :param phase: str | None, phase the schematron was compiled for, the schematron is pruned to the phase (see prune_schematron)
+    :param report_mode: str, report mode the schematron was compiled for
+    :param use_cache: bool, if False the on-disk cache is not read
+    :returns: etree._ElementTree
+    """
+    cache_dir = get_cache_dir()
+    if use_cache and cache_dir is not None:
+        sch_path, _ = _cache_paths(cache_dir, schematron_hash(schematron_tree, phase, report_mode))
+        try:
+            return etree.parse(sch_path)
+        except (OSError, etree.XMLSyntaxError):
+            pass
+
+    if phase is not None:
+        schematron_tree = prune_schematron(schematron_tree, phase)
+    return _include_and_expand(schematron_tree)
+
+
+def compile_schematron(schematron_tree, phase=None, report_mode=REPORT_FULL, use_cache=True):
+    """
+    Runs the ISO Schematron pipeline (include, abstract pattern expansion and
+    compilation to XSLT), using the on-disk cache when possible. The expanded
+    schematron is also saved in the cache, see expand_schematron. The patterns
+    run can be narrowed further when the xslt is run, see make_selectable.
+
+    :param schematron_tree: etree._ElementTree, the schematron to compile
+    :param phase: str | None, id of the phase to compile, all phases if None. Only the patterns of the phase are compiled, see prune_schematron
+    :param report_mode: str, REPORT_FULL or REPORT_LEAN, see make_lean
+    :param use_cache: bool, if False the on-disk cache is neither read nor written
+    :returns: etree._ElementTree, the validation xslt
+    """
+    key = None
+    if use_cache and get_cache_dir() is not None:
+        key = schematron_hash(schematron_tree, phase, report_mode)
+        cached = load_compiled(key)
+        if cached is not None:
+            return cached
+
+    if phase is not None:
+        schematron_tree = prune_schematron(schematron_tree, phase)
+    expanded = _include_and_expand(schematron_tree)
+    if isoschematron.schematron_schema_valid_supported and not isoschematron.schematron_schema_valid(expanded):
+        raise etree.SchematronParseError(
+            f'invalid schematron schema: {isoschematron.schematron_schema_valid.error_log}')
+
+    compile_params = {}
+    if phase is not None:
+        compile_params['phase'] = etree.XSLT.strparam(phase)
+    validator_xslt = isoschematron.iso_svrl_for_xslt1(expanded, **compile_params)
+    validator_xslt = make_selectable(validator_xslt, expanded)
+    if report_mode == REPORT_LEAN:
+        validator_xslt = make_lean(validator_xslt)
+    elif report_mode != REPORT_FULL:
+        raise Exception(f'Unknown report mode "{report_mode}", expected "{REPORT_FULL}" or "{REPORT_LEAN}"')
+
+    if key is not None:
+        store_compiled(key, expanded, validator_xslt)
+
+    return validator_xslt
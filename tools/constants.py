@@ -7,3 +7,6 @@ SCH_NSMAP = {'sch': SCH_NS}
 
 SVRL_NS = 'http://purl.oclc.org/dsdl/svrl'
 SVRL_NSMAP = {'svrl': SVRL_NS}
+
+XSL_NS = 'http://www.w3.org/1999/XSL/Transform'
+XSL_NSMAP = {'xsl': XSL_NS}
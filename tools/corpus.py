@@ -0,0 +1,274 @@
+"""
+Validation of a corpus of documents: finding the documents (globs and
+directories walked recursively) and a manifest of results, so validating the
+same corpus again only validates documents which are new or changed.
+
+The manifest is a json lines file. The first line records the settings the
+results are for (the schematron and the files it includes, the phase, strict
+context and the engine); a manifest for other settings is started over. Every
+other line is the result of a document,
+{"path", "size", "mtime_ns", "sha256", "failures"}, appended (and flushed) as
+soon as the document is validated, in whatever order the workers finish them,
+so an interrupted run picks up where it stopped. Later lines replace earlier
+ones for the same path, and the manifest is rewritten without them at the end
+of a run.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+from .batch import validate_many, document_size
+from .failure_set import FailureSet
+from .result_cache import schematron_key
+from .validate_sch import Failure, ENGINE_XSLT
+
+# bump this whenever the content of manifests changes
+MANIFEST_FORMAT_VERSION = 1
+
+# extension of the documents found in directories
+DOCUMENT_EXTENSION = '.xml'
+
+
+def find_documents(paths, recursive=False):
+    """
+    Expands glob patterns (with ** matching any number of directories) and, if
+    recursive, directories into the xml documents under them
+
+    :param paths: list of str, document paths, glob patterns or directories
+    :param recursive: bool, if True directories are walked for documents
+    :returns: list of str, without duplicates, in the order given (each pattern and directory sorted)
+    """
+    documents = []
+    for path in paths:
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                raise Exception(f'Found no documents matching "{path}"')
+        else:
+            matches = [path]
+
+        for match in matches:
+            if not os.path.isdir(match):
+                documents.append(match)
+                continue
+            if not recursive:
+                raise Exception(f'"{match}" is a directory, use --recursive to validate the documents in it')
+            for root, dirs, files in os.walk(match):
+                dirs.sort()
+                documents.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(DOCUMENT_EXTENSION))
+
+    return list(dict.fromkeys(documents))
+
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def manifest_settings(schematron, phase=None, strict_context=False, engine=ENGINE_XSLT):
+    """
+    :returns: str, identifies the settings results in a manifest are for
+    """
+    return hashlib.sha256(json.dumps([
+        MANIFEST_FORMAT_VERSION,
+        schematron_key(schematron),
+        phase,
+        strict_context,
+        engine,
+    ]).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """
+    Results of the documents of a corpus, see the module docstring
+    """
+
+    def __init__(self, path, settings):
+        """
+        :param path: str, path of the manifest file, created if missing
+        :param settings: str, from manifest_settings
+        """
+        self.path = path
+        self.settings = settings
+        # {absolute path: entry}
+        self._entries = {}
+        # {absolute path: (size, mtime_ns, sha256)} of documents to validate, see lookup
+        self._pending = {}
+        self._file = None
+        # whether the file is a manifest for the settings, which can be appended to
+        self._valid = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return
+        if header.get('settings') != self.settings:
+            return
+        self._valid = True
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run may be incomplete
+                continue
+            self._entries[entry['path']] = entry
+
+    def _append(self, entry):
+        if self._file is None:
+            if self._valid:
+                self._file = open(self.path, 'a')
+            else:
+                # start over
+                self._file = open(self.path, 'w')
+                self._file.write(json.dumps({'settings': self.settings}) + '\n')
+                self._valid = True
+        self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def lookup(self, document):
+        """
+        Returns the failures recorded for the document if it has not changed
+        since. Of a document whose size is unchanged but whose modification time
+        is not, the hash of the content is compared.
+
+        :param document: str, path to the document
+        :returns: FailureSet | None, None if the document is new or changed
+        """
+        path = os.path.abspath(document)
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry['size'] == stat.st_size:
+            if entry['mtime_ns'] == stat.st_mtime_ns:
+                return _failures_from_records(entry['failures'])
+            sha256 = _file_sha256(path)
+            if entry['sha256'] == sha256:
+                entry = dict(entry, mtime_ns=stat.st_mtime_ns)
+                self._entries[path] = entry
+                self._append(entry)
+                return _failures_from_records(entry['failures'])
+        else:
+            sha256 = _file_sha256(path)
+        self._pending[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return None
+
+    def record(self, document, failures):
+        """
+        Records the failures of a document returned as changed by lookup
+
+        :param document: str, path to the document
+        :param failures: iterable of Failure
+        """
+        path = os.path.abspath(document)
+        size, mtime_ns, sha256 = self._pending.pop(path)
+        entry = {
+            'path': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': sha256,
+            'failures': [[*failure, failure.context] for failure in failures],
+        }
+        self._entries[path] = entry
+        self._append(entry)
+
+    def compact(self):
+        """
+        Rewrites the manifest with one line per document which still exists
+        """
+        self.close()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps({'settings': self.settings}) + '\n')
+                for path, entry in self._entries.items():
+                    if os.path.isfile(path):
+                        f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _failures_from_records(records):
+    return FailureSet(
+        Failure(line, element, message, role, location, test, context)
+        for line, element, message, role, location, test, context in records
+    )
+
+
+def validate_corpus(schematron, documents, manifest_path=None, jobs=1, phase=None, strict_context=False, engine=ENGINE_XSLT, result_cache=None):
+    """
+    Validates the documents, skipping those recorded in the manifest as
+    unchanged since they were last validated with the same settings. Results
+    are yielded in the order of the documents. A document which is not
+    well-formed xml is reported as a single ERROR failure, rather than ending
+    the run.
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param documents: list of str, paths to the documents, see find_documents; duplicates are validated once
+    :param manifest_path: str | None, path of the manifest, every document is validated if None
+    :param jobs: int, see tools.batch.validate_many
+    :param phase: str | list of str | None, see tools.validate_sch._split_phase_selection
+    :param strict_context: bool, report rules that were not fired as failures
+    :param engine: str, see tools.validate_sch.get_validator
+    :param result_cache: tools.result_cache.ResultCache | None, see tools.batch.validate_many
+    :returns: generator of (document, FailureSet, bool), the bool is False if the failures are from the manifest
+    """
+    documents = list(dict.fromkeys(documents))
+    manifest = None
+    if manifest_path is not None:
+        manifest = Manifest(manifest_path, manifest_settings(schematron, phase, strict_context, engine))
+    try:
+        # {document: (FailureSet, whether it was validated)}
+        results = {}
+        changed = []
+        for document in documents:
+            failures = None if manifest is None else manifest.lookup(document)
+            if failures is None:
+                changed.append(document)
+            else:
+                results[document] = (failures, False)
+
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        # no more workers than there are documents to validate
+        jobs = max(1, min(jobs, len(changed)))
+        if jobs > 1:
+            # dispatch the largest documents first, see tools.batch.validate_documents
+            changed.sort(key=document_size, reverse=True)
+        validated = validate_many(
+            schematron, changed, phase=phase, strict_context=strict_context, jobs=jobs, engine=engine,
+            result_cache=result_cache, report_invalid=True,
+        )
+        for document in documents:
+            # results are recorded as soon as their worker returns them, but
+            # yielded in the order of the documents
+            while document not in results:
+                finished, failures = next(validated)
+                if manifest is not None:
+                    manifest.record(finished, failures)
+                results[finished] = (failures, True)
+            failures, was_validated = results.pop(document)
+            yield document, failures, was_validated
+
+        if manifest is not None:
+            manifest.compact()
+    finally:
+        if manifest is not None:
+            manifest.close()
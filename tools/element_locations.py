@@ -0,0 +1,64 @@
+"""
+Where elements can occur in a BuildingSync (v2.x) document.
+
+ELEMENT_LOCATIONS maps a relative path, as it appears after a // in an xpath, to
+every absolute path at which it can occur. Paths with a single location can be
+anchored, e.g. //auc:Contacts/auc:Contact is equivalent to
+/auc:BuildingSync/auc:Facilities/auc:Facility/auc:Contacts/auc:Contact. Locations
+starting with // mark elements that can also occur under many other parents
+(mostly as linked premises), which makes the path ambiguous.
+"""
+
+FACILITY = '/auc:BuildingSync/auc:Facilities/auc:Facility'
+SITE = f'{FACILITY}/auc:Sites/auc:Site'
+BUILDING = f'{SITE}/auc:Buildings/auc:Building'
+SECTION = f'{BUILDING}/auc:Sections/auc:Section'
+SYSTEMS = f'{FACILITY}/auc:Systems'
+REPORT = f'{FACILITY}/auc:Reports/auc:Report'
+SCENARIO = f'{REPORT}/auc:Scenarios/auc:Scenario'
+
+ELEMENT_LOCATIONS = {
+    'auc:Facilities': ('/auc:BuildingSync/auc:Facilities',),
+    'auc:Facility': (FACILITY, '//auc:LinkedPremises/auc:Facility'),
+    'auc:Sites': (f'{FACILITY}/auc:Sites',),
+    'auc:Site': (SITE, '//auc:LinkedPremises/auc:Site'),
+    'auc:Buildings': (f'{SITE}/auc:Buildings',),
+    'auc:Building': (BUILDING, '//auc:LinkedPremises/auc:Building', '//auc:LinkedPremisesOrSystem/auc:Building'),
+    'auc:Building/auc:FloorAreas': (f'{BUILDING}/auc:FloorAreas',),
+    'auc:Sections': (f'{BUILDING}/auc:Sections',),
+    'auc:Section': (SECTION, '//auc:LinkedPremises/auc:Section'),
+    'auc:FloorAreas': (f'{BUILDING}/auc:FloorAreas', f'{SECTION}/auc:FloorAreas', '//auc:LinkedSectionID/auc:FloorAreas'),
+    'auc:ClimateZone': (
+        f'{SITE}/auc:ClimateZoneType/auc:ASHRAE/auc:ClimateZone',
+        f'{SITE}/auc:ClimateZoneType/auc:CaliforniaTitle24/auc:ClimateZone',
+        f'{BUILDING}/auc:ClimateZoneType/auc:ASHRAE/auc:ClimateZone',
+        f'{BUILDING}/auc:ClimateZoneType/auc:CaliforniaTitle24/auc:ClimateZone',
+    ),
+    'auc:Contacts': (f'{FACILITY}/auc:Contacts',),
+    'auc:Contact': (f'{FACILITY}/auc:Contacts/auc:Contact',),
+    'auc:Schedules': (f'{FACILITY}/auc:Schedules',),
+    'auc:Schedule': (f'{FACILITY}/auc:Schedules/auc:Schedule',),
+    'auc:Measures': (f'{FACILITY}/auc:Measures',),
+    'auc:Measure': (f'{FACILITY}/auc:Measures/auc:Measure',),
+    'auc:Systems': (SYSTEMS,),
+    'auc:HVACSystems': (f'{SYSTEMS}/auc:HVACSystems',),
+    'auc:HVACSystem': (f'{SYSTEMS}/auc:HVACSystems/auc:HVACSystem',),
+    'auc:LightingSystems': (f'{SYSTEMS}/auc:LightingSystems',),
+    'auc:LightingSystem': (f'{SYSTEMS}/auc:LightingSystems/auc:LightingSystem',),
+    'auc:PlugLoads': (f'{SYSTEMS}/auc:PlugLoads',),
+    'auc:PlugLoad': (f'{SYSTEMS}/auc:PlugLoads/auc:PlugLoad',),
+    'auc:FanSystems': (f'{SYSTEMS}/auc:FanSystems',),
+    'auc:FanSystem': (f'{SYSTEMS}/auc:FanSystems/auc:FanSystem',),
+    'auc:PumpSystems': (f'{SYSTEMS}/auc:PumpSystems',),
+    'auc:PumpSystem': (f'{SYSTEMS}/auc:PumpSystems/auc:PumpSystem',),
+    'auc:Reports': (f'{FACILITY}/auc:Reports',),
+    'auc:Report': (REPORT,),
+    'auc:Utilities': (f'{REPORT}/auc:Utilities',),
+    'auc:Utility': (f'{REPORT}/auc:Utilities/auc:Utility',),
+    'auc:Scenarios': (f'{REPORT}/auc:Scenarios',),
+    'auc:Scenario': (SCENARIO,),
+    'auc:ResourceUses': (f'{SCENARIO}/auc:ResourceUses',),
+    'auc:ResourceUse': (f'{SCENARIO}/auc:ResourceUses/auc:ResourceUse',),
+    'auc:TimeSeriesData': (f'{SCENARIO}/auc:TimeSeriesData',),
+    'auc:TimeSeries': (f'{SCENARIO}/auc:TimeSeriesData/auc:TimeSeries',),
+}
@@ -0,0 +1,250 @@
+"""
+FailureSet: the failures of a document stored in columns rather than as one
+Failure object per failure. Lines and the ids of the element names, messages,
+roles, tests and rule contexts are kept in arrays of ints; the strings
+themselves are interned once in a pool shared with the sets grouped from it.
+Only the locations, which are nearly always unique, are kept as a list of str.
+
+This keeps the results of batch runs over many documents small in memory and
+cheap to send back from worker processes, while iterating a FailureSet still
+yields Failure objects.
+"""
+import csv
+import io
+import json
+from array import array
+
+from .validate_sch import Failure
+
+# stored in place of a None line or string
+_NONE = -1
+
+# columns of the csv written by FailureSet.to_csv
+CSV_FIELDS = Failure._fields + ('context',)
+
+
+class _StringPool:
+    """
+    Interns strings, assigning each distinct string an int id
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def intern(self, string):
+        """
+        :param string: str | None
+        :returns: int, _NONE if string is None
+        """
+        if string is None:
+            return _NONE
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def find(self, string):
+        """
+        :param string: str | None
+        :returns: int | None, id of the string, None if it was never interned
+        """
+        if string is None:
+            return _NONE
+        return self._ids.get(string)
+
+    def get(self, string_id):
+        """
+        :param string_id: int
+        :returns: str | None
+        """
+        return None if string_id == _NONE else self.strings[string_id]
+
+
+class FailureSet:
+    """
+    Compact, array backed collection of Failures. Behaves like a read only list
+    of Failures (len, indexing, iteration, equality with lists), with the number
+    of failures of each role kept up to date as failures are added.
+    """
+
+    def __init__(self, failures=(), _pool=None):
+        """
+        :param failures: iterable of Failure
+        """
+        self._pool = _StringPool() if _pool is None else _pool
+        self._lines = array('i')
+        self._elements = array('i')
+        self._messages = array('i')
+        self._roles = array('i')
+        self._tests = array('i')
+        self._contexts = array('i')
+        self._locations = []
+        # {role id: number of failures}
+        self._role_counts = {}
+        self.extend(failures)
+
+    def _append_ids(self, line, element, message, role, location, test, context):
+        self._lines.append(_NONE if line is None else line)
+        self._elements.append(element)
+        self._messages.append(message)
+        self._roles.append(role)
+        self._locations.append(location)
+        self._tests.append(test)
+        self._contexts.append(context)
+        self._role_counts[role] = self._role_counts.get(role, 0) + 1
+
+    def append(self, failure):
+        """
+        :param failure: Failure
+        """
+        intern = self._pool.intern
+        line, element, message, role, location, test = failure
+        self._append_ids(line, intern(element), intern(message), intern(role), location, intern(test), intern(failure.context))
+
+    def extend(self, failures):
+        """
+        :param failures: iterable of Failure
+        """
+        for failure in failures:
+            self.append(failure)
+
+    def _take(self, indexes):
+        """
+        :param indexes: iterable of int
+        :returns: FailureSet, of the failures at the indexes, sharing this set's string pool
+        """
+        subset = FailureSet(_pool=self._pool)
+        for i in indexes:
+            line = self._lines[i]
+            subset._append_ids(
+                None if line == _NONE else line,
+                self._elements[i],
+                self._messages[i],
+                self._roles[i],
+                self._locations[i],
+                self._tests[i],
+                self._contexts[i],
+            )
+        return subset
+
+    def _group_by(self, column):
+        """
+        :param column: array, one of the id columns
+        :returns: dict, {str: FailureSet}, in the order each group first appears
+        """
+        indexes = {}
+        for i, string_id in enumerate(column):
+            indexes.setdefault(string_id, []).append(i)
+        return {self._pool.get(string_id): self._take(group) for string_id, group in indexes.items()}
+
+    def count(self, role):
+        """
+        :param role: str, e.g. 'ERROR'
+        :returns: int, number of failures with the role
+        """
+        role_id = self._pool.find(role)
+        return 0 if role_id is None else self._role_counts.get(role_id, 0)
+
+    def role_counts(self):
+        """
+        :returns: dict, {role: number of failures}
+        """
+        return {self._pool.get(role_id): count for role_id, count in self._role_counts.items()}
+
+    def group_by_role(self):
+        """
+        :returns: dict, {role: FailureSet}
+        """
+        return self._group_by(self._roles)
+
+    def group_by_message(self):
+        """
+        :returns: dict, {message: FailureSet}
+        """
+        return self._group_by(self._messages)
+
+    def _failure(self, i):
+        get = self._pool.get
+        line = self._lines[i]
+        return Failure(
+            line=None if line == _NONE else line,
+            element=get(self._elements[i]),
+            message=get(self._messages[i]),
+            role=get(self._roles[i]),
+            location=self._locations[i],
+            test=get(self._tests[i]),
+            context=get(self._contexts[i]),
+        )
+
+    def to_records(self):
+        """
+        :returns: list of dict, one per failure with CSV_FIELDS (the Failure fields and the context) as keys
+        """
+        get = self._pool.get
+        return [
+            {
+                'line': None if line == _NONE else line,
+                'element': get(element),
+                'message': get(message),
+                'role': get(role),
+                'location': location,
+                'test': get(test),
+                'context': get(context),
+            }
+            for line, element, message, role, location, test, context in zip(
+                self._lines, self._elements, self._messages, self._roles, self._locations, self._tests, self._contexts
+            )
+        ]
+
+    def to_json(self):
+        """
+        :returns: str, json array of the records, see to_records
+        """
+        return json.dumps(self.to_records())
+
+    def to_csv(self, outstream=None):
+        """
+        Writes the failures as csv, with a header row of CSV_FIELDS
+
+        :param outstream: text file object | None, if None the csv is returned instead
+        :returns: str | None
+        """
+        output = io.StringIO() if outstream is None else outstream
+        writer = csv.writer(output)
+        writer.writerow(CSV_FIELDS)
+        get = self._pool.get
+        writer.writerows(
+            (None if line == _NONE else line, get(element), get(message), get(role), location, get(test), get(context))
+            for line, element, message, role, location, test, context in zip(
+                self._lines, self._elements, self._messages, self._roles, self._locations, self._tests, self._contexts
+            )
+        )
+        if outstream is None:
+            return output.getvalue()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return (self._failure(i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._take(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('FailureSet index out of range')
+        return self._failure(index)
+
+    def __eq__(self, other):
+        if isinstance(other, (FailureSet, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'FailureSet({list(self)!r})'
@@ -1,12 +1,16 @@
 
 import copy
 import csv
+import hashlib
 import os
 import re
+from collections import Counter
 
 from lxml import etree
 
-from tools.constants import SCH_NS, SCH_NSMAP, BSYNC_NSMAP
+from tools.catalog import build_catalog, catalog_path, catalog_to_bytes
+from tools.constants import SCH_NS, SCH_NSMAP, BSYNC_NSMAP, XSL_NS, XSL_NSMAP
+from tools.element_locations import ELEMENT_LOCATIONS
 
 
 # global variable for tracking visited nodes in the exemplary xml
@@ -183,12 +187,369 @@ def generate_tests_for_rule_contexts(orig_sch_dict):
     return new_sch_dict
 
 
-def generate_sch(csv_file, output_file=None, exemplary_xml_file=None, dry_run=False):
+_NAME = r'[A-Za-z_][\w.-]*'
+_QNAME_RE = re.compile(rf'(?:{_NAME}:)?{_NAME}')
+_ATTRIBUTE_RE = re.compile(rf'@{_NAME}')
+# relative path which can be used as the `use` of an xsl:key, e.g. auc:LinkedPremises/auc:Section/auc:LinkedSectionID/@IDref
+_KEY_USE_RE = re.compile(rf'^(?:(?:{_NAME}:)?{_NAME}/)*(?:@{_NAME}|(?:{_NAME}:)?{_NAME})$')
+# path starting at the rule context node, e.g. current()/auc:LinkedScheduleIDs/auc:LinkedScheduleID/@IDref
+_CURRENT_PATH_RE = re.compile(r'^current\(\)(?:/[\w.:@*-]+)+$')
+# left hand side of a comparison with a descendant scan, e.g. "@IDref = " in "@IDref = //auc:Contacts/auc:Contact/@ID"
+_KEY_LOOKUP_COMPARISON_RE = re.compile(r'(?:^|(?<=[\s(\[,]))(@[A-Za-z_][\w.-]*|current\(\)(?:/[\w.:@*-]+)+)\s*(?<![!<>])=\s*$')
+# characters which, directly before a //, make it a step of a larger path rather than the start of one
+_PATH_CHAR_RE = re.compile(r'[\w.\-)\]*@/:]')
+# characters which may follow the end of a location path
+_PATH_TERMINATORS = ' \t\n)],|=!<>'
+
+
+def _find_closing(expression, start):
+    """
+    Returns the index of the bracket or parenthesis closing the one at start
+
+    :param expression: str
+    :param start: int, index of the opening bracket or parenthesis
+    :returns: int, -1 if it is never closed
+    """
+    depth = 0
+    quote = None
+    for i in range(start, len(expression)):
+        char = expression[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _split_top_level(expression, separator):
+    """
+    Splits the expression on the separator, ignoring separators inside of
+    brackets, parentheses or string literals
+
+    :param expression: str
+    :param separator: str
+    :returns: list of str
+    """
+    parts = []
+    depth = 0
+    quote = None
+    part_start = 0
+    i = 0
+    while i < len(expression):
+        char = expression[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif depth == 0 and expression.startswith(separator, i):
+            parts.append(expression[part_start:i])
+            i += len(separator)
+            part_start = i
+            continue
+        i += 1
+    parts.append(expression[part_start:])
+    return parts
+
+
+def _descendant_scan_starts(expression):
+    """
+    Yields the index of every // which starts a location path, ignoring those
+    inside of string literals or in the middle of a path (e.g. auc:A//auc:B)
+
+    :param expression: str
+    :returns: generator of int
+    """
+    quote = None
+    for i, char in enumerate(expression):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif expression.startswith('//', i) and (i == 0 or not _PATH_CHAR_RE.match(expression[i - 1])):
+            yield i
+
+
+def _parse_descendant_path(expression, start):
+    """
+    Parses a path of named element steps, each with an optional predicate, and
+    an optional final attribute step, e.g. //auc:Sections/auc:Section[@ID = current()/@IDref]
+
+    :param expression: str
+    :param start: int, index of the leading //
+    :returns: (list, str | None, int) | None, list of (step name, predicate | None), attribute step and the index the path ends at; None if the path is not of that form
+    """
+    i = start + 2
+    steps = []
+    while True:
+        match = _QNAME_RE.match(expression, i)
+        if match is None:
+            return None
+        name = match.group()
+        i = match.end()
+        predicate = None
+        if expression.startswith('[', i):
+            close = _find_closing(expression, i)
+            if close < 0:
+                return None
+            predicate = expression[i + 1:close]
+            i = close + 1
+        steps.append((name, predicate))
+
+        attribute = None
+        if expression.startswith('/@', i):
+            match = _ATTRIBUTE_RE.match(expression, i + 1)
+            attribute = match.group()
+            i = match.end()
+        elif expression.startswith('/', i) and not expression.startswith('//', i):
+            i += 1
+            continue
+
+        if i < len(expression) and expression[i] not in _PATH_TERMINATORS:
+            return None
+        return steps, attribute, i
+
+
+def _is_key_pattern_safe(predicate):
+    # xsl:key match patterns may not reference variables, and current() is
+    # meaningless inside of them
+    return '$' not in predicate and 'current()' not in predicate
+
+
+def _get_key_name(keys, match, use):
+    """
+    Returns the name of the xsl:key for match and use, adding it to keys if new
+
+    :param keys: dict, {(match, use): name}
+    :param match: str
+    :param use: str
+    :returns: str
+    """
+    if (match, use) in keys:
+        return keys[(match, use)]
+
+    def slug(path):
+        return re.sub(r'[^\w]+', '-', re.sub(r'\[.*?\]', '', path).replace('auc:', '')).strip('-')
+
+    name = f'{slug(match)}-by-{slug(use)}'
+    if '[' in match:
+        name += '-' + hashlib.sha1(match.encode('utf-8')).hexdigest()[:8]
+    existing_names = set(keys.values())
+    unique_name = name
+    suffix = 2
+    while unique_name in existing_names:
+        unique_name = f'{name}-{suffix}'
+        suffix += 1
+
+    keys[(match, use)] = unique_name
+    return unique_name
+
+
+def _rewrite_join_predicate(steps, keys):
+    """
+    Rewrites //steps[... and use = current()/path and ...] as
+    key(name, current()/path)[...], or returns None if the last predicate does
+    not contain such a join.
+
+    :returns: str | None
+    """
+    if any(predicate is not None for _, predicate in steps[:-1]):
+        return None
+    predicate = steps[-1][1]
+    if predicate is None:
+        return None
+
+    conjuncts = [conjunct.strip() for conjunct in _split_top_level(predicate, ' and ')]
+    for idx, conjunct in enumerate(conjuncts):
+        sides = _split_top_level(conjunct, '=')
+        if len(sides) != 2 or sides[0][-1:] in ('!', '<', '>'):
+            continue
+        left, right = sides[0].strip(), sides[1].strip()
+        if _CURRENT_PATH_RE.match(right) and _KEY_USE_RE.match(left):
+            use, lookup = left, right
+        elif _CURRENT_PATH_RE.match(left) and _KEY_USE_RE.match(right):
+            use, lookup = right, left
+        else:
+            continue
+
+        remaining = conjuncts[:idx] + conjuncts[idx + 1:]
+        # predicates are only order independent filters if they are not positional
+        if any(re.match(r'^[\d.]+$', c) or 'position()' in c or 'last()' in c for c in remaining):
+            return None
+
+        match = '/'.join(name for name, _ in steps)
+        result = f"key('{_get_key_name(keys, match, use)}', {lookup})"
+        if remaining:
+            result += f'[{" and ".join(remaining)}]'
+        return result
+
+    return None
+
+
+def rewrite_id_joins(expression, keys):
+    """
+    Rewrites ID/IDREF joins which scan the whole document into lookups of xsl:keys.
+    For example
+        //auc:Sections/auc:Section[@ID = current()/@IDref]
+    becomes
+        key('Sections-Section-by-ID', current()/@IDref)
+    and
+        @IDref = //auc:Contacts/auc:Contact/@ID
+    becomes
+        key('Contacts-Contact-by-ID', @IDref)
+
+    Expressions that do not exactly match these forms are left untouched.
+
+    :param expression: str, xpath expression (assert test or let value)
+    :param keys: dict, {(match, use): name}, keys used by the rewritten expressions are added to it
+    :returns: str
+    """
+    result = ''
+    i = 0
+    for start in _descendant_scan_starts(expression):
+        if start < i:
+            # part of a path that was already rewritten
+            continue
+        parsed = _parse_descendant_path(expression, start)
+        if parsed is None:
+            continue
+        steps, attribute, end = parsed
+        if attribute is None:
+            rewritten = _rewrite_join_predicate(steps, keys)
+            if rewritten is not None:
+                result += expression[i:start] + rewritten
+                i = end
+        elif all(predicate is None or _is_key_pattern_safe(predicate) for _, predicate in steps):
+            preceding = result + expression[i:start]
+            comparison = _KEY_LOOKUP_COMPARISON_RE.search(preceding)
+            if comparison is not None:
+                match = '/'.join(name if predicate is None else f'{name}[{predicate}]' for name, predicate in steps)
+                key_name = _get_key_name(keys, match, attribute)
+                result = preceding[:comparison.start()] + f"key('{key_name}', {comparison.group(1)})"
+                i = end
+
+    return result + expression[i:]
+
+
+def _rewrite_sch_xpaths(sch_dict, rewrite):
+    """
+    Applies rewrite to every assert test and let value of the schematron. Assert
+    descriptions default to the original test so failure messages are unchanged.
+
+    :param sch_dict: dict, schematron in dictionary format, modified in place
+    :param rewrite: callable, takes and returns an xpath expression
+    """
+    for phase in sch_dict['phases']:
+        for pattern in phase['patterns']:
+            for rule in pattern['rules']:
+                for variable in rule['variables']:
+                    variable['value'] = rewrite(variable['value'])
+                for assert_ in rule['asserts']:
+                    if not assert_['description']:
+                        assert_['description'] = assert_['test']
+                    assert_['test'] = rewrite(assert_['test'])
+
+
+def rewrite_sch_id_joins(sch_dict):
+    """
+    Rewrites the ID/IDREF joins in every assert test and let value of the
+    schematron to use xsl:key lookups (see rewrite_id_joins). Without keys, a join
+    scans the whole document for every rule context node it is evaluated for,
+    making validation quadratic in document size.
+
+    :param sch_dict: dict, schematron in dictionary format, modified in place
+    :returns: dict, {(match, use): name} of the xsl:keys to declare
+    """
+    keys = {}
+    _rewrite_sch_xpaths(sch_dict, lambda expression: rewrite_id_joins(expression, keys))
+    return keys
+
+
+def anchor_descendant_scans(expression, counts, locations=ELEMENT_LOCATIONS):
+    """
+    Replaces descendant scans of elements which can only occur at a single
+    location in a BuildingSync document with that absolute path. For example
+        //auc:Contacts/auc:Contact[auc:ContactRoles]
+    becomes
+        /auc:BuildingSync/auc:Facilities/auc:Facility/auc:Contacts/auc:Contact[auc:ContactRoles]
+
+    The longest leading steps of the scan found in locations are used. Scans of
+    elements with multiple locations, or not in locations at all, are left untouched.
+
+    :param expression: str, xpath expression (assert test or let value)
+    :param counts: collections.Counter, the number of 'anchored' and 'ambiguous' scans is added to it
+    :param locations: dict, relative path to tuple of absolute paths, see tools.element_locations
+    :returns: str
+    """
+    result = ''
+    i = 0
+    for start in _descendant_scan_starts(expression):
+        names = []
+        ends = []
+        j = start + 2
+        while True:
+            match = _QNAME_RE.match(expression, j)
+            # stop at functions (e.g. //text()) and axes
+            if match is None or expression.startswith('(', match.end()) or expression.startswith('::', match.end()):
+                break
+            names.append(match.group())
+            j = match.end()
+            ends.append(j)
+            if not expression.startswith('/', j) or expression.startswith('//', j):
+                break
+            j += 1
+
+        for num_steps in range(len(names), 0, -1):
+            element_locations = locations.get('/'.join(names[:num_steps]))
+            if element_locations is None:
+                continue
+            if len(element_locations) == 1:
+                counts['anchored'] += 1
+                result += expression[i:start] + element_locations[0]
+                i = ends[num_steps - 1]
+            else:
+                counts['ambiguous'] += 1
+            break
+
+    return result + expression[i:]
+
+
+def anchor_sch_descendant_scans(sch_dict, locations=ELEMENT_LOCATIONS):
+    """
+    Anchors the descendant scans in every assert test and let value of the
+    schematron (see anchor_descendant_scans). A // scan walks the whole document
+    each time it's evaluated, while an absolute path only visits the elements
+    along the way.
+
+    :param sch_dict: dict, schematron in dictionary format, modified in place
+    :param locations: dict, relative path to tuple of absolute paths, see tools.element_locations
+    :returns: collections.Counter, number of 'anchored' and 'ambiguous' scans
     """
-    Generates a schematron file from a csv file
+    counts = Counter()
+    _rewrite_sch_xpaths(sch_dict, lambda expression: anchor_descendant_scans(expression, counts, locations))
+    return counts
+
+
+def read_sch_dict(csv_file):
+    """
+    Reads the csv into the hierarchical (phase, pattern, rule) dictionary format,
+    including the generated patterns which test that rule contexts exist (see
+    generate_tests_for_rule_contexts)
 
     :param csv_file: str, path to csv for schematron generation
-    :param exemplary_xml_file: str | None, path to an xml file which should pass the schematron validation
+    :returns: dict, schematron in dictionary format
     """
     with open(csv_file, encoding='utf-8-sig') as f:
         rows = [{k: v for k, v in row.items()}
@@ -262,14 +623,26 @@ def generate_sch(csv_file, output_file=None, exemplary_xml_file=None, dry_run=Fa
             }
             current_rule['asserts'].append(new_assert)
 
-    sch_dict = generate_tests_for_rule_contexts(sch_dict)
+    return generate_tests_for_rule_contexts(sch_dict)
 
-    # convert dict to schematron document, validating rule contexts as we go
-    exemplary_xml = None
-    if exemplary_xml_file is not None:
-        exemplary_xml = etree.parse(exemplary_xml_file)
-    root = etree.Element(qname('schema'), nsmap=SCH_NSMAP)
+
+def sch_dict_to_tree(sch_dict, keys=None, exemplary_xml=None):
+    """
+    Converts the schematron from dictionary format to a schematron document
+
+    :param sch_dict: dict, schematron in dictionary format
+    :param keys: dict | None, xsl keys used by the xpaths, see rewrite_sch_id_joins
+    :param exemplary_xml: etree._ElementTree | None, if provided, rule contexts are checked against it and warnings are printed
+    :returns: etree._Element, the sch:schema element
+    """
+    keys = keys or {}
+    nsmap = dict(SCH_NSMAP)
+    if keys:
+        nsmap.update(XSL_NSMAP)
+    root = etree.Element(qname('schema'), nsmap=nsmap)
     etree.SubElement(root, qname('ns'), prefix="auc", uri="http://buildingsync.net/schemas/bedes-auc/2019")
+    for (match, use), name in keys.items():
+        etree.SubElement(root, etree.QName(XSL_NS, 'key'), name=name, match=match, use=use)
 
     # used to add patterns at the end of the root element after everything's finished
     collected_patterns = []
@@ -304,21 +677,71 @@ def generate_sch(csv_file, output_file=None, exemplary_xml_file=None, dry_run=Fa
     for pattern in collected_patterns:
         root.append(pattern)
 
+    return root
+
+
+def csv_to_schematron(csv_file, optimize=True):
+    """
+    Generates the schematron for a csv in memory, without writing it or
+    reporting on the generation
+
+    :param csv_file: str, path to csv for schematron generation
+    :param optimize: bool, see generate_sch
+    :returns: etree._ElementTree
+    """
+    sch_dict = read_sch_dict(csv_file)
+    keys = {}
+    if optimize:
+        keys = rewrite_sch_id_joins(sch_dict)
+        anchor_sch_descendant_scans(sch_dict)
+    return etree.ElementTree(sch_dict_to_tree(sch_dict, keys))
+
+
+def generate_sch(csv_file, output_file=None, exemplary_xml_file=None, dry_run=False, optimize=True, scan_counts=None):
+    """
+    Generates a schematron file from a csv file, along with its rule catalog (see tools.catalog)
+
+    :param csv_file: str, path to csv for schematron generation
+    :param exemplary_xml_file: str | None, path to an xml file which should pass the schematron validation
+    :param optimize: bool, if True xpaths are rewritten to faster equivalents, see rewrite_sch_id_joins and anchor_sch_descendant_scans
+    :param scan_counts: collections.Counter | None, if given, the number of 'anchored' and 'ambiguous' scans is added to it
+    :returns: bool, True if the schematron or its catalog would be (or were) changed
+    """
+    sch_dict = read_sch_dict(csv_file)
+
+    keys = {}
+    if optimize:
+        keys = rewrite_sch_id_joins(sch_dict)
+        counts = anchor_sch_descendant_scans(sch_dict)
+        if scan_counts is not None:
+            scan_counts.update(counts)
+
+    # convert dict to schematron document, validating rule contexts as we go
+    exemplary_xml = None
+    if exemplary_xml_file is not None:
+        exemplary_xml = etree.parse(exemplary_xml_file)
+    root = sch_dict_to_tree(sch_dict, keys, exemplary_xml)
+
     sch_bytes = etree.tostring(root, doctype='<?xml version="1.0" encoding="UTF-8"?>', pretty_print=True)
     if output_file is None:
         output_file = f'{os.path.splitext(csv_file)[0]}.sch'
 
-    if os.path.isfile(output_file):
-        with open(output_file, 'rb') as f:
-            if sch_bytes != f.read():
-                file_maybe_updated = True
-            else:
-                file_maybe_updated = False
-    else:
-        file_maybe_updated = True
+    # generated schematron has nothing to include or expand, so the catalog is built from it as is
+    catalog_bytes = catalog_to_bytes(build_catalog(etree.ElementTree(root), sch_bytes))
+    outputs = [(output_file, sch_bytes), (catalog_path(output_file), catalog_bytes)]
+
+    file_maybe_updated = False
+    for path, content in outputs:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                if content != f.read():
+                    file_maybe_updated = True
+        else:
+            file_maybe_updated = True
 
     if not dry_run:
-        with open(output_file, 'wb') as f:
-            f.write(sch_bytes)
+        for path, content in outputs:
+            with open(path, 'wb') as f:
+                f.write(content)
 
     return file_maybe_updated
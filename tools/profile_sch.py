@@ -0,0 +1,201 @@
+from collections import namedtuple, Counter
+
+from .compile_sch import _pattern_modes
+from .constants import SCH_NSMAP, SVRL_NS
+
+# libxslt reports template times in ticks of 10 microseconds
+_PROFILE_TICKS_PER_MS = 100
+
+# times are in milliseconds. libxslt measures the time spent in each template
+# excluding the templates it calls, so the time of a pattern includes walking the
+# document in its mode, while the time of a rule is only the time spent in its
+# own template, i.e. evaluating its lets and asserts
+Profile = namedtuple('Profile', ['time', 'phases', 'patterns', 'rules', 'asserts'])
+PhaseProfile = namedtuple('PhaseProfile', ['phase', 'time', 'fired', 'failures'])
+PatternProfile = namedtuple('PatternProfile', ['pattern', 'phases', 'time', 'fired', 'failures'])
+RuleProfile = namedtuple('RuleProfile', ['pattern', 'context', 'time', 'fired', 'failures'])
+# libxslt only profiles templates, so asserts have no time of their own, only
+# the number of times they were evaluated (the number of times their rule fired)
+AssertProfile = namedtuple('AssertProfile', ['pattern', 'context', 'test', 'role', 'evaluations', 'failures'])
+
+
+def _failed_asserts_by_rule(validation_report):
+    """
+    Counts the failed asserts of the svrl report by the context of the rule that
+    fired just before them
+
+    :param validation_report: etree._ElementTree, svrl report including fired rules
+    :returns: Counter, failed asserts by (rule context, assert test)
+    """
+    failed = Counter()
+    context = None
+    for element in validation_report.getroot():
+        if element.tag == f'{{{SVRL_NS}}}fired-rule':
+            context = element.get('context')
+        elif element.tag == f'{{{SVRL_NS}}}failed-assert':
+            failed[(context, element.get('test'))] += 1
+    return failed
+
+
+def build_profile(schematron_tree, validation_report, xslt_profile, phase=None):
+    """
+    Combines the profile of an xslt run with the fired rules and failed asserts of
+    its svrl report into time and match counts per phase, pattern, rule and assert,
+    each sorted hottest first.
+
+    :param schematron_tree: etree._ElementTree, the included and expanded schematron
+    :param validation_report: etree._ElementTree, svrl report including fired rules
+    :param xslt_profile: etree._ElementTree, the xslt_profile of the validation result
+    :param phase: str | list of str | None, the phase, or phases, that were run, all phases if None
+    :returns: Profile
+    """
+    phases = [phase] if isinstance(phase, str) else phase
+    failed_by_assert = _failed_asserts_by_rule(validation_report)
+
+    phases_by_pattern = {}
+    for phase_elem in schematron_tree.xpath('//sch:phase', namespaces=SCH_NSMAP):
+        for pattern_id in phase_elem.xpath('sch:active/@pattern', namespaces=SCH_NSMAP):
+            phases_by_pattern.setdefault(pattern_id, []).append(phase_elem.get('id'))
+
+    patterns = {
+        mode: pattern for mode, pattern in _pattern_modes(schematron_tree).items()
+        if phases is None or any(p in phases for p in phases_by_pattern.get(pattern.get('id'), []))
+    }
+
+    total_time = 0
+    pattern_times = Counter()
+    rule_times = Counter()
+    rule_calls = Counter()
+    for template in xslt_profile.getroot():
+        time = int(template.get('time')) / _PROFILE_TICKS_PER_MS
+        total_time += time
+        mode = template.get('mode')
+        if mode not in patterns:
+            continue
+        pattern_times[mode] += time
+        rule_times[(mode, template.get('match'))] += time
+        rule_calls[(mode, template.get('match'))] += int(template.get('calls'))
+
+    pattern_profiles = []
+    rule_profiles = []
+    assert_profiles = []
+    # failed asserts are identified by their rule context and test, so if the same
+    # rule and assert are used in multiple patterns the failures are all
+    # attributed to the first of them
+    attributed = set()
+    for mode, pattern in patterns.items():
+        pattern_id = pattern.get('id')
+        pattern_fired = 0
+        pattern_failures = 0
+        for rule in pattern.xpath('sch:rule', namespaces=SCH_NSMAP):
+            context = rule.get('context')
+            fired = rule_calls[(mode, context)]
+            rule_failures = 0
+            for assert_ in rule.xpath('sch:assert', namespaces=SCH_NSMAP):
+                test = assert_.get('test')
+                failures = 0
+                if fired and (context, test) not in attributed:
+                    failures = failed_by_assert[(context, test)]
+                    attributed.add((context, test))
+                rule_failures += failures
+                assert_profiles.append(AssertProfile(
+                    pattern=pattern_id,
+                    context=context,
+                    test=test,
+                    role=assert_.get('role') or None,
+                    evaluations=fired,
+                    failures=failures,
+                ))
+            pattern_fired += fired
+            pattern_failures += rule_failures
+            rule_profiles.append(RuleProfile(
+                pattern=pattern_id,
+                context=context,
+                time=rule_times[(mode, context)],
+                fired=fired,
+                failures=rule_failures,
+            ))
+        pattern_profiles.append(PatternProfile(
+            pattern=pattern_id,
+            phases=phases_by_pattern.get(pattern_id, []),
+            time=pattern_times[mode],
+            fired=pattern_fired,
+            failures=pattern_failures,
+        ))
+
+    phase_profiles = {}
+    for pattern_profile in pattern_profiles:
+        for phase_id in pattern_profile.phases:
+            if phases is not None and phase_id not in phases:
+                continue
+            previous = phase_profiles.get(phase_id, PhaseProfile(phase_id, 0, 0, 0))
+            phase_profiles[phase_id] = PhaseProfile(
+                phase=phase_id,
+                time=previous.time + pattern_profile.time,
+                fired=previous.fired + pattern_profile.fired,
+                failures=previous.failures + pattern_profile.failures,
+            )
+
+    return Profile(
+        time=total_time,
+        phases=sorted(phase_profiles.values(), key=lambda p: p.time, reverse=True),
+        patterns=sorted(pattern_profiles, key=lambda p: p.time, reverse=True),
+        rules=sorted(rule_profiles, key=lambda r: (r.time, r.fired), reverse=True),
+        asserts=sorted(assert_profiles, key=lambda a: (a.evaluations, a.failures), reverse=True),
+    )
+
+
+def profile_to_dict(profile):
+    """
+    :param profile: Profile
+    :returns: dict, json serializable
+    """
+    return {
+        'time': profile.time,
+        'phases': [p._asdict() for p in profile.phases],
+        'patterns': [p._asdict() for p in profile.patterns],
+        'rules': [r._asdict() for r in profile.rules],
+        'asserts': [a._asdict() for a in profile.asserts],
+    }
+
+
+def _format_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    lines = ['  '.join(str(value).ljust(width) for value, width in zip(headers, widths)).rstrip()]
+    lines.append('  '.join('-' * width for width in widths))
+    for row in rows:
+        lines.append('  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+    return '\n'.join(lines)
+
+
+def format_profile(profile, limit=10):
+    """
+    Formats the hottest phases, patterns, rules and asserts of the profile as text tables
+
+    :param profile: Profile
+    :param limit: int | None, maximum number of rows per table, None for all
+    :returns: str
+    """
+    def top(items):
+        return items if limit is None else items[:limit]
+
+    sections = [
+        f'Total time: {profile.time:.2f} ms',
+        'Phases\n' + _format_table(
+            ['time (ms)', 'fired', 'failures', 'phase'],
+            [[f'{p.time:.2f}', p.fired, p.failures, p.phase] for p in top(profile.phases)]
+        ),
+        'Patterns\n' + _format_table(
+            ['time (ms)', 'fired', 'failures', 'pattern'],
+            [[f'{p.time:.2f}', p.fired, p.failures, p.pattern] for p in top(profile.patterns)]
+        ),
+        'Rules\n' + _format_table(
+            ['time (ms)', 'fired', 'failures', 'pattern', 'context'],
+            [[f'{r.time:.2f}', r.fired, r.failures, r.pattern, r.context] for r in top(profile.rules)]
+        ),
+        'Asserts\n' + _format_table(
+            ['evaluations', 'failures', 'pattern', 'test'],
+            [[a.evaluations, a.failures, a.pattern, a.test] for a in top(profile.asserts)]
+        ),
+    ]
+    return '\n\n'.join(sections)
@@ -0,0 +1,337 @@
+"""
+On-disk cache of validation results. Many documents are validated again without
+changes, or with only their formatting changed, so results are keyed by a hash
+of the canonical (C14N) form of the document with ignorable whitespace removed,
+along with the schematron, phase and options they were validated with. A hit
+returns the stored failures without compiling the schematron or running it.
+
+Line numbers of a document which only matches a cached result after
+canonicalization are looked up again (when first accessed) from the stored
+locations of the failures.
+
+The cache is bounded: entries not used within max_age seconds are removed, and
+after that the least recently used entries until it is no larger than max_size
+bytes.
+"""
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from lxml import etree
+
+from .batch import _document_bytes
+from .compile_sch import CACHE_FORMAT_VERSION, _hash_includes
+from .validate_sch import (
+    Failure, ENGINE_XSLT, get_validator, aggregate_failures, _split_phase_selection, _parse_schematron,
+    _parse_document, _validator_cache_key,
+)
+
+# environment variable which overrides the directory of the result cache
+RESULT_CACHE_DIR_ENV = 'BSYNC_RESULT_CACHE_DIR'
+DEFAULT_RESULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bsync_testsuite', 'results')
+
+# bump this whenever the content of cached results changes
+RESULT_CACHE_FORMAT_VERSION = '1'
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+# number of results stored between evictions
+EVICT_INTERVAL = 100
+
+# seconds after which evict removes a temporary file left by a store that never finished
+STALE_TMP_AGE = 60 * 60
+
+# {schematron cache key: (hash, stats of the included files)}, see schematron_key
+_SCHEMATRON_KEYS = {}
+
+
+def get_result_cache_dir():
+    """
+    :returns: str, directory of the result cache
+    """
+    return os.environ.get(RESULT_CACHE_DIR_ENV) or DEFAULT_RESULT_CACHE_DIR
+
+
+def document_hash(document_bytes):
+    """
+    Returns a hash of the canonical form of the document. Documents which only
+    differ in formatting (indentation, attribute order, quoting, empty element
+    syntax, ...) have the same hash.
+
+    :param document_bytes: bytes
+    :returns: str
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    tree = etree.ElementTree(etree.fromstring(document_bytes, parser))
+    return hashlib.sha256(etree.tostring(tree, method='c14n')).hexdigest()
+
+
+def _file_stats(paths):
+    """
+    :param paths: iterable of str
+    :returns: tuple of (str, int | None, int | None), path, modification time and size of each file, None if it is missing
+    """
+    stats = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stats.append((path, None, None))
+            continue
+        stats.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+
+def schematron_key(schematron):
+    """
+    Returns a hash of the schematron and the files it includes. Unlike
+    tools.compile_sch.schematron_hash, the schematron is only parsed when it
+    might include other files, and the hash is kept for as long as neither the
+    schematron nor any file it includes is modified.
+
+    :param schematron: str, path to sch (or csv) file or string containing schematron xml
+    :returns: str
+    """
+    memo_key = _validator_cache_key(schematron, None, None, None)
+    memo = _SCHEMATRON_KEYS.get(memo_key)
+    if memo is not None:
+        key, included_stats = memo
+        if _file_stats(path for path, _, _ in included_stats) == included_stats:
+            return key
+
+    if os.path.isfile(schematron):
+        with open(schematron, 'rb') as f:
+            content = f.read()
+    else:
+        content = schematron.encode('utf-8')
+    hasher = hashlib.sha256()
+    hasher.update(f'{RESULT_CACHE_FORMAT_VERSION}|{CACHE_FORMAT_VERSION}|{etree.LXML_VERSION}|{etree.LIBXML_VERSION}|{etree.LIBXSLT_VERSION}|'.encode('utf-8'))
+    hasher.update(content)
+    included = set()
+    if b'include' in content or b'extends' in content:
+        _hash_includes(_parse_schematron(schematron), hasher, included)
+    key = hasher.hexdigest()
+    _SCHEMATRON_KEYS[memo_key] = (key, _file_stats(included))
+    return key
+
+
+class _Relocator:
+    """
+    Finds the failed elements of a cached result in a document which only has
+    the same canonical form as the one the result was cached for
+    """
+
+    def __init__(self, document):
+        self._document = document
+        self._document_tree = None
+        self._namespaces = None
+
+    def resolve(self, line, element, location):
+        """
+        :returns: (int, str, str), line, element name and location of the failed element
+        """
+        if location is None:
+            return line, element, location
+        if self._document_tree is None:
+            self._document_tree = _parse_document(self._document)
+            # locations use the prefixes of the document, which are the same as the cached document's
+            self._namespaces = {
+                prefix: uri
+                for node in self._document_tree.iter(etree.Element)
+                for prefix, uri in node.nsmap.items()
+                if prefix is not None
+            }
+        try:
+            failed_element = self._document_tree.xpath(location, namespaces=self._namespaces)[0]
+        except (IndexError, etree.XPathError):
+            return line, element, location
+        return failed_element.sourceline, element, location
+
+
+class ResultCache:
+    """
+    Cache of validation results in a directory, one json file per result
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE, max_age=DEFAULT_MAX_AGE):
+        """
+        :param cache_dir: str | None, defaults to get_result_cache_dir()
+        :param max_size: int, maximum total size of the cached results in bytes
+        :param max_age: float, seconds after its last use a result is removed
+        """
+        self.cache_dir = cache_dir or get_result_cache_dir()
+        self.max_size = max_size
+        self.max_age = max_age
+        self._num_stored = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def key(self, schematron, document_bytes, phase=None, strict_context=False, engine=ENGINE_XSLT):
+        """
+        :param schematron: str, path to sch file or string containing schematron xml
+        :param document_bytes: bytes
+        :param phase: str | list of str | None
+        :param strict_context: bool
+        :param engine: str
+        :returns: str
+        """
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps([
+            schematron_key(schematron),
+            document_hash(document_bytes),
+            phase,
+            strict_context,
+            engine,
+        ]).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def load(self, key):
+        """
+        :param key: str
+        :returns: dict | None, the cached entry, None if there is none
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(f.read())
+            # the modification time tracks when the entry was last used, see evict
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def store(self, key, document_sha256, failures):
+        """
+        Stores the failures of a document. Failing to write the cache is not an
+        error, the document will just be validated again next time.
+
+        :param key: str
+        :param document_sha256: str | None, hash of the bytes of the document, None if its line numbers do not refer to them
+        :param failures: list of Failure
+        """
+        entry = {
+            'document_sha256': document_sha256,
+            'failures': [[*failure, failure.context] for failure in failures],
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError:
+            return
+
+        if self._num_stored % EVICT_INTERVAL == 0:
+            self.evict()
+        self._num_stored += 1
+
+    def evict(self):
+        """
+        Removes results not used within max_age, then the least recently used
+        results until the cache is no larger than max_size. Temporary files left
+        by stores which never finished (e.g. the process was killed) are removed
+        once they are STALE_TMP_AGE old.
+
+        :returns: int, number of results removed
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return 0
+
+        now = time.time()
+        entries = []
+        num_removed = 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                try:
+                    if now - os.stat(path).st_mtime > STALE_TMP_AGE:
+                        os.remove(path)
+                        num_removed += 1
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                    num_removed += 1
+                    continue
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            num_removed += 1
+        return num_removed
+
+    def validate(self, schematron, document, phase=None, strict_context=False, engine=ENGINE_XSLT, aggregate=False):
+        """
+        Validates the document, or returns the cached failures of a document
+        with the same canonical form
+
+        :param schematron: str, path to sch file or string containing schematron xml
+        :param document: str | bytes | file | etree._ElementTree | etree._Element, see tools.validate_sch.Validator.validate
+        :param phase: str | list of str | None, see tools.validate_sch._split_phase_selection
+        :param strict_context: bool, if True unfired rules are reported as failures
+        :param engine: str, see tools.validate_sch.get_validator
+        :param aggregate: bool, if True the failures are grouped, see tools.validate_sch.aggregate_failures
+        :returns: Failure[], or FailureGroup[] if aggregate is True
+        """
+        is_tree = isinstance(document, (etree._ElementTree, etree._Element))
+        document_bytes = _document_bytes(document)
+        if not is_tree:
+            # validate the bytes read, a file object can only be read once
+            document = document_bytes
+        # line numbers of trees refer to wherever they were parsed from
+        document_sha256 = None if is_tree else hashlib.sha256(document_bytes).hexdigest()
+        key = self.key(schematron, document_bytes, phase, strict_context, engine)
+
+        entry = self.load(key)
+        if entry is not None:
+            relocator = None
+            if document_sha256 is None or entry['document_sha256'] != document_sha256:
+                relocator = _Relocator(document)
+            failures = []
+            for line, element, message, role, location, test, context in entry['failures']:
+                if relocator is None:
+                    failures.append(Failure(line, element, message, role, location, test, context))
+                else:
+                    failures.append(Failure(
+                        message=message,
+                        role=role,
+                        test=test,
+                        context=context,
+                        resolve=functools.partial(relocator.resolve, line, element, location),
+                    ))
+        else:
+            compiled_phase, phases = _split_phase_selection(phase)
+            validator = get_validator(schematron, phase=compiled_phase, engine=engine)
+            # cached with the context of every failure, so they can be aggregated later
+            failures = list(validator._iter_validate(document, strict_context=strict_context, phases=phases, with_context=True))
+            self.store(key, document_sha256, failures)
+
+        if aggregate:
+            return aggregate_failures(failures)
+        return failures
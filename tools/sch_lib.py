@@ -0,0 +1,112 @@
+import copy
+import os
+import threading
+
+from lxml import etree, isoschematron
+
+from .constants import BSYNC_NSMAP, SCH_NS
+
+# id of the phase of schematron assembled by SchematronLibrary.schema
+LIBRARY_PHASE = 'Tests'
+
+
+class SchematronLibrary:
+    """
+    Assembles schematron from the patterns of the library files (e.g.
+    schematron/lib/floorElements.sch) in memory. Each library file is parsed once
+    and each abstract pattern is instantiated once for a given set of parameters,
+    so schematron built from the same patterns are identical strings, which
+    tools.validate_sch.get_validator and the on-disk compile cache then reuse
+    without reading the library files or expanding anything again.
+    """
+
+    def __init__(self, lib_dir):
+        """
+        :param lib_dir: str, directory of the library files
+        """
+        self.lib_dir = lib_dir
+        self._lock = threading.Lock()
+        # {filename: {pattern id: pattern element}}
+        self._files = {}
+        # {(filename, pattern id, params): expanded pattern element}
+        self._instances = {}
+
+    def _patterns(self, filename):
+        """
+        :param filename: str, library file name, relative to lib_dir
+        :returns: dict, {pattern id: pattern element}
+        """
+        patterns = self._files.get(filename)
+        if patterns is None:
+            tree = etree.parse(os.path.join(self.lib_dir, filename))
+            tree = isoschematron.iso_dsdl_include(tree)
+            patterns = {
+                pattern.get('id'): pattern
+                for pattern in tree.getroot().iterchildren(f'{{{SCH_NS}}}pattern')
+            }
+            self._files[filename] = patterns
+        return patterns
+
+    def _pattern(self, filename, pattern_id):
+        pattern = self._patterns(filename).get(pattern_id)
+        if pattern is None:
+            raise Exception(f'Found no pattern with id "{pattern_id}" in {filename}')
+        return pattern
+
+    def pattern(self, filename, pattern_id):
+        """
+        Returns a (concrete) pattern of a library file
+
+        :param filename: str, library file name, e.g. "id.sch"
+        :param pattern_id: str
+        :returns: etree._Element, a copy of the pattern
+        """
+        with self._lock:
+            return copy.deepcopy(self._pattern(filename, pattern_id))
+
+    def instantiate(self, filename, pattern_id, params, instance_id=None):
+        """
+        Returns the abstract pattern of a library file instantiated with the
+        parameters, as iso_abstract_expand would for
+        <pattern id="instance_id" is-a="pattern_id"><param .../></pattern>
+
+        :param filename: str, library file name, e.g. "floorElements.sch"
+        :param pattern_id: str, id of the abstract pattern
+        :param params: dict, parameter names to their values
+        :param instance_id: str | None, id of the instantiated pattern, defaults to "inst.<pattern_id>"
+        :returns: etree._Element, a copy of the expanded pattern
+        """
+        if instance_id is None:
+            instance_id = f'inst.{pattern_id}'
+        key = (filename, pattern_id, tuple(sorted(params.items())), instance_id)
+        with self._lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                schema = etree.Element(f'{{{SCH_NS}}}schema', nsmap={None: SCH_NS})
+                pattern = etree.SubElement(schema, f'{{{SCH_NS}}}pattern', id=instance_id)
+                pattern.set('is-a', pattern_id)
+                for name, value in params.items():
+                    etree.SubElement(pattern, f'{{{SCH_NS}}}param', name=name, value=value)
+                schema.append(copy.deepcopy(self._pattern(filename, pattern_id)))
+                expanded = isoschematron.iso_abstract_expand(etree.ElementTree(schema))
+                instance = expanded.getroot().find(f'{{{SCH_NS}}}pattern[@id="{instance_id}"]')
+                self._instances[key] = instance
+            return copy.deepcopy(instance)
+
+    def schema(self, patterns, phase=LIBRARY_PHASE):
+        """
+        Builds a schematron running the patterns in a single phase
+
+        :param patterns: list of etree._Element, from pattern or instantiate
+        :param phase: str, id of the phase activating every pattern
+        :returns: str, schematron xml
+        """
+        schema = etree.Element(f'{{{SCH_NS}}}schema', nsmap={None: SCH_NS})
+        for prefix, uri in BSYNC_NSMAP.items():
+            etree.SubElement(schema, f'{{{SCH_NS}}}ns', prefix=prefix, uri=uri)
+        phase_elem = etree.SubElement(schema, f'{{{SCH_NS}}}phase', id=phase)
+        for pattern in patterns:
+            etree.SubElement(phase_elem, f'{{{SCH_NS}}}active', pattern=pattern.get('id'))
+        for pattern in patterns:
+            schema.append(pattern)
+        return etree.tostring(schema, encoding='unicode')
@@ -0,0 +1,301 @@
+import json
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from lxml import etree
+
+from .validate_sch import Validator
+
+
+def _is_within(path, directory):
+    return os.path.commonpath([os.path.abspath(path), os.path.abspath(directory)]) == os.path.abspath(directory)
+
+
+class ValidatorRegistry:
+    """
+    Keeps a compiled Validator for every schematron under a directory, which runs
+    any selection of its phases without being recompiled, recompiling them when a
+    schematron or any file under the lib directory changes on disk.
+
+    Schematrons are identified by their path relative to the base directory, e.g.
+    "v2.2.0/v2-2-0_L200_Audit.sch".
+    """
+
+    def __init__(self, base_dir, lib_dir=None):
+        """
+        :param base_dir: str, directory to search for schematron files
+        :param lib_dir: str | None, directory of included schematron which is not validated against, defaults to base_dir/lib
+        """
+        self.base_dir = base_dir
+        self.lib_dir = lib_dir if lib_dir is not None else os.path.join(base_dir, 'lib')
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        # {schematron name: Validator}
+        self._validators = {}
+        # {schematron name: error message}, for schematron which failed to compile
+        self._errors = {}
+        self._mtimes = {}
+
+    def _find_files(self):
+        """
+        :returns: (dict, dict), schematron names to paths, and lib file paths to mtimes
+        """
+        schematrons = {}
+        lib_mtimes = {}
+        for root, _, files in os.walk(self.base_dir):
+            for name in files:
+                if not name.endswith('.sch'):
+                    continue
+                path = os.path.join(root, name)
+                if _is_within(path, self.lib_dir):
+                    lib_mtimes[path] = os.stat(path).st_mtime_ns
+                else:
+                    schematrons[os.path.relpath(path, self.base_dir).replace(os.sep, '/')] = path
+        return schematrons, lib_mtimes
+
+    def _load(self, name, path):
+        mtime = os.stat(path).st_mtime_ns
+        try:
+            validator = Validator(path)
+        except Exception as e:
+            print(f'WARNING: failed to compile {path}: {e}')
+            with self._lock:
+                self._validators.pop(name, None)
+                self._errors[name] = str(e)
+                self._mtimes[path] = mtime
+            return
+
+        with self._lock:
+            self._validators[name] = validator
+            self._errors.pop(name, None)
+            self._mtimes[path] = mtime
+
+    def warm_up(self):
+        """
+        Compiles every schematron, then marks the registry as ready
+        """
+        schematrons, lib_mtimes = self._find_files()
+        for name, path in sorted(schematrons.items()):
+            self._load(name, path)
+        with self._lock:
+            self._mtimes.update(lib_mtimes)
+        self.ready.set()
+
+    def reload_changed(self):
+        """
+        Recompiles schematrons which were added or modified since they were last
+        compiled. If a lib file changed, all schematrons are recompiled.
+
+        :returns: list of str, names of recompiled schematrons
+        """
+        schematrons, lib_mtimes = self._find_files()
+        with self._lock:
+            lib_changed = any(self._mtimes.get(path) != mtime for path, mtime in lib_mtimes.items())
+            removed = [name for name in self._validators if name not in schematrons]
+            for name in removed:
+                del self._validators[name]
+
+        reloaded = []
+        for name, path in sorted(schematrons.items()):
+            if lib_changed or self._mtimes.get(path) != os.stat(path).st_mtime_ns:
+                self._load(name, path)
+                reloaded.append(name)
+
+        with self._lock:
+            self._mtimes.update(lib_mtimes)
+        return reloaded
+
+    def watch(self, interval, stop_event):
+        """
+        Polls for changed schematron every interval seconds until stop_event is set
+
+        :param interval: float, seconds
+        :param stop_event: threading.Event
+        """
+        while not stop_event.wait(interval):
+            for name in self.reload_changed():
+                print(f'INFO: recompiled {name}')
+
+    def get(self, name, phases=None):
+        """
+        :param name: str, schematron name relative to the base directory
+        :param phases: str | list of str | None, phases which will be selected when validating, see Validator.validate
+        :returns: Validator
+        :raises KeyError: if the schematron or a phase does not exist
+        :raises Exception: if the schematron failed to compile
+        """
+        with self._lock:
+            if name in self._errors:
+                raise Exception(f'Schematron "{name}" failed to compile: {self._errors[name]}')
+            validator = self._validators[name]
+        for phase in [phases] if isinstance(phases, str) else phases or []:
+            if phase not in validator.phases:
+                raise KeyError(phase)
+        return validator
+
+    def describe(self):
+        """
+        :returns: dict, schematron names to their list of phases
+        """
+        with self._lock:
+            return {
+                name: validator.phases
+                for name, validator in sorted(self._validators.items())
+            }
+
+
+class ValidationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+        GET /health      200 once the server is running
+        GET /ready       200 once all schematron are compiled, 503 before
+        GET /schematron  available schematron names and their phases
+        POST /validate?schematron=<name>[&phase=<id>...][&strict=true]
+                         body is the BuildingSync xml, responds with the failures
+    """
+
+    # set on the subclass created by make_server
+    registry = None
+    semaphore = None
+    request_timeout = None
+
+    def address_string(self):
+        # unix socket clients have no address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def _send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/ready':
+            ready = self.registry.ready.is_set()
+            self._send_json(200 if ready else 503, {'ready': ready})
+        elif path == '/schematron':
+            self._send_json(200, self.registry.describe())
+        else:
+            self._send_json(404, {'error': f'Unknown path: {path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/validate':
+            self._send_json(404, {'error': f'Unknown path: {url.path}'})
+            return
+
+        query = parse_qs(url.query)
+        name = query.get('schematron', [None])[0]
+        # phase may be repeated to run several phases in one pass
+        phases = query.get('phase')
+        strict_context = query.get('strict', ['false'])[0].lower() == 'true'
+        if name is None:
+            self._send_json(400, {'error': 'Missing required query parameter "schematron"'})
+            return
+
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self._send_json(411, {'error': 'Content-Length is required'})
+            return
+        document = self.rfile.read(length)
+
+        if not self.semaphore.acquire(timeout=self.request_timeout):
+            self._send_json(503, {'error': 'Too many concurrent validations, try again later'})
+            return
+        try:
+            try:
+                validator = self.registry.get(name, phases)
+            except KeyError:
+                self._send_json(404, {'error': f'Unknown schematron "{name}" or phase "{", ".join(phases or [])}"'})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+
+            try:
+                failures = validator.validate(document, strict_context=strict_context, phases=phases)
+                # built while the semaphore is held, as converting a failure locates its element
+                content = {
+                    'num_errors': sum(1 for f in failures if f.role == 'ERROR'),
+                    'failures': [dict(f._asdict()) for f in failures],
+                }
+            except etree.XMLSyntaxError as e:
+                self._send_json(400, {'error': f'Invalid xml: {e}'})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+        finally:
+            self.semaphore.release()
+
+        self._send_json(200, content)
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(registry, host='127.0.0.1', port=8080, socket_path=None, max_concurrency=4, request_timeout=30):
+    """
+    Creates the validation server. Call serve_forever() on the result to run it.
+
+    :param registry: ValidatorRegistry
+    :param host: str
+    :param port: int
+    :param socket_path: str | None, if given the server listens on this unix socket instead of host and port
+    :param max_concurrency: int, maximum number of documents validated at once
+    :param request_timeout: float, seconds a request waits for a free validation slot before getting a 503
+    :returns: socketserver.BaseServer
+    """
+    handler = type('Handler', (ValidationRequestHandler,), {
+        'registry': registry,
+        'semaphore': threading.BoundedSemaphore(max_concurrency),
+        'request_timeout': request_timeout,
+    })
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return _ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(base_dir, host='127.0.0.1', port=8080, socket_path=None, max_concurrency=4, reload_interval=2.0):
+    """
+    Runs the validation server until interrupted. Schematron are compiled in the
+    background; /ready reports when that has finished.
+
+    :param base_dir: str, directory to search for schematron files
+    :param reload_interval: float, seconds between checks for modified schematron; 0 disables reloading
+    """
+    registry = ValidatorRegistry(base_dir)
+    server = make_server(registry, host=host, port=port, socket_path=socket_path, max_concurrency=max_concurrency)
+    stop_event = threading.Event()
+
+    def warm_up_and_watch():
+        registry.warm_up()
+        print('INFO: all schematron compiled, server is ready')
+        if reload_interval > 0:
+            registry.watch(reload_interval, stop_event)
+
+    threading.Thread(target=warm_up_and_watch, daemon=True).start()
+    print(f'INFO: listening on {socket_path or f"http://{host}:{port}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
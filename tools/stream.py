@@ -0,0 +1,80 @@
+import json
+import re
+
+from .validate_sch import get_validator, ENGINE_XSLT, _split_phase_selection
+
+# a line consisting only of a byte count announces an xml payload of that many bytes
+_PAYLOAD_HEADER = re.compile(rb'^\d+$')
+
+
+def _read_documents(instream):
+    """
+    Reads documents from the stream. Each line is either the path to a document,
+    or a byte count followed by a newline and that many bytes of xml. A line of
+    only digits is always a byte count, a path made only of digits has to be
+    given as ./<path>.
+
+    :param instream: binary file object
+    :returns: generator of (str, str | bytes), name of the document and the path or xml bytes
+    """
+    num_payloads = 0
+    while True:
+        line = instream.readline()
+        if not line:
+            return
+        line = line.strip()
+        if not line:
+            continue
+        if _PAYLOAD_HEADER.match(line):
+            size = int(line)
+            payload = instream.read(size)
+            if len(payload) != size:
+                raise EOFError(f'Expected payload of {size} bytes but stream ended after {len(payload)} bytes')
+            num_payloads += 1
+            yield f'<stdin:{num_payloads}>', payload
+        else:
+            yield line.decode('utf-8'), line.decode('utf-8')
+
+
+def run_stream(schematron, instream, outstream, phase=None, strict_context=False, engine=ENGINE_XSLT):
+    """
+    Validates documents read from instream until it is exhausted, writing one json
+    object per line to outstream for each document. The compiled schematron is
+    reused for every document.
+
+    Each output line is of the form
+    {"document": str, "num_errors": int, "failures": [{"line", "element", "message", "role", "location", "test"}, ...]}
+    or, if the document could not be validated,
+    {"document": str, "error": str}
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param instream: binary file object, see _read_documents for its format
+    :param outstream: text file object
+    :param phase: str | list of str | None, id of the phase, or ids of several phases, to run, see tools.validate_sch._split_phase_selection
+    :param strict_context: bool, report rules that were not fired as failures
+    :param engine: str, see tools.validate_sch.get_validator
+    :returns: int, number of documents that had errors or could not be validated
+    """
+    compiled_phase, phases = _split_phase_selection(phase)
+    validator = get_validator(schematron, phase=compiled_phase, engine=engine)
+    num_invalid = 0
+    for name, document in _read_documents(instream):
+        try:
+            failures = validator.validate(document, strict_context=strict_context, phases=phases)
+        except Exception as e:
+            num_invalid += 1
+            result = {'document': name, 'error': str(e)}
+        else:
+            num_errors = sum(1 for f in failures if f.role == 'ERROR')
+            if num_errors > 0:
+                num_invalid += 1
+            result = {
+                'document': name,
+                'num_errors': num_errors,
+                'failures': [dict(f._asdict()) for f in failures],
+            }
+
+        outstream.write(json.dumps(result) + '\n')
+        outstream.flush()
+
+    return num_invalid
@@ -0,0 +1,159 @@
+import copy
+import random
+from collections import defaultdict
+
+from lxml import etree
+
+from .constants import BSYNC_NS, BSYNC_NSMAP
+from .element_locations import ELEMENT_LOCATIONS
+
+# collections which can be scaled, by name, mapped to the path of their items
+COLLECTIONS = {
+    'Sections': 'auc:Section',
+    'HVACSystems': 'auc:HVACSystem',
+    'LightingSystems': 'auc:LightingSystem',
+    'PlugLoads': 'auc:PlugLoad',
+    'TimeSeries': 'auc:TimeSeries',
+    'Utilities': 'auc:Utility',
+    'Measures': 'auc:Measure',
+    'Contacts': 'auc:Contact',
+    'Schedules': 'auc:Schedule',
+}
+
+
+def _collection_items(tree, collection):
+    """
+    :param tree: etree._ElementTree
+    :param collection: str, key of COLLECTIONS
+    :returns: list of etree._Element
+    """
+    if collection not in COLLECTIONS:
+        raise Exception(f'Unknown collection "{collection}", expected one of: {", ".join(COLLECTIONS)}')
+    # the first location is always where the collection itself is stored
+    location = ELEMENT_LOCATIONS[COLLECTIONS[collection]][0]
+    return tree.xpath(location, namespaces=BSYNC_NSMAP)
+
+
+def _index_references(tree):
+    """
+    :returns: dict, {IDref: [elements referencing it]}
+    """
+    references = defaultdict(list)
+    for element in tree.iter(etree.Element):
+        idref = element.get('IDref')
+        if idref:
+            references[idref].append(element)
+    return references
+
+
+def _rename_ids(element, suffix, used_ids):
+    """
+    Gives every ID in element (and its descendants) a new unique value by adding
+    the suffix, and updates references within element to match.
+
+    :param element: etree._Element, modified in place
+    :param suffix: str
+    :param used_ids: set, IDs already in the document, new IDs are added to it
+    :returns: dict, {old ID: new ID}
+    """
+    renamed = {}
+    for descendant in element.iter(etree.Element):
+        old_id = descendant.get('ID')
+        if not old_id:
+            continue
+        new_id = f'{old_id}-{suffix}'
+        i = 2
+        while new_id in used_ids:
+            new_id = f'{old_id}-{suffix}-{i}'
+            i += 1
+        used_ids.add(new_id)
+        descendant.set('ID', new_id)
+        renamed[old_id] = new_id
+
+    for descendant in element.iter(etree.Element):
+        idref = descendant.get('IDref')
+        if idref in renamed:
+            descendant.set('IDref', renamed[idref])
+
+    return renamed
+
+
+def scale_collection(tree, collection, factor, seed=0):
+    """
+    Adds copies of the items of a collection until it has factor times as many
+    items. Every copy (including its descendants) gets new IDs, and every
+    reference to an original item from outside of it is duplicated for the copy,
+    so the copies are linked to the rest of the document in the same way as the
+    item they were copied from.
+
+    :param tree: etree._ElementTree, modified in place
+    :param collection: str, key of COLLECTIONS
+    :param factor: float, >= 1
+    :param seed: int, for choosing which items to copy when factor is not a whole number
+    :returns: int, number of items added
+    """
+    if factor < 1:
+        raise Exception(f'Scale factor must be at least 1, got {factor}')
+    items = _collection_items(tree, collection)
+    if not items:
+        return 0
+
+    num_copies = round(len(items) * factor) - len(items)
+    # every item is copied the same number of times, the remainder is spread over randomly chosen items
+    sources = items * (num_copies // len(items))
+    sources += random.Random(seed).sample(items, num_copies % len(items))
+
+    used_ids = set(tree.xpath('//@ID'))
+    references = _index_references(tree)
+    copy_counts = defaultdict(int)
+    # copies are added after the last item of the same parent
+    last_in_parent = {}
+    for item in items:
+        last_in_parent[item.getparent()] = item
+
+    for source in sources:
+        copy_counts[source] += 1
+        item_copy = copy.deepcopy(source)
+        item_copy.tail = source.tail
+        renamed = _rename_ids(item_copy, f'copy{copy_counts[source]}', used_ids)
+
+        parent = source.getparent()
+        last_in_parent[parent].addnext(item_copy)
+        last_in_parent[parent] = item_copy
+
+        for old_id, new_id in renamed.items():
+            for reference in references.get(old_id, []):
+                if reference is source or source in reference.iterancestors():
+                    continue
+                reference_copy = copy.deepcopy(reference)
+                reference_copy.tail = reference.tail
+                _rename_ids(reference_copy, f'copy{copy_counts[source]}', used_ids)
+                reference_copy.set('IDref', new_id)
+                reference.addnext(reference_copy)
+
+    return len(sources)
+
+
+def generate_document(source, scales, seed=0):
+    """
+    Generates a synthetic BuildingSync document by scaling collections of the
+    source document. The result only depends on the source, scales and seed.
+
+    :param source: str | etree._ElementTree, path to the source document (e.g. one of the exemplary files or templates/BuildingSync_template_L100.xml) or its tree
+    :param scales: dict, {collection name: factor}, see COLLECTIONS for the names
+    :param seed: int
+    :returns: etree._ElementTree, a new tree
+    """
+    if isinstance(source, etree._ElementTree):
+        tree = copy.deepcopy(source)
+    else:
+        tree = etree.parse(source)
+
+    if tree.getroot().tag != f'{{{BSYNC_NS}}}BuildingSync':
+        raise Exception(f'Expected a BuildingSync document, found root element {tree.getroot().tag}')
+
+    # scale in a fixed order so the output does not depend on the order of scales
+    for i, collection in enumerate(sorted(scales)):
+        scale_collection(tree, collection, scales[collection], seed=seed + i)
+
+    return tree
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def simple_valid_doc_content():
+    return '''<root>
+        <child attr="hello"/>
+    </root>'''
+
+
+@pytest.fixture
+def simple_bad_doc_content():
+    return '''<root>
+        <child attr="world"/>
+    </root>'''
+
+
+@pytest.fixture
+def simple_sch_content():
+    return '''
+    <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:pattern>
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def simple_phased_sch_content():
+    """
+    simple_sch_content with its pattern active in the phase phaseA
+    """
+    return '''
+    <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:phase id="phaseA">
+            <sch:active pattern="patternA"/>
+        </sch:phase>
+        <sch:pattern id="patternA">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def write_file(tmpdir):
+    """
+    Writes files in tmpdir, creating the directories they are in
+
+    :returns: function(name, content) -> str, writes content (str | bytes) to the
+        file at name (relative to tmpdir) and returns the path of the file
+    """
+    def write(name, content):
+        path = os.path.join(tmpdir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        return path
+
+    return write
@@ -0,0 +1,184 @@
+import os
+
+import pytest
+from lxml import etree
+
+from tools.batch import validate_documents, validate_many, validate_phases_parallel, _in_input_order, _phases_in_pattern_order
+from tools.validate_sch import validate_schematron, get_validator, clear_validator_cache, ENGINE_XPATH, _VALIDATOR_CACHE
+
+L200_AUDIT_SCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron', 'v2.2.0', 'v2-2-0_L200_Audit.sch')
+
+
+@pytest.fixture
+def phased_sch_content():
+    return '''
+    <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:phase id="children">
+            <sch:active pattern="child_attr"/>
+            <sch:active pattern="child_count"/>
+        </sch:phase>
+        <sch:phase id="other">
+            <sch:active pattern="other_exists"/>
+        </sch:phase>
+        <sch:pattern id="child_attr">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="child_count">
+            <sch:rule context="/root">
+                <sch:assert test="count(child) &lt; 3" role="WARNING">Too many children</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="other_exists">
+            <sch:rule context="/root/child">
+                <sch:assert test="true()">never fails</sch:assert>
+            </sch:rule>
+            <sch:rule context="/root/other">
+                <sch:assert test="true()">never fails</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def document_paths(write_file):
+    paths = []
+    for i in range(6):
+        # vary the size and the number of failing children of each document
+        children = ''.join(['<child attr="world"/>'] * i + ['<child attr="hello"/>'] * (10 * (6 - i)))
+        paths.append(write_file(f'doc{i}.xml', f'<root>{children}</root>'))
+    return paths
+
+
+class TestValidateDocuments:
+    def test_in_input_order_reorders_results(self):
+        # -- Act
+        result = list(_in_input_order([(2, 'c'), (0, 'a'), (3, 'd'), (1, 'b')]))
+
+        # -- Assert
+        assert result == [(0, 'a'), (1, 'b'), (2, 'c'), (3, 'd')]
+
+    def test_parallel_results_match_sequential_results_in_input_order(self, simple_sch_content, document_paths):
+        # -- Setup
+        expected = [validate_schematron(simple_sch_content, doc) for doc in document_paths]
+
+        # -- Act
+        results = list(validate_documents(simple_sch_content, document_paths, jobs=3))
+
+        # -- Assert
+        assert [doc for doc, _ in results] == document_paths
+        assert [failures for _, failures in results] == expected
+        assert [len(failures) for _, failures in results] == list(range(6))
+
+    def test_parallel_aggregated_results_match_sequential_results(self, simple_sch_content, document_paths):
+        # -- Setup
+        expected = [validate_schematron(simple_sch_content, doc, aggregate=True) for doc in document_paths]
+
+        # -- Act
+        results = list(validate_documents(simple_sch_content, document_paths, jobs=3, aggregate=True))
+
+        # -- Assert
+        assert [groups for _, groups in results] == expected
+        assert [sum(group.count for group in groups) for _, groups in results] == list(range(6))
+
+    def test_result_path_contains_report_of_last_document(self, tmpdir, simple_sch_content, document_paths):
+        # -- Setup
+        result_path = os.path.join(tmpdir, 'result.svrl')
+
+        # -- Act
+        list(validate_documents(simple_sch_content, document_paths, jobs=2, result_path=result_path))
+
+        # -- Assert
+        with open(result_path) as f:
+            assert f.read().count('failed-assert ') == 5
+
+
+class TestValidateMany:
+    def test_accepts_paths_bytes_files_and_trees(self, simple_sch_content, document_paths):
+        # -- Setup
+        with open(document_paths[1], 'rb') as f:
+            content = f.read()
+        documents = [
+            document_paths[1],
+            content,
+            open(document_paths[1], 'rb'),
+            etree.parse(document_paths[1]),
+            etree.fromstring(content),
+        ]
+
+        # -- Act
+        results = list(validate_many(simple_sch_content, documents))
+
+        # -- Assert
+        assert [doc for doc, _ in results] == documents
+        assert [len(failures) for _, failures in results] == [1] * len(documents)
+        documents[2].close()
+
+    def test_parallel_yields_every_document(self, simple_sch_content, document_paths):
+        # -- Setup
+        documents = (path for path in document_paths)
+
+        # -- Act
+        results = dict(validate_many(simple_sch_content, documents, jobs=2))
+
+        # -- Assert
+        assert {doc: len(failures) for doc, failures in results.items()} == {doc: i for i, doc in enumerate(document_paths)}
+
+
+class TestValidatePhasesParallel:
+    @pytest.mark.parametrize('strict_context', [False, True])
+    def test_results_match_single_pass(self, phased_sch_content, document_paths, strict_context):
+        # -- Setup
+        expected = validate_schematron(phased_sch_content, document_paths[3], strict_context=strict_context)
+
+        # -- Act
+        failures = validate_phases_parallel(phased_sch_content, document_paths[3], jobs=2, strict_context=strict_context)
+
+        # -- Assert
+        assert failures == expected
+        assert [f.message for f in failures if f.line == 0] == (['Rule was NOT used for validation: /root/other'] if strict_context else [])
+
+    def test_schematron_is_only_compiled_by_the_workers(self, phased_sch_content, document_paths):
+        # -- Setup
+        clear_validator_cache()
+
+        # -- Act
+        validate_phases_parallel(phased_sch_content, document_paths[3], jobs=2)
+
+        # -- Assert
+        assert len(_VALIDATOR_CACHE) == 0
+
+    def test_phases_are_in_pattern_order(self, phased_sch_content):
+        # -- Act
+        phases = _phases_in_pattern_order(get_validator(phased_sch_content).schematron_tree)
+
+        # -- Assert
+        assert phases == ['children', 'other']
+
+    def test_schematron_with_patterns_outside_of_phases_is_not_split(self, simple_sch_content, document_paths):
+        # -- Act
+        phases = _phases_in_pattern_order(get_validator(simple_sch_content).schematron_tree)
+        failures = validate_phases_parallel(simple_sch_content, document_paths[2], jobs=2)
+
+        # -- Assert
+        assert phases is None
+        assert len(failures) == 2
+
+    @pytest.mark.parametrize('engine', ['xslt', ENGINE_XPATH])
+    def test_l200_audit_matches_single_pass(self, engine):
+        # -- Setup
+        document = os.path.join(os.path.dirname(L200_AUDIT_SCH), 'exemplary_files', 'L200_Audit.xml')
+        tree = etree.parse(document)
+        # break some references so there are failures from several phases
+        for element in tree.xpath('//*[@IDref]')[::4]:
+            element.set('IDref', 'missing')
+        content = etree.tostring(tree)
+        expected = get_validator(L200_AUDIT_SCH, engine=engine).validate(content, strict_context=True)
+
+        # -- Act
+        failures = validate_phases_parallel(L200_AUDIT_SCH, content, jobs=3, strict_context=True, engine=engine)
+
+        # -- Assert
+        assert len(expected) > 0
+        assert failures == expected
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from tools.benchmark import benchmark_schematron, compare_results, format_comparison, BENCHMARK_FORMAT_VERSION
+
+V2_2_0_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron', 'v2.2.0')
+
+
+def results(**times):
+    return {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'benchmarks': {name: {'min': t, 'median': t} for name, t in times.items()},
+    }
+
+
+class TestBenchmark:
+    def test_benchmark_schematron_times_each_scale(self):
+        # -- Act
+        result = benchmark_schematron(
+            os.path.join(V2_2_0_DIR, 'v2-2-0_L100_Audit.sch'),
+            os.path.join(V2_2_0_DIR, 'exemplary_files', 'L100_Audit.xml'),
+            scales=[1, 2],
+            repeat=1
+        )
+
+        # -- Assert
+        assert list(result) == ['compile', 'validate/x1', 'extract/x1', 'validate/x2', 'extract/x2']
+        assert result['validate/x2']['bytes'] > result['validate/x1']['bytes']
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        # -- Setup
+        baseline = results(a=1.0, b=1.0, c=0.001, removed=1.0)
+        current = results(a=1.1, b=1.5, c=0.002, added=1.0)
+
+        # -- Act
+        comparison = compare_results(baseline, current, threshold=0.2)
+
+        # -- Assert
+        assert {c['name']: c['regression'] for c in comparison} == {
+            'a': False,
+            'b': True,
+            # twice as slow, but within the noise
+            'c': False,
+        }
+        assert 'REGRESSION' in format_comparison(comparison)
+
+    def test_compare_rejects_other_format_versions(self):
+        # -- Setup
+        baseline = dict(results(a=1.0), version=BENCHMARK_FORMAT_VERSION - 1)
+
+        # -- Act / Assert
+        with pytest.raises(Exception, match='record a new baseline'):
+            compare_results(baseline, results(a=1.0))
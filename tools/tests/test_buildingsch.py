@@ -0,0 +1,84 @@
+import pytest
+
+import buildingsch
+from tools import validate_sch
+from tools.validate_sch import clear_validator_cache
+
+SCH_CONTENT = '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+    <sch:phase id="phaseA">
+        <sch:active pattern="patternA"/>
+    </sch:phase>
+    <sch:phase id="phaseB">
+        <sch:active pattern="patternB"/>
+    </sch:phase>
+    <sch:pattern id="patternA">
+        <sch:rule context="/root/child">
+            <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+        </sch:rule>
+    </sch:pattern>
+    <sch:pattern id="patternB">
+        <sch:rule context="/root/child">
+            <sch:assert test="@attr = 'world'" role="ERROR">Attr should be world</sch:assert>
+        </sch:rule>
+    </sch:pattern>
+</sch:schema>'''
+
+
+@pytest.fixture
+def compiled_phases(monkeypatch):
+    """
+    Records the phase of every schematron compiled
+    """
+    phases = []
+    compile_schematron = validate_sch.compile_schematron
+
+    def record_phase(schematron_tree, phase=None, **kwargs):
+        phases.append(phase)
+        return compile_schematron(schematron_tree, phase=phase, **kwargs)
+
+    monkeypatch.setattr(validate_sch, 'compile_schematron', record_phase)
+    clear_validator_cache()
+    yield phases
+    clear_validator_cache()
+
+
+def run_validate(write_file, *options):
+    sch_file = write_file('test.sch', SCH_CONTENT)
+    doc_file = write_file('doc.xml', '<root><child attr="hello"/></root>')
+
+    args = buildingsch.parser.parse_args(['validate', *options, sch_file, doc_file])
+    with pytest.raises(SystemExit) as exit_info:
+        args.func(args)
+    return exit_info.value.code
+
+
+class TestValidateCommand:
+    def test_single_phase_is_compiled_on_its_own(self, write_file, compiled_phases, capsys):
+        # -- Act
+        exit_code = run_validate(write_file, '-p', 'phaseA')
+
+        # -- Assert
+        assert exit_code == 0
+        assert compiled_phases == ['phaseA']
+
+    def test_several_phases_share_one_compile(self, write_file, compiled_phases, capsys):
+        # -- Act
+        exit_code = run_validate(write_file, '-p', 'phaseA', '-p', 'phaseB')
+
+        # -- Assert
+        assert exit_code == 1
+        assert compiled_phases == [None]
+        assert 'Attr should be world' in capsys.readouterr().out
+
+    @pytest.mark.parametrize('option', [['-o', 'result.svrl'], ['-j', '2'], ['--result-cache'], ['--profile'], ['--manifest', 'manifest.jsonl']])
+    def test_stream_rejects_options_it_would_ignore(self, option, capsys):
+        # -- Setup
+        args = buildingsch.parser.parse_args(['validate', '--stream', *option, 'test.sch'])
+
+        # -- Act
+        with pytest.raises(SystemExit) as exit_info:
+            args.func(args)
+
+        # -- Assert
+        assert exit_info.value.code == 2
+        assert '--stream can not be used with' in capsys.readouterr().err
@@ -0,0 +1,99 @@
+import os
+import shutil
+
+import pytest
+from lxml import etree
+
+from tools.catalog import build_catalog, catalog_path, catalog_to_bytes, load_catalog, expected_rules
+from tools.generate_sch import generate_sch
+from tools.validate_sch import Validator
+
+SCHEMATRON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron')
+
+
+@pytest.fixture
+def sch_content():
+    return b'''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:phase id="phaseA">
+            <sch:active pattern="patternA"/>
+        </sch:phase>
+        <sch:phase id="phaseB">
+            <sch:active pattern="patternB"/>
+        </sch:phase>
+        <sch:pattern id="patternA">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="patternB">
+            <sch:rule context="/root/bogus">
+                <sch:assert test="false()">[WARNING] never fired</sch:assert>
+            </sch:rule>
+            <sch:rule context="/root/child">
+                <sch:assert test="true()" role="INFO">shadowed</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def sch_file(write_file, sch_content):
+    path = write_file('test.sch', sch_content)
+    write_file(catalog_path('test.sch'), catalog_to_bytes(build_catalog(etree.parse(path), sch_content)))
+    return path
+
+
+class TestCatalog:
+    def test_lists_phases_patterns_rules_and_asserts(self, sch_content):
+        # -- Act
+        catalog = build_catalog(etree.ElementTree(etree.fromstring(sch_content)))
+
+        # -- Assert
+        assert catalog['phases'] == {'phaseA': ['patternA'], 'phaseB': ['patternB']}
+        assert catalog['patterns'][1] == {
+            'id': 'patternB',
+            'rules': [
+                {'context': '/root/bogus', 'asserts': [{'test': 'false()', 'role': None}]},
+                {'context': '/root/child', 'asserts': [{'test': 'true()', 'role': 'INFO'}]},
+            ],
+        }
+        assert expected_rules(catalog, None) == ['/root/child', '/root/bogus', '/root/child']
+        assert expected_rules(catalog, ['phaseB', 'phaseA']) == ['/root/bogus', '/root/child', '/root/child']
+
+    def test_stale_catalog_is_ignored(self, write_file, sch_file, sch_content):
+        # -- Setup
+        assert load_catalog(sch_file) is not None
+
+        # -- Act
+        write_file('test.sch', sch_content.replace(b'phaseB', b'phaseC'))
+
+        # -- Assert
+        assert load_catalog(sch_file) is None
+
+    def test_validator_uses_catalog_for_strict_context(self, sch_file):
+        # -- Setup
+        validator = Validator(sch_file, use_cache=False)
+
+        # -- Act
+        failures = validator.validate('<root><child attr="world"/></root>', strict_context=True, phases=['phaseA', 'phaseB'])
+
+        # -- Assert
+        assert [f.message for f in failures] == ['Rule was NOT used for validation: /root/bogus', 'Attr should be hello']
+        # the expanded schematron is never needed
+        assert validator._schematron_tree is None
+
+    def test_generate_sch_writes_catalog(self, tmpdir):
+        # -- Setup
+        csv_file = os.path.join(tmpdir, 'v2-2-0_L000_Prelim_Analysis.csv')
+        shutil.copy(os.path.join(SCHEMATRON_DIR, 'v2.2.0', 'v2-2-0_L000_Prelim_Analysis.csv'), csv_file)
+
+        # -- Act
+        generate_sch(csv_file)
+        updated = generate_sch(csv_file, dry_run=True)
+
+        # -- Assert
+        sch_file = csv_file.replace('.csv', '.sch')
+        catalog = load_catalog(sch_file)
+        assert not updated
+        assert catalog is not None
+        assert catalog == load_catalog(os.path.join(SCHEMATRON_DIR, 'v2.2.0', 'v2-2-0_L000_Prelim_Analysis.sch'))
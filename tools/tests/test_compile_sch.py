@@ -0,0 +1,155 @@
+import os
+
+import pytest
+from lxml import etree
+
+from tools import compile_sch
+from tools.compile_sch import compile_schematron, prune_schematron, schematron_hash, CACHE_DIR_ENV, REPORT_LEAN, FIRED_RULES_PARAM
+
+
+@pytest.fixture
+def lib_sch_content():
+    return '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:pattern id="patternA">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def including_sch_tree(tmpdir, lib_sch_content):
+    lib = os.path.join(tmpdir, 'lib.sch')
+    with open(lib, 'w') as f:
+        f.write(lib_sch_content)
+    sch = os.path.join(tmpdir, 'test.sch')
+    with open(sch, 'w') as f:
+        f.write('''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+            <sch:include href="lib.sch#patternA"/>
+        </sch:schema>''')
+    return etree.parse(sch)
+
+
+class TestCompileSchematron:
+    def test_hash_changes_with_phase(self, including_sch_tree):
+        # -- Act, Assert
+        assert schematron_hash(including_sch_tree) != schematron_hash(including_sch_tree, phase='phaseA')
+
+    def test_hash_changes_when_included_file_changes(self, tmpdir, including_sch_tree, lib_sch_content):
+        # -- Setup
+        orig_hash = schematron_hash(including_sch_tree)
+
+        # -- Act
+        with open(os.path.join(tmpdir, 'lib.sch'), 'w') as f:
+            f.write(lib_sch_content.replace("'hello'", "'goodbye'"))
+
+        # -- Assert
+        assert schematron_hash(including_sch_tree) != orig_hash
+
+    def test_compiled_xslt_is_saved_and_reused(self, tmpdir, monkeypatch, including_sch_tree):
+        # -- Setup
+        cache_dir = os.path.join(tmpdir, 'cache')
+        monkeypatch.setenv(CACHE_DIR_ENV, cache_dir)
+        compile_schematron(including_sch_tree)
+        key = schematron_hash(including_sch_tree)
+        assert os.path.isfile(os.path.join(cache_dir, f'{key}.xsl'))
+
+        # make sure the compile pipeline is not run again
+        def fail(*args, **kwargs):
+            raise AssertionError('Expected compiled schematron to be loaded from the cache')
+        monkeypatch.setattr(compile_sch.isoschematron, 'iso_dsdl_include', fail)
+
+        # -- Act
+        validator_xslt = compile_schematron(including_sch_tree)
+
+        # -- Assert
+        doc = etree.fromstring('<root><child attr="world"/></root>')
+        report = etree.XSLT(validator_xslt)(doc)
+        assert len(report.xpath('//svrl:failed-assert', namespaces={'svrl': 'http://purl.oclc.org/dsdl/svrl'})) == 1
+
+    def test_empty_cache_dir_disables_cache(self, tmpdir, monkeypatch, including_sch_tree):
+        # -- Setup
+        monkeypatch.setenv(CACHE_DIR_ENV, '')
+
+        # -- Act
+        compile_schematron(including_sch_tree)
+
+        # -- Assert
+        assert compile_sch.get_cache_dir() is None
+
+    def test_lean_report_only_contains_failed_asserts(self, monkeypatch, including_sch_tree):
+        # -- Setup
+        monkeypatch.setenv(CACHE_DIR_ENV, '')
+        validator = etree.XSLT(compile_schematron(including_sch_tree, report_mode=REPORT_LEAN))
+        doc = etree.fromstring('<root><child attr="world"/><child attr="hello"/></root>')
+
+        # -- Act
+        report = validator(doc)
+        report_with_fired_rules = validator(doc, **{FIRED_RULES_PARAM: 'true()'})
+
+        # -- Assert
+        assert [etree.QName(child).localname for child in report.getroot()] == ['failed-assert']
+        assert [etree.QName(child).localname for child in report_with_fired_rules.getroot()] == ['fired-rule', 'failed-assert', 'fired-rule']
+
+
+class TestPruneSchematron:
+    @pytest.fixture
+    def phased_sch_tree(self, tmpdir, lib_sch_content):
+        lib = os.path.join(tmpdir, 'lib.sch')
+        with open(lib, 'w') as f:
+            f.write(lib_sch_content.replace('<sch:pattern id="patternA">', '<sch:pattern id="patternA" abstract="true">').replace("'hello'", "$value"))
+        sch = os.path.join(tmpdir, 'test.sch')
+        with open(sch, 'w') as f:
+            f.write('''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+                <sch:ns prefix="auc" uri="http://buildingsync.net/schemas/bedes-auc/2019"/>
+                <sch:phase id="hello">
+                    <sch:active pattern="is_hello"/>
+                </sch:phase>
+                <sch:phase id="other">
+                    <sch:active pattern="is_world"/>
+                    <sch:active pattern="one_child"/>
+                </sch:phase>
+                <sch:pattern id="is_hello" is-a="patternA">
+                    <sch:param name="value" value="'hello'"/>
+                </sch:pattern>
+                <sch:pattern id="is_world" is-a="patternA">
+                    <sch:param name="value" value="'world'"/>
+                </sch:pattern>
+                <sch:pattern id="one_child">
+                    <sch:rule context="/root">
+                        <sch:assert test="count(child) = 1">One child</sch:assert>
+                    </sch:rule>
+                </sch:pattern>
+                <sch:include href="lib.sch#patternA"/>
+                <sch:include href="lib.sch#unused"/>
+            </sch:schema>''')
+        return etree.parse(sch)
+
+    def test_only_keeps_what_the_phase_needs(self, phased_sch_tree):
+        # -- Act
+        pruned = prune_schematron(phased_sch_tree, 'hello')
+
+        # -- Assert
+        children = [(etree.QName(child).localname, child.get('id') or child.get('href') or child.get('prefix')) for child in pruned.getroot()]
+        assert children == [('ns', 'auc'), ('phase', 'hello'), ('pattern', 'is_hello'), ('include', 'lib.sch#patternA')]
+        assert pruned.docinfo.URL == phased_sch_tree.docinfo.URL
+        # the original is not modified
+        assert len(phased_sch_tree.getroot()) == 8
+
+    def test_unknown_phase_raises(self, phased_sch_tree):
+        with pytest.raises(Exception, match='Found no phase'):
+            prune_schematron(phased_sch_tree, 'bogus')
+
+    def test_compiled_phase_runs_the_same_rules(self, monkeypatch, phased_sch_tree):
+        # -- Setup
+        monkeypatch.setenv(CACHE_DIR_ENV, '')
+        doc = etree.fromstring('<root><child attr="world"/><child attr="hello"/></root>')
+
+        # -- Act
+        validator_xslt = compile_schematron(phased_sch_tree, phase='other')
+        report = etree.XSLT(validator_xslt)(doc)
+
+        # -- Assert
+        assert len(validator_xslt.xpath('//xsl:template[@match = "/root/child"]', namespaces={'xsl': 'http://www.w3.org/1999/XSL/Transform'})) == 1
+        assert [failure.findtext('{*}text').strip() for failure in report.getroot().iter('{*}failed-assert')] == ['Attr should be hello', 'One child']
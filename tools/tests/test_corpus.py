@@ -0,0 +1,175 @@
+import json
+import os
+
+import pytest
+
+from tools import corpus as corpus_module
+from tools.corpus import find_documents, validate_corpus, Manifest, manifest_settings
+from tools.validate_sch import validate_schematron
+
+
+@pytest.fixture
+def corpus(tmpdir, write_file):
+    """
+    corpus/a.xml, corpus/notes.txt, corpus/sub/b.xml, corpus/sub/deeper/c.xml
+    """
+    for i, name in enumerate(['a.xml', os.path.join('sub', 'b.xml'), os.path.join('sub', 'deeper', 'c.xml')]):
+        write_file(os.path.join('corpus', name), '<root>' + '<child attr="world"/>' * i + '</root>')
+    write_file(os.path.join('corpus', 'notes.txt'), 'not a document')
+    return os.path.join(tmpdir, 'corpus')
+
+
+class TestFindDocuments:
+    def test_walks_directories_recursively(self, corpus):
+        # -- Act
+        documents = find_documents([corpus], recursive=True)
+
+        # -- Assert
+        assert [os.path.relpath(doc, corpus) for doc in documents] == ['a.xml', os.path.join('sub', 'b.xml'), os.path.join('sub', 'deeper', 'c.xml')]
+
+    def test_expands_globs_without_duplicates(self, corpus):
+        # -- Act
+        documents = find_documents([os.path.join(corpus, 'sub', '**', '*.xml'), os.path.join(corpus, 'sub', 'b.xml')])
+
+        # -- Assert
+        assert [os.path.relpath(doc, corpus) for doc in documents] == [os.path.join('sub', 'b.xml'), os.path.join('sub', 'deeper', 'c.xml')]
+
+    def test_directory_requires_recursive(self, corpus):
+        with pytest.raises(Exception, match='use --recursive'):
+            find_documents([corpus])
+
+    def test_glob_without_matches_raises(self, corpus):
+        with pytest.raises(Exception, match='Found no documents matching'):
+            find_documents([os.path.join(corpus, '*.json')])
+
+
+class TestValidateCorpus:
+    def test_only_new_or_changed_documents_are_validated(self, tmpdir, corpus, simple_sch_content):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        first_run = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # c.xml is changed, b.xml is only touched
+        with open(documents[2], 'a') as f:
+            f.write('\n<!-- changed -->')
+        stat = os.stat(documents[1])
+        os.utime(documents[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        # -- Act
+        second_run = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # -- Assert
+        assert [validated for _, _, validated in first_run] == [True, True, True]
+        assert [validated for _, _, validated in second_run] == [False, False, True]
+        assert [failures for _, failures, _ in second_run] == [validate_schematron(simple_sch_content, doc) for doc in documents]
+        with open(manifest_path) as f:
+            # the header and one line per document
+            assert len(f.readlines()) == 4
+
+    def test_interrupted_run_resumes(self, tmpdir, corpus, simple_sch_content):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        results = validate_corpus(simple_sch_content, documents, manifest_path=manifest_path)
+        next(results)
+        next(results)
+        results.close()
+
+        # -- Act
+        resumed = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # -- Assert
+        assert [validated for _, _, validated in resumed] == [False, False, True]
+        assert [len(failures) for _, failures, _ in resumed] == [0, 1, 2]
+
+    def test_manifest_for_other_settings_is_started_over(self, tmpdir, corpus, simple_sch_content):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # -- Act
+        results = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path, strict_context=True))
+
+        # -- Assert
+        assert [validated for _, _, validated in results] == [True, True, True]
+        with open(manifest_path) as f:
+            assert json.loads(f.readline()) == {'settings': manifest_settings(simple_sch_content, strict_context=True)}
+
+    def test_incomplete_last_line_is_ignored(self, tmpdir, corpus, simple_sch_content):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+        with open(manifest_path, 'a') as f:
+            f.write('{"path": "trunc')
+
+        # -- Act
+        manifest = Manifest(manifest_path, manifest_settings(simple_sch_content))
+
+        # -- Assert
+        assert all(manifest.lookup(doc) is not None for doc in documents)
+
+    def test_results_are_recorded_as_soon_as_they_are_finished(self, tmpdir, corpus, simple_sch_content, monkeypatch):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        validate_many = corpus_module.validate_many
+
+        def validate_in_reverse(schematron, changed, **kwargs):
+            # the first document finishes last, as it might with several workers
+            yield from reversed(list(validate_many(schematron, changed, **kwargs)))
+
+        monkeypatch.setattr(corpus_module, 'validate_many', validate_in_reverse)
+        results = validate_corpus(simple_sch_content, documents, manifest_path=manifest_path, jobs=1)
+        next(results)
+        results.close()
+        monkeypatch.undo()
+
+        # -- Act
+        resumed = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path, jobs=2))
+
+        # -- Assert
+        assert [validated for _, _, validated in resumed] == [False, False, False]
+        assert [len(failures) for _, failures, _ in resumed] == [0, 1, 2]
+
+    def test_workers_are_capped_by_the_changed_documents(self, tmpdir, corpus, simple_sch_content, monkeypatch):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        list(validate_corpus(simple_sch_content, documents[:2], manifest_path=manifest_path))
+        validate_many = corpus_module.validate_many
+        jobs_used = []
+
+        def record_jobs(schematron, changed, jobs=1, **kwargs):
+            jobs_used.append(jobs)
+            return validate_many(schematron, changed, jobs=jobs, **kwargs)
+
+        monkeypatch.setattr(corpus_module, 'validate_many', record_jobs)
+
+        # -- Act
+        results = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path, jobs=0))
+
+        # -- Assert
+        assert jobs_used == [1]
+        assert [validated for _, _, validated in results] == [False, False, True]
+
+    def test_invalid_document_is_reported_and_recorded(self, tmpdir, corpus, simple_sch_content):
+        # -- Setup
+        manifest_path = os.path.join(tmpdir, 'manifest.jsonl')
+        documents = find_documents([corpus], recursive=True)
+        with open(documents[1], 'w') as f:
+            f.write('<root>\n<child>')
+        first_run = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # -- Act
+        second_run = list(validate_corpus(simple_sch_content, documents, manifest_path=manifest_path))
+
+        # -- Assert
+        assert [len(failures) for _, failures, _ in first_run] == [0, 1, 2]
+        invalid = first_run[1][1][0]
+        assert (invalid.role, invalid.line) == ('ERROR', 2)
+        assert invalid.message.startswith('Invalid xml: ')
+        assert [validated for _, _, validated in second_run] == [False, False, False]
+        assert second_run[1][1] == [invalid]
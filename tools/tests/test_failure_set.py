@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import pickle
+
+import pytest
+
+from tools.failure_set import FailureSet, CSV_FIELDS
+from tools.validate_sch import Failure, validate_schematron
+
+
+@pytest.fixture
+def failures():
+    return [
+        Failure(line=0, element=None, message='Rule was NOT used for validation: /root/bogus', role='ERROR', location=None, test=None, context='/root/bogus'),
+        Failure(line=2, element='child', message='Attr should be hello', role='ERROR', location='/root/child[1]', test="@attr = 'hello'", context='/root/child'),
+        Failure(line=3, element='child', message='Attr should be hello', role='ERROR', location='/root/child[2]', test="@attr = 'hello'", context='/root/child'),
+        Failure(line=4, element='other', message='Other is odd', role='WARNING', location='/root/other', test='false()', context='/root/other'),
+    ]
+
+
+class TestFailureSet:
+    def test_iterates_as_failures(self, failures):
+        # -- Act
+        failure_set = FailureSet(failures)
+
+        # -- Assert
+        assert len(failure_set) == 4
+        assert failure_set == failures
+        assert list(failure_set) == failures
+        assert failure_set[-1] == failures[-1]
+        assert failure_set[1].context == '/root/child'
+        assert failure_set[1:3] == failures[1:3]
+        with pytest.raises(IndexError):
+            failure_set[4]
+
+    def test_strings_are_interned(self, failures):
+        # -- Act
+        failure_set = FailureSet(failures)
+
+        # -- Assert
+        assert failure_set._pool.strings.count('Attr should be hello') == 1
+        assert failure_set._messages[1] == failure_set._messages[2] != failure_set._messages[0]
+
+    def test_role_counts(self, failures):
+        # -- Act
+        failure_set = FailureSet(failures)
+        failure_set.append(failures[-1])
+
+        # -- Assert
+        assert failure_set.count('ERROR') == 3
+        assert failure_set.count('WARNING') == 2
+        assert failure_set.count('INFO') == 0
+        assert failure_set.role_counts() == {'ERROR': 3, 'WARNING': 2}
+
+    def test_group_by_role_and_message(self, failures):
+        # -- Setup
+        failure_set = FailureSet(failures)
+
+        # -- Act
+        by_role = failure_set.group_by_role()
+        by_message = failure_set.group_by_message()
+
+        # -- Assert
+        assert list(by_role) == ['ERROR', 'WARNING']
+        assert by_role['ERROR'] == failures[:3]
+        assert by_role['WARNING'].count('WARNING') == 1
+        assert by_message['Attr should be hello'] == failures[1:3]
+
+    def test_serializes_to_json_and_csv(self, failures):
+        # -- Setup
+        failure_set = FailureSet(failures)
+
+        # -- Act
+        records = json.loads(failure_set.to_json())
+        rows = list(csv.reader(io.StringIO(failure_set.to_csv())))
+
+        # -- Assert
+        assert records == [dict(f._asdict(), context=f.context) for f in failures]
+        assert rows[0] == list(CSV_FIELDS)
+        assert rows[2] == ['2', 'child', 'Attr should be hello', 'ERROR', '/root/child[1]', "@attr = 'hello'", '/root/child']
+        assert len(rows) == 5
+
+    def test_json_round_trips(self, failures):
+        # -- Setup
+        failure_set = FailureSet(failures)
+
+        # -- Act
+        loaded = FailureSet(Failure(**record) for record in json.loads(failure_set.to_json()))
+
+        # -- Assert
+        assert loaded == failures
+        assert [f.context for f in loaded] == [f.context for f in failures]
+        assert loaded.to_csv() == failure_set.to_csv()
+
+    def test_pickles(self, failures):
+        # -- Act
+        failure_set = pickle.loads(pickle.dumps(FailureSet(failures)))
+
+        # -- Assert
+        assert failure_set == failures
+        assert failure_set.count('ERROR') == 3
+
+    def test_holds_validation_failures(self, simple_sch_content):
+        # -- Setup
+        failures = validate_schematron(simple_sch_content, '<root><child/><child/></root>')
+
+        # -- Act
+        failure_set = FailureSet(failures)
+
+        # -- Assert
+        assert failure_set == failures
+        assert [f.location for f in failure_set] == ['/root/child[1]', '/root/child[2]']
@@ -1,8 +1,17 @@
 
+import glob
+import os
+from collections import Counter
+
+import pytest
 from lxml import etree
 
-from tools.constants import SCH_NSMAP, SCH_NS
-from tools.generate_sch import make_pattern_for_testing_contexts, qname, add_assert_description
+from tools.constants import SCH_NSMAP, SCH_NS, BSYNC_NSMAP
+from tools.element_locations import ELEMENT_LOCATIONS
+from tools.generate_sch import make_pattern_for_testing_contexts, qname, add_assert_description, generate_sch, rewrite_id_joins, anchor_descendant_scans
+from tools.validate_sch import Validator
+
+V2_2_0_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron', 'v2.2.0')
 
 
 class TestMakePatternForStructure:
@@ -182,3 +191,191 @@ class TestMakePatternForStructure:
         # -- Assert
         expected_xml = f'<sch:assert xmlns:sch="{SCH_NS}">hello world <sch:name/> more text <sch:value-of select="abc/def/ghi"/> this &gt; is escaped</sch:assert>'
         assert expected_xml.encode() == etree.tostring(assert_elem, pretty_print=False)
+
+
+class TestRewriteIdJoins:
+    def test_join_in_predicate_becomes_key_lookup(self):
+        # -- Setup
+        keys = {}
+
+        # -- Act
+        result = rewrite_id_joins('//auc:Sections/auc:Section[@ID = current()/@IDref]', keys)
+
+        # -- Assert
+        assert result == "key('Sections-Section-by-ID', current()/@IDref)"
+        assert keys == {('auc:Sections/auc:Section', '@ID'): 'Sections-Section-by-ID'}
+
+    def test_remaining_conditions_are_kept_as_predicate(self):
+        # -- Setup
+        keys = {}
+        expression = "count(//auc:TimeSeriesData/auc:TimeSeries[auc:ResourceUseID/@IDref = current()/@ID and auc:ReadingType/text() = 'Total']) >= 12"
+
+        # -- Act
+        result = rewrite_id_joins(expression, keys)
+
+        # -- Assert
+        assert result == "count(key('TimeSeriesData-TimeSeries-by-ResourceUseID-IDref', current()/@ID)[auc:ReadingType/text() = 'Total']) >= 12"
+        assert keys == {('auc:TimeSeriesData/auc:TimeSeries', 'auc:ResourceUseID/@IDref'): 'TimeSeriesData-TimeSeries-by-ResourceUseID-IDref'}
+
+    def test_comparison_with_descendant_attributes_becomes_key_lookup(self):
+        # -- Setup
+        keys = {}
+
+        # -- Act
+        result = rewrite_id_joins('auc:PrimaryContactID[@IDref = //auc:Contacts/auc:Contact/@ID]', keys)
+
+        # -- Assert
+        assert result == "auc:PrimaryContactID[key('Contacts-Contact-by-ID', @IDref)]"
+
+    def test_keys_are_reused(self):
+        # -- Setup
+        keys = {}
+
+        # -- Act
+        rewrite_id_joins('//auc:Sections/auc:Section[@ID = current()/@IDref]', keys)
+        rewrite_id_joins('//auc:Sections/auc:Section[current()/auc:LinkedSectionID/@IDref = @ID]', keys)
+
+        # -- Assert
+        assert list(keys.values()) == ['Sections-Section-by-ID']
+
+    def test_other_expressions_are_unchanged(self):
+        # -- Setup
+        expressions = [
+            # not an equality join
+            '@IDref != //auc:Contacts/auc:Contact/@ID',
+            # join is only part of a disjunction
+            '//auc:Sections/auc:Section[@ID = current()/@IDref or auc:SectionType]',
+            # positional predicate
+            '//auc:Sections/auc:Section[@ID = current()/@IDref and 1]',
+            # predicate on an earlier step
+            '//auc:Sections[auc:Section]/auc:Section[@ID = current()/@IDref]',
+            # inside of a string literal
+            "concat('//auc:Sections/auc:Section[@ID = current()/@IDref]', 'a')",
+            '//auc:Sections/auc:Section[@ID = $section_id]',
+        ]
+        keys = {}
+
+        # -- Act
+        results = [rewrite_id_joins(expression, keys) for expression in expressions]
+
+        # -- Assert
+        assert results == expressions
+        assert keys == {}
+
+
+class TestAnchorDescendantScans:
+    def test_unambiguous_scan_is_anchored(self):
+        # -- Setup
+        counts = Counter()
+
+        # -- Act
+        result = anchor_descendant_scans('count(//auc:Contacts/auc:Contact[auc:ContactRoles]) > 0', counts)
+
+        # -- Assert
+        assert result == 'count(/auc:BuildingSync/auc:Facilities/auc:Facility/auc:Contacts/auc:Contact[auc:ContactRoles]) > 0'
+        assert counts == {'anchored': 1}
+
+    def test_longest_known_path_is_used(self):
+        # -- Setup
+        counts = Counter()
+
+        # -- Act
+        # auc:Building alone is ambiguous, but auc:Building/auc:FloorAreas is not
+        result = anchor_descendant_scans("//auc:Building/auc:FloorAreas/auc:FloorArea[auc:FloorAreaType/text() = 'Gross']", counts)
+
+        # -- Assert
+        assert result == "/auc:BuildingSync/auc:Facilities/auc:Facility/auc:Sites/auc:Site/auc:Buildings/auc:Building/auc:FloorAreas/auc:FloorArea[auc:FloorAreaType/text() = 'Gross']"
+        assert counts == {'anchored': 1}
+
+    def test_ambiguous_scan_is_unchanged(self):
+        # -- Setup
+        counts = Counter()
+        locations = {'auc:A': ('/auc:X/auc:A', '/auc:Y/auc:A')}
+
+        # -- Act
+        result = anchor_descendant_scans('//auc:A/auc:B', counts, locations)
+
+        # -- Assert
+        assert result == '//auc:A/auc:B'
+        assert counts == {'ambiguous': 1}
+
+    def test_other_scans_are_unchanged(self):
+        # -- Setup
+        expressions = [
+            'auc:TechnologyCategories/auc:TechnologyCategory//auc:MeasureName',
+            '//auc:UnknownElement',
+            "concat('//auc:Contacts', 'a')",
+            '//text()',
+        ]
+        counts = Counter()
+
+        # -- Act
+        results = [anchor_descendant_scans(expression, counts) for expression in expressions]
+
+        # -- Assert
+        assert results == expressions
+        assert counts == {}
+
+    @pytest.mark.parametrize('xml_file', glob.glob(os.path.join(V2_2_0_DIR, '**', '*.xml'), recursive=True))
+    def test_element_locations_match_documents(self, xml_file):
+        # -- Setup
+        tree = etree.parse(xml_file)
+
+        for path, locations in ELEMENT_LOCATIONS.items():
+            if len(locations) != 1:
+                continue
+
+            # -- Act
+            scanned = tree.xpath(f'//{path}', namespaces=BSYNC_NSMAP)
+            anchored = tree.xpath(locations[0], namespaces=BSYNC_NSMAP)
+
+            # -- Assert
+            assert scanned == anchored, path
+
+
+class TestGenerateSchOptimized:
+    @staticmethod
+    def break_id_references(tree):
+        # make every other reference dangling so the joins have something to find
+        for i, element in enumerate(tree.xpath('//*[@IDref]')):
+            if i % 2 == 0:
+                element.set('IDref', element.get('IDref') + '-missing')
+        return tree
+
+    @pytest.mark.parametrize('name', [
+        'L000_Prelim_Analysis',
+        'L100_Audit',
+        'L100_OpenStudio_Pre-Simulation',
+        'L200_Audit',
+    ])
+    def test_optimized_xpaths_report_the_same_failures(self, name, tmp_path):
+        # -- Setup
+        csv_file = os.path.join(V2_2_0_DIR, f'v2-2-0_{name}.csv')
+        optimized_sch = str(tmp_path / 'optimized.sch')
+        unoptimized_sch = str(tmp_path / 'unoptimized.sch')
+        generate_sch(csv_file, output_file=optimized_sch)
+        generate_sch(csv_file, output_file=unoptimized_sch, optimize=False)
+        exemplary_files = glob.glob(os.path.join(V2_2_0_DIR, 'exemplary_files', f'{name}*.xml'))
+        assert exemplary_files
+
+        for exemplary_file in exemplary_files:
+            for document in [etree.parse(exemplary_file), self.break_id_references(etree.parse(exemplary_file))]:
+                # -- Act
+                optimized_failures = Validator(optimized_sch, use_cache=False).validate(document, strict_context=True)
+                unoptimized_failures = Validator(unoptimized_sch, use_cache=False).validate(document, strict_context=True)
+
+                # -- Assert
+                # only the assert tests themselves differ
+                assert [f._replace(test=None) for f in optimized_failures] == [f._replace(test=None) for f in unoptimized_failures]
+
+    def test_scan_counts_are_returned_not_printed(self, tmp_path, capsys):
+        # -- Setup
+        csv_file = os.path.join(V2_2_0_DIR, 'v2-2-0_L100_Audit.csv')
+        scan_counts = Counter()
+
+        # -- Act
+        generate_sch(csv_file, output_file=str(tmp_path / 'test.sch'), scan_counts=scan_counts)
+
+        # -- Assert
+        assert scan_counts['anchored'] > 0
+        assert capsys.readouterr().out == ''
@@ -0,0 +1,81 @@
+import json
+import os
+
+from lxml import etree
+
+from tools.profile_sch import format_profile, profile_to_dict
+from tools.validate_sch import validate_schematron, Validator
+
+V2_2_0_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron', 'v2.2.0')
+L200_SCH = os.path.join(V2_2_0_DIR, 'v2-2-0_L200_Audit.sch')
+L200_XML = os.path.join(V2_2_0_DIR, 'exemplary_files', 'L200_Audit.xml')
+
+
+def broken_l200_document():
+    tree = etree.parse(L200_XML)
+    for element in tree.xpath('//*[@IDref]')[::2]:
+        element.set('IDref', 'missing')
+    return tree
+
+
+class TestProfile:
+    def test_profile_returns_same_failures_as_validate(self):
+        # -- Setup
+        document = broken_l200_document()
+
+        # -- Act
+        failures, profile = validate_schematron(L200_SCH, document, profile=True)
+
+        # -- Assert
+        assert failures == validate_schematron(L200_SCH, document)
+        assert sum(a.failures for a in profile.asserts) == len(failures)
+        assert sum(r.failures for r in profile.rules) == len(failures)
+        assert sum(p.failures for p in profile.patterns) == len(failures)
+
+    def test_profile_counts_fired_rules(self):
+        # -- Setup
+        validator = Validator(L200_SCH)
+        document = etree.parse(L200_XML)
+        report = validator._run(document, strict_context=True)
+        num_fired = len(report.getroot().findall('{http://purl.oclc.org/dsdl/svrl}fired-rule'))
+
+        # -- Act
+        _, profile = validator.profile(document)
+
+        # -- Assert
+        assert sum(r.fired for r in profile.rules) == num_fired
+        assert sum(p.fired for p in profile.patterns) == num_fired
+
+    def test_profile_is_sorted_hottest_first(self):
+        # -- Act
+        _, profile = validate_schematron(L200_SCH, L200_XML, profile=True)
+
+        # -- Assert
+        assert profile.time > 0
+        assert [p.time for p in profile.patterns] == sorted((p.time for p in profile.patterns), reverse=True)
+        assert [r.time for r in profile.rules] == sorted((r.time for r in profile.rules), reverse=True)
+        assert [p.time for p in profile.phases] == sorted((p.time for p in profile.phases), reverse=True)
+
+    def test_profile_only_includes_phase_run(self):
+        # -- Act
+        _, profile = validate_schematron(L200_SCH, L200_XML, phase='historical_energy_use', profile=True)
+
+        # -- Assert
+        assert [p.phase for p in profile.phases] == ['historical_energy_use']
+        assert all('historical_energy_use' in p.phases for p in profile.patterns)
+
+    def test_profile_can_be_formatted(self):
+        # -- Setup
+        _, profile = validate_schematron(L200_SCH, L200_XML, profile=True)
+
+        # -- Act
+        table = format_profile(profile, limit=3)
+        as_json = json.dumps(profile_to_dict(profile))
+
+        # -- Assert
+        assert 'Patterns' in table
+        rules_table = table.split('Rules\n')[1].split('\n\n')[0]
+        # header, separator and 3 rows
+        assert len(rules_table.splitlines()) == 5
+        assert profile.rules[0].context in rules_table
+        assert len(json.loads(as_json)['rules']) == len(profile.rules)
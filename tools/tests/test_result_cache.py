@@ -0,0 +1,159 @@
+import os
+import time
+
+import pytest
+
+from tools.batch import validate_documents
+from tools.result_cache import ResultCache, document_hash, schematron_key, STALE_TMP_AGE
+from tools.validate_sch import validate_schematron, clear_validator_cache, _VALIDATOR_CACHE
+
+
+@pytest.fixture
+def doc_content():
+    return '''<root>
+    <child attr="world"/>
+    <child attr='hello'/>
+    <child attr="world"></child>
+</root>'''
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return ResultCache(os.path.join(tmpdir, 'results'))
+
+
+class TestResultCache:
+    def test_formatting_does_not_change_the_document_hash(self, doc_content):
+        # -- Act
+        reformatted = '<root><child attr="world"/><child attr="hello"/><child attr="world"/></root>'
+
+        # -- Assert
+        assert document_hash(doc_content.encode()) == document_hash(reformatted.encode())
+        assert document_hash(doc_content.encode()) != document_hash(reformatted.replace('hello', 'hi').encode())
+
+    def test_hit_skips_compiling_and_validating(self, cache, simple_phased_sch_content, doc_content):
+        # -- Setup
+        expected = validate_schematron(simple_phased_sch_content, doc_content, strict_context=True, result_cache=cache)
+        clear_validator_cache()
+
+        # -- Act
+        failures = validate_schematron(simple_phased_sch_content, doc_content, strict_context=True, result_cache=cache)
+
+        # -- Assert
+        assert len(_VALIDATOR_CACHE) == 0
+        assert failures == expected
+        assert [f.line for f in failures] == [2, 4]
+        assert failures[0].context == '/root/child'
+
+    def test_hit_for_reformatted_document_finds_its_lines(self, cache, simple_phased_sch_content, doc_content):
+        # -- Setup
+        validate_schematron(simple_phased_sch_content, doc_content, result_cache=cache)
+        reformatted = '<root>\n<child attr="world"/><child attr="hello"/>\n\n<child attr="world"/>\n</root>'
+
+        # -- Act
+        failures = validate_schematron(simple_phased_sch_content, reformatted, result_cache=cache)
+
+        # -- Assert
+        assert len(os.listdir(cache.cache_dir)) == 1
+        assert [f.line for f in failures] == [2, 4]
+        assert failures == validate_schematron(simple_phased_sch_content, reformatted)
+
+    def test_phase_and_strict_context_are_part_of_the_key(self, cache, simple_phased_sch_content, doc_content):
+        # -- Act
+        validate_schematron(simple_phased_sch_content, doc_content, result_cache=cache)
+        validate_schematron(simple_phased_sch_content, doc_content, phase='phaseA', result_cache=cache)
+        validate_schematron(simple_phased_sch_content, doc_content, strict_context=True, result_cache=cache)
+        validate_schematron(simple_phased_sch_content, doc_content, strict_context=True, result_cache=cache)
+
+        # -- Assert
+        assert len(os.listdir(cache.cache_dir)) == 3
+
+    def test_aggregated_failures_are_served_from_the_cache(self, cache, simple_phased_sch_content, doc_content):
+        # -- Setup
+        validate_schematron(simple_phased_sch_content, doc_content, result_cache=cache)
+
+        # -- Act
+        groups = validate_schematron(simple_phased_sch_content, doc_content, aggregate=True, result_cache=cache)
+
+        # -- Assert
+        assert groups == validate_schematron(simple_phased_sch_content, doc_content, aggregate=True)
+
+    def test_evicts_old_then_least_recently_used_results(self, cache, simple_phased_sch_content):
+        # -- Setup
+        documents = [f'<root><child attr="{i}"/></root>' for i in range(4)]
+        for document in documents:
+            validate_schematron(simple_phased_sch_content, document, result_cache=cache)
+        paths = {cache._path(cache.key(simple_phased_sch_content, document.encode())): i for i, document in enumerate(documents)}
+        now = time.time()
+        for path, i in paths.items():
+            # document 0 is the oldest, and too old to be kept
+            age = cache.max_age + 1 if i == 0 else 10 - i
+            os.utime(path, (now - age, now - age))
+        cache.max_size = 2 * os.path.getsize(next(iter(paths)))
+
+        # -- Act
+        num_removed = cache.evict()
+
+        # -- Assert
+        assert num_removed == 2
+        assert sorted(paths[os.path.join(cache.cache_dir, name)] for name in os.listdir(cache.cache_dir)) == [2, 3]
+
+    def test_stale_temporary_files_are_evicted(self, cache, simple_phased_sch_content, doc_content):
+        # -- Setup
+        validate_schematron(simple_phased_sch_content, doc_content, result_cache=cache)
+        stale_path = os.path.join(cache.cache_dir, 'stale.tmp')
+        fresh_path = os.path.join(cache.cache_dir, 'fresh.tmp')
+        for path in [stale_path, fresh_path]:
+            with open(path, 'w') as f:
+                f.write('{')
+        old = time.time() - STALE_TMP_AGE - 1
+        os.utime(stale_path, (old, old))
+
+        # -- Act
+        num_removed = cache.evict()
+
+        # -- Assert
+        assert num_removed == 1
+        assert sorted(os.listdir(cache.cache_dir)) == sorted([os.path.basename(fresh_path), os.path.basename(cache._path(cache.key(simple_phased_sch_content, doc_content.encode())))])
+
+    def test_editing_an_included_file_changes_the_schematron_key(self, write_file):
+        # -- Setup
+        pattern = '''<sch:pattern xmlns:sch="http://purl.oclc.org/dsdl/schematron" id="patternA">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = '{}'" role="ERROR">Attr is wrong</sch:assert>
+            </sch:rule>
+        </sch:pattern>'''
+        write_file('lib.sch', pattern.format('hello'))
+        sch_path = write_file('main.sch', '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+            <sch:include href="lib.sch"/>
+        </sch:schema>''')
+        key = schematron_key(sch_path)
+
+        # -- Act
+        write_file('lib.sch', pattern.format('world!'))
+
+        # -- Assert
+        assert schematron_key(sch_path) != key
+
+    def test_unwritable_cache_is_ignored(self, write_file, simple_phased_sch_content, doc_content):
+        # -- Setup
+        not_a_dir = write_file('file', '')
+
+        # -- Act
+        failures = validate_schematron(simple_phased_sch_content, doc_content, result_cache=ResultCache(not_a_dir))
+
+        # -- Assert
+        assert len(failures) == 2
+
+    def test_parallel_batch_uses_the_cache(self, cache, simple_phased_sch_content, doc_content):
+        # -- Setup
+        documents = [doc_content, doc_content.replace('hello', 'world')]
+        expected = [validate_schematron(simple_phased_sch_content, document) for document in documents]
+        list(validate_documents(simple_phased_sch_content, documents, result_cache=cache))
+
+        # -- Act
+        results = list(validate_documents(simple_phased_sch_content, documents, jobs=2, result_cache=cache))
+
+        # -- Assert
+        assert [failures for _, failures in results] == expected
+        assert len(os.listdir(cache.cache_dir)) == 2
@@ -0,0 +1,89 @@
+import pytest
+from lxml import etree
+
+from tools.constants import SCH_NS
+from tools.sch_lib import SchematronLibrary
+from tools.validate_sch import validate_schematron
+
+
+@pytest.fixture
+def lib_dir(tmpdir, write_file):
+    write_file('lib.sch', '''<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+        <ns prefix="auc" uri="http://buildingsync.net/schemas/bedes-auc/2019"/>
+        <pattern abstract="true" id="attrIs">
+            <rule context="$parent">
+                <assert test="@attr = $value" role="ERROR">Attr should be <value-of select="$value"/></assert>
+            </rule>
+        </pattern>
+        <pattern id="oneChild">
+            <rule context="/root">
+                <assert test="count(child) = 1" role="ERROR">There should be one child</assert>
+            </rule>
+        </pattern>
+    </schema>''')
+    return str(tmpdir)
+
+
+@pytest.fixture
+def doc_content():
+    return '<root><child attr="world"/><child attr="hello"/></root>'
+
+
+class TestSchematronLibrary:
+    def test_instantiates_abstract_pattern(self, lib_dir, doc_content):
+        # -- Setup
+        library = SchematronLibrary(lib_dir)
+
+        # -- Act
+        schematron = library.schema([library.instantiate('lib.sch', 'attrIs', {'parent': '/root/child', 'value': "'hello'"})])
+        failures = validate_schematron(schematron, doc_content, strict_context=True)
+
+        # -- Assert
+        assert [f.message for f in failures] == ['Attr should be hello']
+
+    def test_schema_runs_every_pattern_in_one_phase(self, lib_dir, doc_content):
+        # -- Setup
+        library = SchematronLibrary(lib_dir)
+
+        # -- Act
+        schematron = library.schema([
+            library.pattern('lib.sch', 'oneChild'),
+            library.instantiate('lib.sch', 'attrIs', {'parent': '/root/child', 'value': "'world'"}),
+        ])
+        failures = validate_schematron(schematron, doc_content, phase='Tests')
+
+        # -- Assert
+        assert [f.message for f in failures] == ['There should be one child', 'Attr should be world']
+
+    def test_files_are_parsed_and_patterns_instantiated_once(self, lib_dir):
+        # -- Setup
+        library = SchematronLibrary(lib_dir)
+        params = {'parent': '/root/child', 'value': "'hello'"}
+
+        # -- Act
+        first = library.instantiate('lib.sch', 'attrIs', params)
+        first.set('id', 'modified')
+        second = library.instantiate('lib.sch', 'attrIs', dict(reversed(list(params.items()))))
+        library.pattern('lib.sch', 'oneChild')
+
+        # -- Assert
+        # copies are handed out, so modifying one does not change the cached pattern
+        assert second.get('id') == 'inst.attrIs'
+        assert list(library._files) == ['lib.sch']
+        assert len(library._instances) == 1
+        assert library.schema([library.instantiate('lib.sch', 'attrIs', params)]) == library.schema([second])
+
+    def test_unknown_pattern_raises(self, lib_dir):
+        with pytest.raises(Exception, match='Found no pattern with id "bogus" in lib.sch'):
+            SchematronLibrary(lib_dir).pattern('lib.sch', 'bogus')
+
+    def test_schema_has_no_includes(self, lib_dir):
+        # -- Setup
+        library = SchematronLibrary(lib_dir)
+
+        # -- Act
+        schematron = etree.fromstring(library.schema([library.pattern('lib.sch', 'oneChild')]))
+
+        # -- Assert
+        assert schematron.find(f'{{{SCH_NS}}}include') is None
+        assert schematron.find(f'{{{SCH_NS}}}phase/{{{SCH_NS}}}active').get('pattern') == 'oneChild'
@@ -0,0 +1,122 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from tools.server import ValidatorRegistry, make_server
+from tools.validate_sch import Failure, Validator
+
+
+@pytest.fixture
+def sch_dir(tmpdir, write_file, simple_phased_sch_content):
+    write_file(os.path.join('v1', 'test.sch'), simple_phased_sch_content)
+    return str(tmpdir)
+
+
+@pytest.fixture
+def server(sch_dir):
+    registry = ValidatorRegistry(sch_dir)
+    server = make_server(registry, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None):
+    conn = http.client.HTTPConnection(*server.server_address)
+    conn.request(method, path, body=body)
+    response = conn.getresponse()
+    content = json.loads(response.read())
+    conn.close()
+    return response.status, content
+
+
+class TestServer:
+    def test_ready_only_after_warm_up(self, server):
+        # -- Act
+        status_before, _ = request(server, 'GET', '/ready')
+        server.RequestHandlerClass.registry.warm_up()
+        status_after, _ = request(server, 'GET', '/ready')
+
+        # -- Assert
+        assert status_before == 503
+        assert status_after == 200
+
+    def test_validate_returns_failures(self, server):
+        # -- Setup
+        server.RequestHandlerClass.registry.warm_up()
+
+        # -- Act
+        status, content = request(server, 'POST', '/validate?schematron=v1/test.sch&phase=phaseA', b'<root><child attr="world"/></root>')
+
+        # -- Assert
+        assert status == 200
+        assert content['num_errors'] == 1
+        assert content['failures'][0]['message'] == 'Attr should be hello'
+
+    def test_validate_unknown_schematron_is_not_found(self, server):
+        # -- Setup
+        server.RequestHandlerClass.registry.warm_up()
+
+        # -- Act
+        status, _ = request(server, 'POST', '/validate?schematron=bogus.sch', b'<root/>')
+
+        # -- Assert
+        assert status == 404
+
+    def test_validate_error_is_returned_as_json(self, server, monkeypatch):
+        # -- Setup
+        server.RequestHandlerClass.registry.warm_up()
+
+        def validate(*args, **kwargs):
+            raise Exception('Validation went wrong')
+
+        monkeypatch.setattr(Validator, 'validate', validate)
+
+        # -- Act
+        status, content = request(server, 'POST', '/validate?schematron=v1/test.sch', b'<root/>')
+
+        # -- Assert
+        assert status == 500
+        assert content == {'error': 'Validation went wrong'}
+
+    def test_error_locating_failures_is_returned_as_json(self, server, monkeypatch):
+        # -- Setup
+        server.RequestHandlerClass.registry.warm_up()
+
+        def locate():
+            raise Exception('Location went wrong')
+
+        monkeypatch.setattr(Validator, 'validate', lambda *args, **kwargs: [Failure(message='Bad', role='ERROR', resolve=locate)])
+
+        # -- Act
+        status, content = request(server, 'POST', '/validate?schematron=v1/test.sch', b'<root/>')
+
+        # -- Assert
+        assert status == 500
+        assert content == {'error': 'Location went wrong'}
+
+
+class TestValidatorRegistry:
+    def test_reload_changed_recompiles_modified_schematron(self, sch_dir, write_file, simple_phased_sch_content):
+        # -- Setup
+        registry = ValidatorRegistry(sch_dir)
+        registry.warm_up()
+        doc = '<root><child attr="hello"/></root>'
+        assert registry.get('v1/test.sch').validate(doc) == []
+
+        path = write_file(os.path.join('v1', 'test.sch'), simple_phased_sch_content.replace("'hello'", "'goodbye'"))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        # -- Act
+        reloaded = registry.reload_changed()
+
+        # -- Assert
+        assert reloaded == ['v1/test.sch']
+        assert len(registry.get('v1/test.sch').validate(doc)) == 1
+        assert len(registry.get('v1/test.sch', 'phaseA').validate(doc)) == 1
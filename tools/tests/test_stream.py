@@ -0,0 +1,42 @@
+import io
+import json
+
+from tools.stream import run_stream
+
+
+class TestRunStream:
+    def test_validates_paths_and_payloads(self, write_file, simple_sch_content):
+        # -- Setup
+        doc = write_file('valid.xml', '<root><child attr="hello"/></root>')
+        payload = b'<root>\n<child attr="world"/></root>'
+        instream = io.BytesIO(f'{doc}\n{len(payload)}\n'.encode() + payload + b'\n')
+        outstream = io.StringIO()
+
+        # -- Act
+        num_invalid = run_stream(simple_sch_content, instream, outstream)
+
+        # -- Assert
+        results = [json.loads(line) for line in outstream.getvalue().splitlines()]
+        assert num_invalid == 1
+        assert results[0] == {'document': doc, 'num_errors': 0, 'failures': []}
+        assert results[1]['document'] == '<stdin:1>'
+        assert results[1]['num_errors'] == 1
+        failure = results[1]['failures'][0]
+        assert failure['line'] == 2
+        assert failure['role'] == 'ERROR'
+        assert failure['location'] == '/root/child'
+        assert failure['message'] == 'Attr should be hello'
+
+    def test_reports_documents_which_cannot_be_validated(self, simple_sch_content):
+        # -- Setup
+        instream = io.BytesIO(b'/does/not/exist.xml\n')
+        outstream = io.StringIO()
+
+        # -- Act
+        num_invalid = run_stream(simple_sch_content, instream, outstream)
+
+        # -- Assert
+        result = json.loads(outstream.getvalue())
+        assert num_invalid == 1
+        assert result['document'] == '/does/not/exist.xml'
+        assert 'error' in result
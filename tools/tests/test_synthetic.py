@@ -0,0 +1,100 @@
+import os
+
+import pytest
+from lxml import etree
+
+from tools.constants import BSYNC_NSMAP
+from tools.synthetic import generate_document, scale_collection, COLLECTIONS
+from tools.validate_sch import validate_schematron
+
+V2_2_0_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron', 'v2.2.0')
+TEMPLATE_L100 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'templates', 'BuildingSync_template_L100.xml')
+
+
+def exemplary_file(name):
+    return os.path.join(V2_2_0_DIR, 'exemplary_files', f'{name}.xml')
+
+
+class TestScaleCollection:
+    def test_scale_multiplies_items(self):
+        # -- Setup
+        tree = etree.parse(exemplary_file('L200_Audit'))
+        num_sections = len(tree.xpath('//auc:Sections/auc:Section', namespaces=BSYNC_NSMAP))
+
+        # -- Act
+        added = scale_collection(tree, 'Sections', 3)
+
+        # -- Assert
+        assert added == num_sections * 2
+        assert len(tree.xpath('//auc:Sections/auc:Section', namespaces=BSYNC_NSMAP)) == num_sections * 3
+
+    def test_fractional_scale_is_rounded(self):
+        # -- Setup
+        tree = etree.parse(exemplary_file('L200_Audit'))
+        num_series = len(tree.xpath('//auc:TimeSeries', namespaces=BSYNC_NSMAP))
+
+        # -- Act
+        scale_collection(tree, 'TimeSeries', 1.5)
+
+        # -- Assert
+        assert len(tree.xpath('//auc:TimeSeries', namespaces=BSYNC_NSMAP)) == round(num_series * 1.5)
+
+    def test_ids_stay_unique_and_references_resolve(self):
+        # -- Act
+        tree = generate_document(exemplary_file('L200_Audit'), {collection: 2.5 for collection in COLLECTIONS})
+
+        # -- Assert
+        ids = tree.xpath('//@ID')
+        assert len(ids) == len(set(ids))
+        original_refs = set(etree.parse(exemplary_file('L200_Audit')).xpath('//@IDref'))
+        for idref in tree.xpath('//@IDref'):
+            # references which did not resolve in the original document still don't
+            assert idref in ids or idref in original_refs
+
+    def test_unknown_collection_raises(self):
+        # -- Setup
+        tree = etree.parse(exemplary_file('L200_Audit'))
+
+        # -- Act / Assert
+        with pytest.raises(Exception, match='Unknown collection'):
+            scale_collection(tree, 'Foo', 2)
+
+
+class TestGenerateDocument:
+    def test_generation_is_deterministic(self):
+        # -- Setup
+        scales = {'Sections': 2.5, 'TimeSeries': 3.3, 'Measures': 1.7}
+
+        # -- Act
+        first = etree.tostring(generate_document(exemplary_file('L200_Audit'), scales, seed=7))
+        second = etree.tostring(generate_document(exemplary_file('L200_Audit'), scales, seed=7))
+        other_seed = etree.tostring(generate_document(exemplary_file('L200_Audit'), scales, seed=8))
+
+        # -- Assert
+        assert first == second
+        assert first != other_seed
+
+    def test_template_can_be_scaled(self):
+        # -- Act
+        tree = generate_document(TEMPLATE_L100, {'Measures': 4})
+
+        # -- Assert
+        assert tree.getroot().tag == '{http://buildingsync.net/schemas/bedes-auc/2019}BuildingSync'
+
+    @pytest.mark.parametrize('name, schematron', [
+        ('L000_Prelim_Analysis', 'v2-2-0_L000_Prelim_Analysis.sch'),
+        ('L100_Audit', 'v2-2-0_L100_Audit.sch'),
+        ('L100_OpenStudio_Pre-Simulation_01', 'v2-2-0_L100_OpenStudio_Pre-Simulation.sch'),
+        ('L200_Audit', 'v2-2-0_L200_Audit.sch'),
+    ])
+    def test_scaled_exemplary_files_stay_valid(self, name, schematron):
+        # -- Setup
+        schematron = os.path.join(V2_2_0_DIR, schematron)
+        expected_failures = validate_schematron(schematron, exemplary_file(name), strict_context=True)
+
+        # -- Act
+        tree = generate_document(exemplary_file(name), {collection: 3 for collection in COLLECTIONS})
+
+        # -- Assert
+        failures = validate_schematron(schematron, tree, strict_context=True)
+        assert [f.message for f in failures] == [f.message for f in expected_failures]
@@ -1,34 +1,16 @@
+import json
 import os
+import pickle
+import threading
+import time
 
 import pytest
+from lxml import etree
 
-from tools.validate_sch import validate_schematron
-
-
-@pytest.fixture
-def simple_valid_doc_content():
-    return '''<root>
-        <child attr="hello"/>
-    </root>'''
-
-
-@pytest.fixture
-def simple_bad_doc_content():
-    return '''<root>
-        <child attr="world"/>
-    </root>'''
-
-
-@pytest.fixture
-def simple_sch_content():
-    return '''
-    <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
-        <sch:pattern>
-            <sch:rule context="/root/child">
-                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
-            </sch:rule>
-        </sch:pattern>
-    </sch:schema>'''
+from tools import validate_sch
+from tools.compile_sch import expand_schematron
+from tools.constants import SVRL_NS
+from tools.validate_sch import validate_schematron, get_validator, clear_validator_cache, Validator, _VALIDATOR_CACHE, Failure, _FailureLocations, aggregate_failures, print_failure_group
 
 
 class TestValidateSchematron:
@@ -213,3 +195,341 @@ class TestValidateSchematron:
         # there should be one failure, the rule which was not fired
         assert len(failures) == 1
         assert failures[0].message == 'Rule was NOT used for validation: /root/bogus'
+
+    @pytest.mark.parametrize('options, message', [
+        ({'profile': True, 'engine': 'xpath'}, 'Profiling is not supported with the xpath engine'),
+        ({'result_path': 'result.svrl', 'result_cache': object()}, 'Saving the svrl result is not supported with a result cache'),
+        ({'profile': True, 'result_path': 'result.svrl'}, 'Saving the svrl result is not supported with profiling'),
+        ({'profile': True, 'aggregate': True}, 'Profiling is not supported with aggregating failures'),
+    ])
+    def test_unsupported_combinations_of_options_raise(self, simple_sch_content, simple_valid_doc_content, options, message):
+        # -- Act, Assert
+        with pytest.raises(Exception, match=message):
+            validate_schematron(simple_sch_content, simple_valid_doc_content, **options)
+
+
+class TestValidator:
+    def test_validator_can_validate_multiple_documents(self, simple_valid_doc_content, simple_bad_doc_content, simple_sch_content):
+        # -- Setup
+        validator = Validator(simple_sch_content)
+
+        # -- Act
+        valid_failures = validator.validate(simple_valid_doc_content)
+        bad_failures = validator.validate(simple_bad_doc_content)
+
+        # -- Assert
+        assert len(valid_failures) == 0
+        assert len(bad_failures) == 1
+        assert bad_failures[0].message == 'Attr should be hello'
+
+    def test_get_validator_reuses_compiled_validator(self, simple_sch_content):
+        # -- Act
+        validator_a = get_validator(simple_sch_content)
+        validator_b = get_validator(simple_sch_content)
+
+        # -- Assert
+        assert validator_a is validator_b
+
+    def test_get_validator_recompiles_when_file_changes(self, write_file, simple_valid_doc_content, simple_sch_content):
+        # -- Setup
+        sch = write_file('test.sch', simple_sch_content)
+        validator_a = get_validator(sch)
+
+        # change the expected attribute so the valid document now fails
+        write_file('test.sch', simple_sch_content.replace("'hello'", "'goodbye'"))
+        stat = os.stat(sch)
+        os.utime(sch, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        # -- Act
+        validator_b = get_validator(sch)
+        failures = validate_schematron(sch, simple_valid_doc_content)
+
+        # -- Assert
+        assert validator_a is not validator_b
+        assert len(failures) == 1
+
+    def test_expanded_schematron_is_only_loaded_for_strict_context(self, simple_bad_doc_content, simple_sch_content):
+        # -- Setup
+        validator = Validator(simple_sch_content)
+
+        # -- Act
+        validator.validate(simple_bad_doc_content)
+        loaded_without_strict = validator._schematron_tree is not None
+        validator.validate(simple_bad_doc_content, strict_context=True)
+
+        # -- Assert
+        assert not loaded_without_strict
+        assert validator._schematron_tree is not None
+
+    def test_result_path_is_only_written_when_given(self, tmpdir, simple_bad_doc_content, simple_sch_content):
+        # -- Setup
+        result_path = os.path.join(tmpdir, 'result.svrl')
+
+        # -- Act
+        validate_schematron(simple_sch_content, simple_bad_doc_content, result_path=result_path)
+
+        # -- Assert
+        with open(result_path) as f:
+            assert 'Attr should be hello' in f.read()
+
+    def test_schematron_tree_is_expanded_once_by_concurrent_threads(self, simple_sch_content, monkeypatch):
+        # -- Setup
+        validator = Validator(simple_sch_content, use_cache=False)
+        expanded = []
+
+        def slow_expand(*args, **kwargs):
+            expanded.append(True)
+            time.sleep(0.05)
+            return expand_schematron(*args, **kwargs)
+
+        monkeypatch.setattr(validate_sch, 'expand_schematron', slow_expand)
+        threads = [threading.Thread(target=validator._get_expected_rules, args=(None,)) for _ in range(4)]
+
+        # -- Act
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # -- Assert
+        assert len(expanded) == 1
+        assert validator._get_expected_rules(None) == ['/root/child']
+
+
+@pytest.fixture
+def three_phase_sch_content():
+    return '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:phase id="phaseA">
+            <sch:active pattern="patternA"/>
+        </sch:phase>
+        <sch:phase id="phaseB">
+            <sch:active pattern="patternB"/>
+        </sch:phase>
+        <sch:phase id="phaseC">
+            <sch:active pattern="patternC"/>
+        </sch:phase>
+        <sch:pattern id="patternA">
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="patternB">
+            <sch:rule context="/root">
+                <sch:assert test="count(child) = 123" role="ERROR">There should be 123 child elements</sch:assert>
+            </sch:rule>
+            <sch:rule context="/root/bogusB">
+                <sch:assert test="false()" role="ERROR">Never fired</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="patternC">
+            <sch:rule context="/root/bogusC">
+                <sch:assert test="false()" role="ERROR">Never fired</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+class TestPhaseSelection:
+    doc = '''<root>
+        <child attr="world"/>
+    </root>'''
+
+    def test_several_phases_in_one_pass_match_each_phase_on_its_own(self, three_phase_sch_content):
+        # -- Setup
+        validator = Validator(three_phase_sch_content, use_cache=False)
+        expected = []
+        for phase in ['phaseA', 'phaseB']:
+            expected += Validator(three_phase_sch_content, phase=phase, use_cache=False).validate(self.doc)
+
+        # -- Act
+        failures = validator.validate(self.doc, phases=['phaseA', 'phaseB'])
+
+        # -- Assert
+        assert failures == expected
+        assert [f.message for f in failures] == ['Attr should be hello', 'There should be 123 child elements']
+        assert validator.validate(self.doc, phases='phaseA') == expected[:1]
+
+    def test_strict_context_only_reports_unfired_rules_of_selected_phases(self, three_phase_sch_content):
+        # -- Setup
+        validator = Validator(three_phase_sch_content, use_cache=False)
+
+        # -- Act
+        failures = validator.validate(self.doc, strict_context=True, phases=['phaseB'])
+        all_failures = validator.validate(self.doc, strict_context=True)
+
+        # -- Assert
+        assert [f.message for f in failures][:1] == ['Rule was NOT used for validation: /root/bogusB']
+        assert len(failures) == 2
+        assert len(all_failures) == 4
+
+    def test_unknown_phase_in_selection_raises(self, three_phase_sch_content):
+        # -- Setup
+        validator = Validator(three_phase_sch_content, use_cache=False)
+
+        # -- Act, Assert
+        with pytest.raises(Exception, match='Found no phase with provided id of "bogus"'):
+            validator.validate(self.doc, phases=['phaseA', 'bogus'])
+
+    def test_validator_compiled_for_a_phase_rejects_other_phases(self, three_phase_sch_content):
+        # -- Setup
+        validator = Validator(three_phase_sch_content, phase='phaseA', use_cache=False)
+
+        # -- Act, Assert
+        assert validator.phases == ['phaseA']
+        assert len(validator.validate(self.doc, phases='phaseA')) == 1
+        with pytest.raises(Exception, match='compiled for phase "phaseA" only'):
+            validator.validate(self.doc, phases='phaseB')
+
+    def test_validate_schematron_compiles_once_for_every_selection_of_phases(self, three_phase_sch_content):
+        # -- Setup
+        clear_validator_cache()
+
+        # -- Act
+        validate_schematron(three_phase_sch_content, self.doc, phase=['phaseA'])
+        validate_schematron(three_phase_sch_content, self.doc, phase=['phaseC'])
+        failures = validate_schematron(three_phase_sch_content, self.doc, phase=['phaseA', 'phaseB'])
+
+        # -- Assert
+        assert len(failures) == 2
+        assert len(_VALIDATOR_CACHE) == 1
+        assert get_validator(three_phase_sch_content).phases == ['phaseA', 'phaseB', 'phaseC']
+
+    def test_single_phase_is_compiled_on_its_own(self, three_phase_sch_content):
+        # -- Setup
+        clear_validator_cache()
+
+        # -- Act
+        failures = validate_schematron(three_phase_sch_content, self.doc, phase='phaseB', strict_context=True)
+
+        # -- Assert
+        assert [f.message for f in failures] == ['Rule was NOT used for validation: /root/bogusB', 'There should be 123 child elements']
+        assert get_validator(three_phase_sch_content, phase='phaseB').phases == ['phaseB']
+        assert len(_VALIDATOR_CACHE) == 1
+
+
+class TestFailureLocations:
+    doc = '''<root xmlns:a="urn:a">
+        <child attr="hello"/>
+        <child attr="world"/>
+        <a:child attr="world"/>
+    </root>'''
+
+    sch = '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:ns prefix="a" uri="urn:a"/>
+        <sch:pattern>
+            <sch:rule context="/root/child | /root/a:child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+    def test_failures_are_located_when_first_accessed(self):
+        # -- Setup
+        validator = Validator(self.sch)
+        document_tree = etree.ElementTree(etree.fromstring(self.doc))
+
+        # -- Act
+        failures = validator.validate(document_tree)
+        resolved_before_access = [f._located is not None for f in failures]
+
+        # -- Assert
+        assert resolved_before_access == [False, False]
+        assert [(f.line, f.element, f.location) for f in failures] == [
+            (3, 'child', '/root/child[2]'),
+            (4, '{urn:a}child', '/root/a:child'),
+        ]
+
+    def test_every_element_is_found_from_its_svrl_location(self):
+        # -- Setup
+        document_tree = etree.ElementTree(etree.fromstring(self.doc))
+        locations = _FailureLocations(document_tree)
+        validator = Validator(self.sch.replace("@attr = 'hello'", 'false()'))
+        report = validator._run(document_tree, False)
+
+        # -- Act
+        svrl_locations = [failed_assert.get('location') for failed_assert in report.getroot().iterchildren(f'{{{SVRL_NS}}}failed-assert')]
+
+        # -- Assert
+        assert [locations._find(location) for location in svrl_locations] == list(document_tree.getroot())
+
+    def test_failure_behaves_like_a_tuple(self):
+        # -- Setup
+        failure = Failure(message='Attr should be hello', role='ERROR', test='false()', resolve=lambda: (3, 'child', '/root/child'))
+
+        # -- Act
+        copied = pickle.loads(pickle.dumps(failure))
+
+        # -- Assert
+        assert copied == failure == (3, 'child', 'Attr should be hello', 'ERROR', '/root/child', 'false()')
+        assert failure._asdict()['location'] == '/root/child'
+        assert failure._replace(role='WARNING').role == 'WARNING'
+        line, element, message, role, location, test = failure
+        assert (line, role) == (3, 'ERROR')
+
+    def test_failure_is_serialized_as_a_tuple_or_dict(self):
+        # -- Setup
+        failure = Failure(message='Attr should be hello', role='ERROR', test='false()', resolve=lambda: (3, 'child', '/root/child'))
+
+        # -- Act
+        as_list = json.loads(json.dumps([tuple(failure)]))
+        as_dict = json.loads(json.dumps(failure._asdict()))
+
+        # -- Assert
+        assert as_list == [[3, 'child', 'Attr should be hello', 'ERROR', '/root/child', 'false()']]
+        assert as_dict == dict(zip(Failure._fields, as_list[0]))
+
+
+class TestAggregateFailures:
+    sch = '''<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:pattern>
+            <sch:rule context="/root/child">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello, not <sch:value-of select="@attr"/></sch:assert>
+            </sch:rule>
+            <sch:rule context="/root/other">
+                <sch:assert test="@attr = 'hello'" role="ERROR">Attr should be hello</sch:assert>
+            </sch:rule>
+            <sch:rule context="/root/bogus">
+                <sch:assert test="false()">[WARNING] never fired</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+    doc = '<root>\n' + '<child attr="world"/>\n' * 10 + '<other/>\n</root>'
+
+    def test_failures_are_grouped_by_test_role_and_context(self):
+        # -- Act
+        groups = validate_schematron(self.sch, self.doc, strict_context=True, aggregate=True)
+
+        # -- Assert
+        assert [(group.context, group.count, group.first_line, group.last_line) for group in groups] == [
+            ('/root/bogus', 1, 0, 0),
+            ('/root/child', 10, 2, 11),
+            ('/root/other', 1, 12, 12),
+        ]
+        child_group = groups[1]
+        assert child_group.message == 'Attr should be hello, not world'
+        assert [example.location for example in child_group.examples] == [f'/root/child[{i}]' for i in range(1, 6)]
+
+    def test_aggregates_a_generator_keeping_only_examples(self):
+        # -- Setup
+        failures = (Failure(line=line, message='m', role='ERROR', test='t', context='c') for line in range(100, 0, -1))
+
+        # -- Act
+        groups = aggregate_failures(failures, examples=2)
+
+        # -- Assert
+        assert len(groups) == 1
+        assert (groups[0].count, groups[0].first_line, groups[0].last_line) == (100, 1, 100)
+        assert [example.line for example in groups[0].examples] == [100, 99]
+
+    def test_print_failure_group(self, capsys):
+        # -- Setup
+        groups = validate_schematron(self.sch, self.doc, aggregate=True)
+
+        # -- Act
+        print_failure_group('doc.xml', groups[0], verbose=True)
+
+        # -- Assert
+        output = capsys.readouterr().out.splitlines()
+        assert output[0] == '[ERROR] doc.xml:2-11: child: Attr should be hello, not world (10 failures)'
+        assert output[-1] == '    ... and 5 more'
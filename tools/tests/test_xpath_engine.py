@@ -0,0 +1,219 @@
+import glob
+import os
+
+import pytest
+from lxml import etree
+
+from tools.validate_sch import Validator, validate_schematron, get_validator, ENGINE_XPATH
+from tools.xpath_engine import XPathValidator
+
+SCHEMATRON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schematron')
+
+# (schematron, exemplary document) for every schematron and exemplary file of the same version
+EXEMPLARY_CASES = [
+    (sch, xml)
+    for version, documents in (('v2.2.0', 'exemplary_files'), ('v2.0.0', 'examples'))
+    for sch in sorted(glob.glob(os.path.join(SCHEMATRON_DIR, version, '*.sch')))
+    for xml in sorted(glob.glob(os.path.join(SCHEMATRON_DIR, version, documents, '*.xml')))
+]
+
+
+def _case_id(case):
+    return f'{os.path.basename(case[0])}-{os.path.basename(case[1])}'
+
+
+@pytest.fixture
+def sch_content():
+    return '''
+    <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+        <sch:phase id="first_phase">
+            <sch:active pattern="first"/>
+        </sch:phase>
+        <sch:phase id="second_phase">
+            <sch:active pattern="second"/>
+        </sch:phase>
+        <sch:pattern id="first">
+            <sch:rule context="/root/child[@attr = 'special']">
+                <sch:assert test="false()" role="WARNING">special <sch:name/></sch:assert>
+            </sch:rule>
+            <sch:rule context="child">
+                <sch:let name="attr" value="@attr"/>
+                <sch:assert test="$attr = 'hello'" role="ERROR">Attr of <sch:name/> should be hello, not <sch:value-of select="$attr"/></sch:assert>
+            </sch:rule>
+        </sch:pattern>
+        <sch:pattern id="second">
+            <sch:rule context="/">
+                <sch:assert test="count(root) = 1">[INFO] one root</sch:assert>
+            </sch:rule>
+            <sch:rule context="missing">
+                <sch:assert test="false()">never fired</sch:assert>
+            </sch:rule>
+        </sch:pattern>
+    </sch:schema>'''
+
+
+@pytest.fixture
+def doc_content():
+    return '''<root>
+        <child attr="hello"/>
+        <child attr="world"/>
+        <child attr="special"/>
+    </root>'''
+
+
+class TestXPathValidator:
+    def test_only_the_first_matching_rule_of_a_pattern_fires(self, sch_content, doc_content):
+        # -- Act
+        failures = XPathValidator(sch_content, phase='first_phase').validate(doc_content)
+
+        # -- Assert
+        assert [(f.line, f.role, f.message) for f in failures] == [
+            (3, 'ERROR', 'Attr of child should be hello, not world'),
+            (4, 'WARNING', 'special child'),
+        ]
+        assert failures[0].location == '/root/child[2]'
+        assert failures[0].test == "$attr = 'hello'"
+
+    def test_document_node_rules_use_the_document_as_context(self, sch_content, doc_content):
+        # -- Act
+        failures = XPathValidator(sch_content, phase='second_phase').validate(doc_content.replace('<root>', '<root><root/>', 1))
+
+        # -- Assert
+        assert len(failures) == 0
+
+    def test_strict_context_reports_unfired_rules_of_the_phase(self, sch_content, doc_content):
+        # -- Act
+        failures = XPathValidator(sch_content, phase='second_phase').validate(doc_content, strict_context=True)
+
+        # -- Assert
+        assert [f.message for f in failures] == ['Rule was NOT used for validation: missing']
+
+    def test_phases_are_selected_when_validating(self, sch_content, doc_content):
+        # -- Setup
+        validator = XPathValidator(sch_content, use_cache=False)
+
+        # -- Act
+        failures = validator.validate(doc_content, strict_context=True, phases=['second_phase', 'first_phase'])
+
+        # -- Assert
+        assert failures == Validator(sch_content, use_cache=False).validate(doc_content, strict_context=True, phases=['second_phase', 'first_phase'])
+        assert validator.validate(doc_content, strict_context=True, phases='second_phase') == [
+            f for f in failures if f.message == 'Rule was NOT used for validation: missing'
+        ]
+
+    def test_unknown_phase_raises(self, sch_content):
+        with pytest.raises(Exception, match='Found no phase'):
+            XPathValidator(sch_content, phase='nope')
+
+    def test_matches_xslt_engine_on_simple_schematron(self, sch_content, doc_content):
+        # -- Act
+        expected = Validator(sch_content, use_cache=False).validate(doc_content, strict_context=True)
+        failures = XPathValidator(sch_content, use_cache=False).validate(doc_content, strict_context=True)
+
+        # -- Assert
+        assert failures == expected
+
+    def test_aggregated_failures_match_xslt_engine(self, sch_content, doc_content):
+        # -- Act
+        expected = Validator(sch_content, use_cache=False).validate(doc_content, strict_context=True, aggregate=True)
+        groups = XPathValidator(sch_content, use_cache=False).validate(doc_content, strict_context=True, aggregate=True)
+
+        # -- Assert
+        assert groups == expected
+        assert [group.context for group in groups] == ['missing', 'child', "/root/child[@attr = 'special']"]
+
+    def test_keys_are_looked_up_by_value(self):
+        # -- Setup
+        sch = '''
+        <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+            <xsl:key name="item-by-id" match="item" use="@ID"/>
+            <sch:pattern id="refs">
+                <sch:rule context="ref">
+                    <sch:assert test="key('item-by-id', current()/@IDref)[@kind = 'thing']">broken ref</sch:assert>
+                </sch:rule>
+            </sch:pattern>
+        </sch:schema>'''
+        doc = '''<root>
+            <item ID="a" kind="thing"/>
+            <item ID="b" kind="other"/>
+            <ref IDref="a"/>
+            <ref IDref="b"/>
+            <ref IDref="c"/>
+        </root>'''
+
+        # -- Act
+        failures = XPathValidator(sch, use_cache=False).validate(doc)
+
+        # -- Assert
+        assert [f.location for f in failures] == ['/root/ref[2]', '/root/ref[3]']
+        assert failures == Validator(sch, use_cache=False).validate(doc)
+
+    def test_unsupported_assert_content_raises(self):
+        sch = '''
+        <sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+            <sch:pattern id="p">
+                <sch:rule context="a">
+                    <sch:assert test="false()">an <sch:emph>emphasized</sch:emph> message</sch:assert>
+                </sch:rule>
+            </sch:pattern>
+        </sch:schema>'''
+        with pytest.raises(Exception, match='not supported by the xpath engine'):
+            XPathValidator(sch, use_cache=False)
+
+    def test_result_path_is_not_supported(self, sch_content, doc_content, tmpdir):
+        with pytest.raises(Exception, match='not supported by the xpath engine'):
+            XPathValidator(sch_content).validate(doc_content, result_path=os.path.join(tmpdir, 'result.xml'))
+
+    def test_loads_csv_as_generated_schematron(self):
+        # -- Setup
+        csv_file = os.path.join(SCHEMATRON_DIR, 'v2.2.0', 'v2-2-0_L200_Audit.csv')
+        document = etree.parse(os.path.join(SCHEMATRON_DIR, 'v2.2.0', 'exemplary_files', 'L200_Audit.xml'))
+        # break some references so the failures are not trivially empty
+        for element in document.xpath('//*[@IDref]')[::3]:
+            element.set('IDref', 'missing')
+
+        # -- Act
+        expected = XPathValidator(csv_file.replace('.csv', '.sch')).validate(document, strict_context=True)
+        failures = XPathValidator(csv_file).validate(document, strict_context=True)
+
+        # -- Assert
+        assert len(failures) > 0
+        assert failures == expected
+
+
+class TestGetValidatorEngine:
+    def test_xpath_engine_is_cached_separately(self, sch_content):
+        # -- Act
+        xpath_validator = get_validator(sch_content, engine=ENGINE_XPATH)
+
+        # -- Assert
+        assert isinstance(xpath_validator, XPathValidator)
+        assert get_validator(sch_content, engine=ENGINE_XPATH) is xpath_validator
+        assert isinstance(get_validator(sch_content), Validator)
+
+    def test_unknown_engine_raises(self, sch_content):
+        with pytest.raises(Exception, match='Unknown engine'):
+            get_validator(sch_content, engine='saxon')
+
+    def test_validate_schematron_uses_engine(self, sch_content, doc_content):
+        # -- Act
+        failures = validate_schematron(sch_content, doc_content, phase='first_phase', engine=ENGINE_XPATH)
+
+        # -- Assert
+        assert len(failures) == 2
+
+
+@pytest.mark.parametrize('schematron, document', EXEMPLARY_CASES, ids=[_case_id(case) for case in EXEMPLARY_CASES])
+def test_xpath_engine_matches_xslt_engine_on_exemplary_files(schematron, document):
+    # -- Setup
+    try:
+        xslt_validator = get_validator(schematron)
+    except etree.SchematronParseError:
+        pytest.skip('schematron can not be compiled to xslt')
+
+    # -- Act
+    expected = xslt_validator.validate(document, strict_context=True)
+    failures = get_validator(schematron, engine=ENGINE_XPATH).validate(document, strict_context=True)
+
+    # -- Assert
+    assert failures == expected
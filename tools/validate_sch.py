@@ -1,57 +1,180 @@
-from collections import namedtuple
+import functools
+import hashlib
+import os
+import re
+import threading
+from collections import namedtuple, Counter, OrderedDict
 
-from lxml import etree, isoschematron
+from lxml import etree
 
-from .constants import SVRL_NSMAP, SCH_NSMAP, BSYNC_NSMAP
+from .catalog import build_catalog, load_catalog, expected_rules
+from .compile_sch import compile_schematron, expand_schematron, REPORT_FULL, REPORT_LEAN, FIRED_RULES_PARAM, PATTERNS_PARAM
+from .constants import SVRL_NS, SCH_NSMAP, BSYNC_NSMAP
+from .profile_sch import build_profile
 
-Failure = namedtuple('Failure', ['line', 'element', 'message', 'role', 'location', 'test'])
 
+class Failure:
+    """
+    A failed assert (or, in strict context mode, a rule which was not fired).
+    Has the read only API of a namedtuple of
+    (line, element, message, role, location, test): attribute access, _fields,
+    indexing, unpacking, len, _asdict, _replace, and equality and hashing like
+    the tuple of its fields. It is not a tuple itself though, so isinstance
+    checks against tuple fail and json can not serialize it; convert it with
+    tuple(failure) or failure._asdict() first.
+    Its context, the context of the rule of the assert, is not one of the fields.
+    It is only known when the report lists the fired rules (always with the xpath
+    engine).
 
-def _get_unfired_rules(schematron, phase):
+    Finding the element a failed assert is about is comparatively expensive, so
+    failures can be created with a resolve function instead, which is only
+    called (once) when the line, element or location is first accessed. Callers
+    which only look at roles and messages never pay for it.
     """
-    Returns rule contexts that were not fired after running the schematron
+    _fields = ('line', 'element', 'message', 'role', 'location', 'test')
+    __slots__ = ('message', 'role', 'test', 'context', '_located', '_resolve')
+
+    def __init__(self, line=None, element=None, message=None, role=None, location=None, test=None, context=None, resolve=None):
+        """
+        :param context: str | None, context of the rule of the failed assert
+        :param resolve: callable | None, returns (line, element, location), used instead of those arguments when given
+        """
+        self.message = message
+        self.role = role
+        self.test = test
+        self.context = context
+        self._located = None if resolve is not None else (line, element, location)
+        self._resolve = resolve
+
+    def _locate(self):
+        if self._located is None:
+            self._located = self._resolve()
+            self._resolve = None
+        return self._located
+
+    @property
+    def line(self):
+        return self._locate()[0]
+
+    @property
+    def element(self):
+        return self._locate()[1]
+
+    @property
+    def location(self):
+        return self._locate()[2]
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def _replace(self, **kwargs):
+        values = self._asdict()
+        values['context'] = self.context
+        values.update(kwargs)
+        return Failure(**values)
+
+    def __iter__(self):
+        line, element, location = self._locate()
+        return iter((line, element, self.message, self.role, location, self.test))
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, (Failure, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # resolved before pickling (e.g. to send it back from a worker process), as the document can not be sent along
+        return (Failure, (*self, self.context))
+
+    def __repr__(self):
+        return 'Failure(' + ', '.join(f'{name}={value!r}' for name, value in self._asdict().items()) + ')'
+
+
+# number of example failures kept for each group by aggregate_failures
+AGGREGATE_EXAMPLES = 5
+
+# failures grouped by aggregate_failures
+# count: number of failures in the group
+# examples: Failure[], the first AGGREGATE_EXAMPLES failures of the group
+# first_line, last_line: int | None, range of the lines of the failed elements
+FailureGroup = namedtuple('FailureGroup', ['test', 'role', 'context', 'message', 'count', 'examples', 'first_line', 'last_line'])
+
+# engines which can run the schematron
+# xslt: compiles the schematron to xslt with the iso schematron skeleton
+# xpath: evaluates the rules with lxml's xpath directly, see tools.xpath_engine
+ENGINE_XSLT = 'xslt'
+ENGINE_XPATH = 'xpath'
+ENGINES = (ENGINE_XSLT, ENGINE_XPATH)
+
+# maximum number of compiled validators kept in memory by get_validator
+VALIDATOR_CACHE_SIZE = 32
+_VALIDATOR_CACHE = OrderedDict()
 
-    :param schematron: instance of lxml's schematron
-    :param phase: str | None, name of specific phase run
+
+def _split_phase_selection(phase):
     """
-    # get expected rules
-    schematron_tree = schematron.schematron
-    if schematron_tree is None:
-        raise Exception('Schematron is missing schematron attribute. Was schematron created with `store_schematron=True`?')
+    A single phase is compiled on its own, pruned down to its patterns (see
+    tools.compile_sch.prune_schematron), while several phases share one compile
+    of the whole schematron and are selected when validating
+
+    :param phase: str | list of str | None
+    :returns: (str | None, list of str | None), the phase to compile and the phases to select when validating
+    """
+    if isinstance(phase, str):
+        return phase, None
+    return None, phase
 
-    if phase is None:
-        # get all rules in the schematron
-        rules = schematron_tree.xpath(
-            '//sch:rule',
-            namespaces=SCH_NSMAP,
-        )
-    else:
-        # only get the rules that pare part of the specified pattern's active phases
-        pattern_ids = schematron_tree.xpath(
-            f'//sch:phase[@id = "{phase}"]/sch:active/@pattern',
-            namespaces=SCH_NSMAP,
-        )
-
-        rules = []
-        for pattern_id in pattern_ids:
-            rules += schematron_tree.xpath(
-                f'//sch:pattern[@id = "{pattern_id}"]/sch:rule',
-                namespaces=SCH_NSMAP,
-            )
 
-    expected_rules = [rule.get('context') for rule in rules]
+def _get_phase_patterns(schematron_tree):
+    """
+    :param schematron_tree: etree._ElementTree
+    :returns: dict, {phase id: [ids of its active patterns]}, in schematron order
+    """
+    return {
+        phase.get('id'): [str(pattern_id) for pattern_id in phase.xpath('sch:active/@pattern', namespaces=SCH_NSMAP)]
+        for phase in schematron_tree.xpath('//sch:phase', namespaces=SCH_NSMAP)
+    }
 
-    # get fired rules
-    result_tree = schematron.validation_report
-    if result_tree is None:
-        raise Exception('Schematron is missing schematron attribute. Was schematron created with `store_schematron=True`?')
 
-    rules = result_tree.xpath(
-        '//svrl:fired-rule',
-        namespaces=SVRL_NSMAP,
-    )
-    fired_rules = [rule.get('context') for rule in rules]
+def _select_phases(phase_patterns, phases, compiled_phase=None):
+    """
+    Checks the phases exist and were compiled
 
+    :param phase_patterns: dict, from _get_phase_patterns
+    :param phases: str | list of str | None
+    :param compiled_phase: str | None, phase the validator was compiled for, all phases if None
+    :returns: list of str | None, the phases as a list, None if phases is None
+    """
+    if phases is None:
+        return None
+    if isinstance(phases, str):
+        phases = [phases]
+    phases = list(phases)
+    for phase in phases:
+        if phase not in phase_patterns:
+            raise Exception(f'Found no phase with provided id of "{phase}"')
+        if compiled_phase is not None and phase != compiled_phase:
+            raise Exception(f'Validator was compiled for phase "{compiled_phase}" only, compile it without a phase to select phases when validating')
+    return phases
+
+
+def _find_unfired_rules(expected_rules, fired_rules):
+    """
+    Returns the expected rule contexts which fired fewer times than they are expected
+
+    :param expected_rules: list of str, contexts of the rules run
+    :param fired_rules: iterable of str, context of each rule fired
+    :returns: list of str
+    """
     # find the difference in rule counts between fired and unfired
     rule_counts = {}
     for rule in expected_rules:
@@ -70,102 +193,527 @@ def _get_unfired_rules(schematron, phase):
     return unfired_rules
 
 
-def validate_schematron(schematron, document, result_path=None, phase=None, strict_context=False):
+# a step of an svrl location, e.g. /auc:Sites, /auc:Site[2] or /*[local-name()='Site' and namespace-uri()='...'][2]
+_LOCATION_STEP = re.compile(r"/(?:\*\[local-name\(\)='[^']*' and namespace-uri\(\)='[^']*'\]|[^/\[\]]+)(?:\[\d+\])?")
+
+
+def _child_locations(children):
     """
-    Runs schematron on the given document and returns an array of failures
+    Maps the location step of each child element, as written to svrl reports by
+    the iso schematron skeleton (full path notation), to the child
+
+    :param children: list of etree._Element, siblings in document order
+    :returns: dict, {location step: etree._Element}
+    """
+    local_names = [etree.QName(child).localname for child in children]
+    # name() of the children, i.e. with the prefix of their namespace if any
+    names = [f'{child.prefix}:{local_name}' if child.prefix else local_name for child, local_name in zip(children, local_names)]
+    name_totals = Counter(names)
+    local_name_totals = Counter(local_names)
+    names_seen = Counter()
+    local_names_seen = Counter()
+    steps = {}
+    for child, name, local_name in zip(children, names, local_names):
+        names_seen[name] += 1
+        local_names_seen[local_name] += 1
+        namespace = etree.QName(child).namespace
+        if namespace is None:
+            # siblings are counted by name()
+            step = f'/{local_name}'
+            position, total = names_seen[local_name], name_totals[local_name]
+        else:
+            # siblings are counted by local-name(), whatever their namespace
+            step = f"/*[local-name()='{local_name}' and namespace-uri()='{namespace}']"
+            position, total = local_names_seen[local_name], local_name_totals[local_name]
+        if total > 1:
+            step += f'[{position}]'
+        steps[step] = child
+    return steps
+
+
+class _FailureLocations:
+    """
+    Resolves the svrl locations of the failed asserts of a document to the
+    failed elements. Locations are followed step by step from the root, and the
+    location steps of the children of each element passed through are indexed
+    once, so many failures under the same elements do not search the document
+    again, and elements no failure is under are never looked at.
+    """
+
+    def __init__(self, document_tree):
+        self._document_tree = document_tree
+        # {location: {location step: child element}}
+        self._index = {}
+
+    def _find(self, location):
+        """
+        :param location: str, location of a failed assert
+        :returns: etree._Element | None, None if the location is not a path to an element
+        """
+        steps = _LOCATION_STEP.findall(location)
+        if not steps or ''.join(steps) != location:
+            return None
+        element = None
+        prefix = ''
+        for step in steps:
+            children = self._index.get(prefix)
+            if children is None:
+                if element is None:
+                    children = _child_locations([self._document_tree.getroot()])
+                else:
+                    children = _child_locations(list(element.iterchildren(etree.Element)))
+                self._index[prefix] = children
+            element = children.get(step)
+            if element is None:
+                return None
+            prefix += step
+        return element
+
+    def resolve(self, location):
+        """
+        :param location: str, location of a failed assert
+        :returns: (int, str, str), line, element name and readable xpath of the failed element
+        """
+        failed_element = self._find(location)
+        if failed_element is None:
+            # not an element, evaluate the location as an xpath
+            try:
+                failed_element = self._document_tree.xpath(location)[0]
+            except IndexError:
+                # Somehow, there can rule contexts that are fired, but the resulting
+                # svrl location is not a valid xpath for a BuildingSync document.
+                # For example, at one point in time, in LL87 `location` is /@version,
+                # which is not a valid xpath
+                # In these cases, we will just default to the root auc:BuildingSync element
+                # If this becomes a more common issue we should reconsider how to locate the failed element
+                failed_element = self._document_tree.xpath('/auc:BuildingSync', namespaces=BSYNC_NSMAP)[0]
+        tag = failed_element.tag.replace("{http://buildingsync.net/schemas/bedes-auc/2019}", "auc:")
+        return failed_element.sourceline, tag, self._document_tree.getpath(failed_element)
+
+
+def _unfired_rule_failure(rule):
+    """
+    :param rule: str, context of the unfired rule
+    :returns: Failure
+    """
+    return Failure(
+        line=0,
+        element=None,
+        message=f'Rule was NOT used for validation: {rule}',
+        role='ERROR',
+        location=None,
+        test=None,
+        context=rule,
+    )
+
+
+def _get_role(role, message):
+    """
+    Returns the role of a failed assert, falling back to the severity tag in its
+    message when the assert has no role
+
+    :param role: str | None
+    :param message: str
+    :returns: str
+    """
+    if role is None:
+        if '[INFO]' in message:
+            role = 'INFO'
+        elif '[WARNING]' in message:
+            role = 'WARNING'
+        else:
+            role = 'ERROR'
+    return role
+
+
+def _parse_schematron(schematron):
+    """
+    Parses the schematron from a file path or a string of schematron xml
 
     :param schematron: str, path to sch file or string containing schematron xml
-    :param document: str | etree._ElementTree, path to xml file to test or string containing document xml or etree
-    :param result_path: str, path to file to save the svrl result
-    :returns: Failure[], list of failures
+    :returns: etree._ElementTree
     """
     try:
-        schematron_tree = etree.parse(schematron)
+        return etree.parse(schematron)
     except OSError:
-        schematron_tree = etree.ElementTree(etree.fromstring(schematron))
+        return etree.ElementTree(etree.fromstring(schematron))
 
-    if phase is not None:
-        # as an extra precaution, verify there's a phase with the given ID
-        phase_elem = schematron_tree.xpath(f'//sch:phase[@id = "{phase}"]', namespaces=SCH_NSMAP)
-        if len(phase_elem) == 0:
-            raise Exception(f'Found no phase with provided id of "{phase}"')
 
-    schematron = isoschematron.Schematron(
-        schematron_tree,
-        phase=phase,
-        store_report=True,
-        store_schematron=True,
-    )
+def _parse_document(document):
+    """
+    Parses the document to validate
 
+    :param document: str | bytes | file | etree._ElementTree | etree._Element, path to xml file to test, string or bytes containing document xml, a file object or etree
+    :returns: etree._ElementTree
+    """
     if isinstance(document, str):
         try:
-            document_tree = etree.ElementTree(etree.fromstring(document))
+            return etree.ElementTree(etree.fromstring(document))
         except etree.XMLSyntaxError:
-            document_tree = etree.parse(document)
+            return etree.parse(document)
+    elif isinstance(document, bytes):
+        return etree.ElementTree(etree.fromstring(document))
     elif isinstance(document, etree._ElementTree):
-        document_tree = document
+        return document
+    elif isinstance(document, etree._Element):
+        return document.getroottree()
+    elif hasattr(document, 'read'):
+        return etree.parse(document)
+
+    raise Exception(f'Unrecognized type for `document`: {type(document)}. Expected file path, string or bytes of xml, file object, or lxml etree instance')
+
+
+class Validator:
+    """
+    Compiled schematron which can be used to validate any number of documents.
+
+    Compiling the schematron (include expansion, abstract pattern expansion and
+    XSLT compilation) is by far the most expensive part of validation, so a
+    Validator should be reused whenever the same schematron and phase are used
+    more than once. See `get_validator` for a cached constructor.
+    """
+
+    def __init__(self, schematron, phase=None, report_mode=REPORT_LEAN, use_cache=True):
+        """
+        :param schematron: str, path to sch file or string containing schematron xml
+        :param phase: str | None, id of the phase to run, runs all phases if None
+        :param report_mode: str, REPORT_LEAN to only report failed asserts (and fired rules for strict context checks) or REPORT_FULL for the complete svrl report
+        :param use_cache: bool, if True the compiled schematron is read from (or saved to) the on-disk cache
+        """
+        schematron_tree = _parse_schematron(schematron)
+        # the catalog written next to generated schematron, see tools.catalog
+        self._catalog = load_catalog(schematron) if os.path.isfile(schematron) else None
+        if self._catalog is not None:
+            self._phase_patterns = self._catalog['phases']
+        else:
+            self._phase_patterns = _get_phase_patterns(schematron_tree)
+
+        # as an extra precaution, verify there's a phase with the given ID
+        _select_phases(self._phase_patterns, phase)
+
+        self.phase = phase
+        self.report_mode = report_mode
+        self._source = schematron
+        self._use_cache = use_cache
+        # the expanded schematron is only needed for strict context checks
+        # without a catalog, so it is dropped after compiling and loaded again
+        # when first needed
+        self._schematron_tree = None
+        # {selected phases: contexts of the rules expected to fire}
+        self._expected_rules = {}
+        # guards loading the schematron tree and expected rules, validators are shared between threads (see tools.server)
+        self._lock = threading.RLock()
+        validator_xslt = compile_schematron(schematron_tree, phase=phase, report_mode=report_mode, use_cache=use_cache)
+        self._validator = etree.XSLT(validator_xslt)
+
+    @property
+    def schematron_tree(self):
+        """
+        The schematron with includes and abstract patterns expanded
+
+        :returns: etree._ElementTree
+        """
+        if self._schematron_tree is None:
+            with self._lock:
+                if self._schematron_tree is None:
+                    self._schematron_tree = expand_schematron(
+                        _parse_schematron(self._source),
+                        phase=self.phase,
+                        report_mode=self.report_mode,
+                        use_cache=self._use_cache
+                    )
+        return self._schematron_tree
+
+    @property
+    def phases(self):
+        """
+        Ids of the phases which can be selected when validating
+
+        :returns: list of str
+        """
+        if self.phase is not None:
+            return [self.phase]
+        return list(self._phase_patterns)
+
+    def _get_expected_rules(self, phases):
+        """
+        :param phases: list of str | None, phases run, every phase compiled if None
+        :returns: list of str, contexts of the rules run, in schematron order
+        """
+        key = self.phase if phases is None else tuple(phases)
+        rules = self._expected_rules.get(key)
+        if rules is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = build_catalog(self.schematron_tree)
+                rules = self._expected_rules[key] = expected_rules(self._catalog, self.phase if phases is None else phases)
+        return rules
+
+    def _run(self, document_tree, strict_context, profile_run=False, phases=None):
+        """
+        Runs the compiled schematron on the document
+
+        :param phases: list of str | None, phases to run, every phase compiled if None
+        :returns: etree._XSLTResultTree, the svrl report
+        """
+        params = {}
+        if self.report_mode == REPORT_LEAN:
+            params[FIRED_RULES_PARAM] = 'true()' if strict_context else 'false()'
+        if phases is not None:
+            pattern_ids = [pattern_id for phase in phases for pattern_id in self._phase_patterns[phase]]
+            params[PATTERNS_PARAM] = etree.XSLT.strparam(f' {" ".join(pattern_ids)} ')
+        return self._validator(document_tree, profile_run=profile_run, **params)
+
+    def _iter_failures(self, document_tree, validation_report, strict_context, phases=None):
+        """
+        Yields the failures from the svrl report
+
+        :param phases: list of str | None, phases run, every phase compiled if None
+        :returns: generator of Failure
+        """
+        if strict_context:
+            fired_rules = [rule.get('context') for rule in validation_report.getroot().iterchildren(f'{{{SVRL_NS}}}fired-rule')]
+            unfired_rules = _find_unfired_rules(self._get_expected_rules(phases), fired_rules)
+
+            for rule in unfired_rules:
+                yield _unfired_rule_failure(rule)
+
+        locations = _FailureLocations(document_tree)
+        # failed asserts follow the fired rule they belong to, when fired rules are reported
+        context = None
+        for element in validation_report.getroot().iterchildren(f'{{{SVRL_NS}}}fired-rule', f'{{{SVRL_NS}}}failed-assert'):
+            if element.tag == f'{{{SVRL_NS}}}fired-rule':
+                context = element.get('context')
+                continue
+            error_message = element[0].text
+            yield Failure(
+                message=error_message,
+                role=_get_role(element.get('role'), error_message),
+                test=element.get('test'),
+                context=context,
+                # location stores an xpath to the element which failed validation
+                resolve=functools.partial(locations.resolve, element.get('location')),
+            )
+
+    def _get_failures(self, document_tree, validation_report, strict_context, phases=None):
+        """
+        Collects the failures from the svrl report
+
+        :param phases: list of str | None, phases run, every phase compiled if None
+        :returns: Failure[]
+        """
+        return list(self._iter_failures(document_tree, validation_report, strict_context, phases))
+
+    def validate(self, document, result_path=None, strict_context=False, phases=None, aggregate=False):
+        """
+        Runs the schematron on the given document and returns an array of failures
+
+        :param document: str | bytes | file | etree._ElementTree | etree._Element, path to xml file to test, string or bytes containing document xml, a file object or etree
+        :param result_path: str, path to file to save the svrl result (only contains failed asserts unless the report mode is REPORT_FULL)
+        :param strict_context: bool, if True unfired rules are reported as failures
+        :param phases: str | list of str | None, id of the phase, or ids of several phases, to run in this pass; None runs every phase the validator was compiled for
+        :param aggregate: bool, if True the failures are grouped, see aggregate_failures
+        :returns: Failure[], list of failures, or FailureGroup[] if aggregate is True
+        """
+        # failures are grouped by the context of their rule, so fired rules are needed to aggregate
+        failures = self._iter_validate(document, result_path, strict_context, phases, with_context=aggregate)
+        if aggregate:
+            return aggregate_failures(failures)
+        return list(failures)
+
+    def _iter_validate(self, document, result_path=None, strict_context=False, phases=None, with_context=False):
+        """
+        Validates the document, see validate
+
+        :param with_context: bool, if True fired rules are reported so the context of every failure is known
+        :returns: generator of Failure
+        """
+        phases = _select_phases(self._phase_patterns, phases, self.phase)
+        document_tree = _parse_document(document)
+        validation_report = self._run(document_tree, strict_context or with_context, phases=phases)
+
+        if result_path is not None:
+            validation_report.write(result_path, pretty_print=True)
+
+        return self._iter_failures(document_tree, validation_report, strict_context, phases)
+
+    def _validate_with_fired_rules(self, document_tree, phases=None):
+        """
+        Validates without strict context checks, but also returns the context of
+        every rule fired, so unfired rules can be found across several runs of
+        different phases (see tools.batch.validate_phases_parallel)
+
+        :param document_tree: etree._ElementTree
+        :param phases: str | list of str | None, see validate
+        :returns: (Failure[], list of str), failures and the context of each fired rule
+        """
+        phases = _select_phases(self._phase_patterns, phases, self.phase)
+        validation_report = self._run(document_tree, strict_context=True, phases=phases)
+        fired_rules = [rule.get('context') for rule in validation_report.getroot().iterchildren(f'{{{SVRL_NS}}}fired-rule')]
+        return self._get_failures(document_tree, validation_report, strict_context=False), fired_rules
+
+    def profile(self, document, strict_context=False, phases=None):
+        """
+        Validates the document while profiling the compiled schematron, see
+        tools.profile_sch for what is measured
+
+        :param document: str | bytes | file | etree._ElementTree | etree._Element, path to xml file to test, string or bytes containing document xml, a file object or etree
+        :param strict_context: bool, if True unfired rules are reported as failures
+        :param phases: str | list of str | None, see validate
+        :returns: (Failure[], Profile), list of failures and the profile of the run
+        """
+        phases = _select_phases(self._phase_patterns, phases, self.phase)
+        document_tree = _parse_document(document)
+        # fired rules are needed to attribute failed asserts to their rules
+        validation_report = self._run(document_tree, strict_context=True, profile_run=True, phases=phases)
+        profile = build_profile(self.schematron_tree, validation_report, validation_report.xslt_profile, self.phase if phases is None else phases)
+        return self._get_failures(document_tree, validation_report, strict_context, phases), profile
+
+
+def _validator_cache_key(schematron, phase, report_mode, engine=ENGINE_XSLT):
+    """
+    Returns the key used to cache a compiled Validator. Files are identified by
+    their absolute path, modification time and size, so editing a file results in
+    a recompile; schematron xml strings are identified by a hash of their content.
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param phase: str | None
+    :param report_mode: str
+    :param engine: str
+    :returns: tuple
+    """
+    if os.path.isfile(schematron):
+        stat = os.stat(schematron)
+        return ('file', os.path.abspath(schematron), stat.st_mtime_ns, stat.st_size, phase, report_mode, engine)
+
+    return ('content', hashlib.sha256(schematron.encode('utf-8')).hexdigest(), phase, report_mode, engine)
+
+
+def get_validator(schematron, phase=None, report_mode=REPORT_LEAN, engine=ENGINE_XSLT):
+    """
+    Returns a compiled Validator for the schematron and phase, reusing a previously
+    compiled one when possible. The most recently used validators are kept in an
+    in-process LRU cache of size VALIDATOR_CACHE_SIZE.
+
+    :param schematron: str, path to sch file (or csv file for the xpath engine) or string containing schematron xml
+    :param phase: str | None, id of the phase to run, runs all phases if None
+    :param report_mode: str, REPORT_LEAN or REPORT_FULL, ignored by the xpath engine
+    :param engine: str, ENGINE_XSLT or ENGINE_XPATH
+    :returns: Validator | tools.xpath_engine.XPathValidator
+    """
+    if engine not in ENGINES:
+        raise Exception(f'Unknown engine "{engine}", expected one of: {", ".join(ENGINES)}')
+    if engine == ENGINE_XPATH:
+        # the xpath engine has no report modes
+        report_mode = None
+    key = _validator_cache_key(schematron, phase, report_mode, engine)
+    validator = _VALIDATOR_CACHE.get(key)
+    if validator is not None:
+        _VALIDATOR_CACHE.move_to_end(key)
+        return validator
+
+    if engine == ENGINE_XPATH:
+        # imported here as the xpath engine builds on this module
+        from .xpath_engine import XPathValidator
+        validator = XPathValidator(schematron, phase=phase)
     else:
-        raise Exception(f'Unrecognized type for `document`: {type(document)}. Expected file path, string of xml, or lxml etree instance')
-
-    schematron.validate(document_tree)
-
-    strout = etree.tostring(schematron.validation_report, pretty_print=True)
-    if result_path is not None:
-        with open(result_path, 'wb') as f:
-            f.write(strout)
-
-    failures = []
-    if strict_context:
-        unfired_rules = _get_unfired_rules(schematron, phase)
-
-        for rule in unfired_rules:
-            failures.append(Failure(
-                line=0,
-                element=None,
-                message=f'Rule was NOT used for validation: {rule}',
-                role='ERROR',
-                location=None,
-                test=None
-            ))
-
-    failed_asserts = schematron.validation_report.xpath(
-        '/svrl:schematron-output/svrl:failed-assert',
-        namespaces=SVRL_NSMAP)
-
-    for failed_assert in failed_asserts:
-        # location stores an xpath to the element which failed validation
-        location = failed_assert.get('location')
-        try:
-            failed_element = document_tree.xpath(location)[0]
-        except IndexError:
-            # Somehow, there can rule contexts that are fired, but the resulting
-            # svrl location is not a valid xpath for a BuildingSync document.
-            # For example, at one point in time, in LL87 `location` is /@version,
-            # which is not a valid xpath
-            # In these cases, we will just default to the root auc:BuildingSync element
-            # If this becomes a more common issue we should reconsider how to locate the failed element
-            failed_element = document_tree.xpath('/auc:BuildingSync', namespaces=BSYNC_NSMAP)[0]
-        readable_xpath = document_tree.getpath(failed_element)
-        tag = failed_element.tag.replace("{http://buildingsync.net/schemas/bedes-auc/2019}", "auc:")
-        error_message = failed_assert[0].text
-        role = failed_assert.get('role')
-        if role is None:
-            if '[INFO]' in error_message:
-                role = 'INFO'
-            elif '[WARNING]' in error_message:
-                role = 'WARNING'
-            else:
-                role = 'ERROR'
-
-        failures.append(Failure(
-            line=failed_element.sourceline,
-            element=tag,
-            message=error_message,
-            role=role,
-            location=readable_xpath,
-            test=failed_assert.get('test'),
-        ))
-    return failures
+        validator = Validator(schematron, phase=phase, report_mode=report_mode)
+    _VALIDATOR_CACHE[key] = validator
+    while len(_VALIDATOR_CACHE) > VALIDATOR_CACHE_SIZE:
+        _VALIDATOR_CACHE.popitem(last=False)
+
+    return validator
+
+
+def clear_validator_cache():
+    """
+    Removes all compiled validators from the in-process cache
+    """
+    _VALIDATOR_CACHE.clear()
+
+
+def validate_schematron(schematron, document, result_path=None, phase=None, strict_context=False, profile=False, engine=ENGINE_XSLT, aggregate=False, result_cache=None):
+    """
+    Runs schematron on the given document and returns an array of failures
+
+    :param schematron: str, path to sch file or string containing schematron xml
+    :param document: str | etree._ElementTree, path to xml file to test or string containing document xml or etree
+    :param result_path: str, path to file to save the svrl result
+    :param phase: str | list of str | None, id of the phase, or ids of several phases, to run in one pass, see _split_phase_selection
+    :param profile: bool, if True the run is profiled and the Profile is returned along with the failures (see Validator.profile)
+    :param engine: str, ENGINE_XSLT or ENGINE_XPATH, see get_validator
+    :param aggregate: bool, if True the failures are grouped, see aggregate_failures
+    :param result_cache: tools.result_cache.ResultCache | None, if given the failures are returned from (or saved to) the cache
+    :returns: Failure[], list of failures, FailureGroup[] if aggregate is True, or (Failure[], Profile) if profile is True
+    """
+    # profiling and saving the svrl result each need a run of the compiled xslt of their own
+    xslt_options = [name for name, used in [('Profiling', profile), ('Saving the svrl result', result_path is not None)] if used]
+    if xslt_options:
+        conflicts = [name for name, used in [
+            ('the xpath engine', engine == ENGINE_XPATH),
+            ('a result cache', result_cache is not None),
+            ('profiling', profile and result_path is not None),
+            ('aggregating failures', profile and aggregate),
+        ] if used]
+        if conflicts:
+            raise Exception(f'{xslt_options[-1]} is not supported with {conflicts[0]}')
+
+    if result_cache is not None:
+        return result_cache.validate(schematron, document, phase=phase, strict_context=strict_context, engine=engine, aggregate=aggregate)
+    # the full svrl report is only needed when it's saved
+    report_mode = REPORT_LEAN if result_path is None else REPORT_FULL
+    compiled_phase, phases = _split_phase_selection(phase)
+    validator = get_validator(schematron, phase=compiled_phase, report_mode=report_mode, engine=engine)
+    if profile:
+        return validator.profile(document, strict_context=strict_context, phases=phases)
+    return validator.validate(document, result_path=result_path, strict_context=strict_context, phases=phases, aggregate=aggregate)
+
+
+def aggregate_failures(failures, examples=AGGREGATE_EXAMPLES):
+    """
+    Groups failures by their assert test, role and rule context, so an assert
+    which fails on thousands of sibling elements is reported once, with the
+    number of failures, a few examples and the range of lines they are on.
+    Only the examples are kept, so the failures can be a generator.
+
+    :param failures: iterable of Failure
+    :param examples: int, number of example failures kept for each group
+    :returns: FailureGroup[], in the order the groups first failed
+    """
+    groups = {}
+    for failure in failures:
+        key = (failure.test, failure.role, failure.context)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'message': failure.message, 'count': 0, 'examples': [], 'first_line': None, 'last_line': None}
+        group['count'] += 1
+        if len(group['examples']) < examples:
+            group['examples'].append(failure)
+        line = failure.line
+        if line is not None:
+            if group['first_line'] is None or line < group['first_line']:
+                group['first_line'] = line
+            if group['last_line'] is None or line > group['last_line']:
+                group['last_line'] = line
+
+    return [
+        FailureGroup(test=test, role=role, context=context, **group)
+        for (test, role, context), group in groups.items()
+    ]
+
+
+def _color_string(message, severity):
+    RED = '31m'
+    YELLOW = '33m'
+    BLUE = '34m'
+    WHITE = '37m'
+    RESET = '0m'
+    color_map = {
+        'ERROR': RED,
+        'WARNING': YELLOW,
+        'INFO': BLUE,
+    }
+    return f'\033[{color_map.get(severity, WHITE)}{message}\033[{RESET}'
 
 
 def print_failure(filename, failure, colored=False, verbose=False):
@@ -176,21 +724,32 @@ def print_failure(filename, failure, colored=False, verbose=False):
     :param failure: Failure
     :param colored: bool, prints with ansi colors according to failure severity
     """
-    def color_string(message, severity):
-        RED = '31m'
-        YELLOW = '33m'
-        BLUE = '34m'
-        WHITE = '37m'
-        RESET = '0m'
-        color_map = {
-            'ERROR': RED,
-            'WARNING': YELLOW,
-            'INFO': BLUE,
-        }
-        return f'\033[{color_map.get(severity, WHITE)}{message}\033[{RESET}'
     message = f'[{failure.role}] {filename}:{failure.line}: {failure.element}: {failure.message}'
     if verbose:
         message += f'\n    location: {failure.location}\n    test: {failure.test}'
     if colored:
-        message = color_string(message, failure.role)
+        message = _color_string(message, failure.role)
+    print(message)
+
+
+def print_failure_group(filename, group, colored=False, verbose=False):
+    """
+    Pretty prints a group of failures, see aggregate_failures
+
+    :param filename: str, path to file tested
+    :param group: FailureGroup
+    :param colored: bool, prints with ansi colors according to failure severity
+    :param verbose: bool, also prints the rule context, test and the location of each example
+    """
+    lines = f'{group.first_line}' if group.first_line == group.last_line else f'{group.first_line}-{group.last_line}'
+    message = f'[{group.role}] {filename}:{lines}: {group.examples[0].element}: {group.message} ({group.count} failures)'
+    if verbose:
+        message += f'\n    context: {group.context}\n    test: {group.test}'
+        for example in group.examples:
+            if example.location is not None:
+                message += f'\n    location: {example.location} (line {example.line})'
+        if group.count > len(group.examples):
+            message += f'\n    ... and {group.count - len(group.examples)} more'
+    if colored:
+        message = _color_string(message, group.role)
     print(message)
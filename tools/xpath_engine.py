@@ -0,0 +1,459 @@
+"""
+Schematron engine which evaluates the rules with lxml's XPath directly instead
+of compiling the schematron to XSLT.
+
+Every rule context, let, assert test and message expression is compiled once
+into an etree.XPath. Validating a document then evaluates each rule context once
+over the whole document and gives every matched node to the first rule of its
+pattern which matches it, as the skeleton's template priorities do. Lets are
+evaluated once per fired node, in order, and passed to the asserts as variables.
+
+The result is the same list of Failures as tools.validate_sch.Validator, with
+the exception that there is no svrl report to save.
+"""
+import functools
+import threading
+
+from lxml import etree
+
+from .catalog import build_catalog, expected_rules
+from .compile_sch import expand_schematron
+from .constants import SCH_NS, SCH_NSMAP, XSL_NSMAP, BSYNC_NSMAP
+from .generate_sch import csv_to_schematron, _split_top_level
+from .validate_sch import (
+    Failure, _parse_schematron, _parse_document, _find_unfired_rules,
+    _unfired_rule_failure, _get_role, _get_phase_patterns, _select_phases, aggregate_failures,
+)
+
+# context of rules which match the document node
+_DOCUMENT_CONTEXT = '/'
+
+
+def _load_schematron(schematron):
+    """
+    :param schematron: str, path to sch or csv file or string containing schematron xml
+    :returns: etree._ElementTree, the schematron (before include expansion)
+    """
+    if schematron.endswith('.csv'):
+        return csv_to_schematron(schematron)
+    return _parse_schematron(schematron)
+
+
+def _locate_node(document_tree, node):
+    """
+    :param document_tree: etree._ElementTree
+    :param node: etree._Element, the failed element
+    :returns: (int, str, str), line, element name and readable xpath of the failed element
+    """
+    tag = node.tag
+    if isinstance(tag, str):
+        tag = tag.replace("{http://buildingsync.net/schemas/bedes-auc/2019}", "auc:")
+    return node.sourceline, tag, document_tree.getpath(node)
+
+
+def _context_to_select(context):
+    """
+    Converts a rule context (an xslt match pattern) into an xpath selecting
+    every node it matches
+
+    :param context: str
+    :returns: str | None, None if the context only matches the document node
+    """
+    branches = []
+    for branch in _split_top_level(context, '|'):
+        branch = branch.strip()
+        if branch == _DOCUMENT_CONTEXT:
+            continue
+        branches.append(branch if branch.startswith('/') else f'//{branch}')
+    return ' | '.join(branches) or None
+
+
+def _as_variable(value):
+    """
+    Converts the result of a let for use as a variable of other xpaths. lxml can
+    only pass node-sets of elements back into an xpath, so attributes and text
+    nodes are replaced by detached elements with the same string value, which
+    compare, convert and count the same way.
+
+    :param value: result of an etree.XPath
+    :returns: value usable as an xpath variable
+    """
+    if not isinstance(value, list):
+        return value
+    converted = []
+    for item in value:
+        if not isinstance(item, etree._Element):
+            text_element = etree.Element('value')
+            text_element.text = item
+            item = text_element
+        converted.append(item)
+    return converted
+
+
+class _Rule:
+    def __init__(self, rule_elem, compile_xpath):
+        self.context = rule_elem.get('context')
+        self.select = _context_to_select(self.context)
+        self.select_xpath = compile_xpath(self.select) if self.select else None
+        self.lets = [
+            (let.get('name'), compile_xpath(let.get('value')))
+            for let in rule_elem.iterchildren(f'{{{SCH_NS}}}let')
+        ]
+        self.asserts = [
+            _Assert(assert_elem, compile_xpath, on_document=False)
+            for assert_elem in rule_elem.iterchildren(f'{{{SCH_NS}}}assert')
+        ]
+
+        # lxml evaluates xpaths on a document with its root element as the
+        # context, so expressions which need the document node as their context
+        # are compiled separately
+        self.document_asserts = None
+        branches = [branch.strip() for branch in _split_top_level(self.context, '|')]
+        if _DOCUMENT_CONTEXT in branches:
+            if self.lets:
+                raise Exception(f'sch:let in rule "{self.context}" is not supported by the xpath engine')
+            self.document_asserts = [
+                _Assert(assert_elem, compile_xpath, on_document=True)
+                for assert_elem in rule_elem.iterchildren(f'{{{SCH_NS}}}assert')
+            ]
+
+
+class _Assert:
+    def __init__(self, assert_elem, compile_xpath, on_document):
+        """
+        :param on_document: bool, if True the expressions are evaluated with the document node as context
+        """
+        # the skeleton reports the test with its whitespace normalized
+        self.test = ' '.join(assert_elem.get('test').split())
+        if on_document:
+            self.test_xpath = compile_xpath(f'boolean(/self::node()[boolean({self.test})])')
+        else:
+            self.test_xpath = compile_xpath(f'boolean({self.test})')
+        # the skeleton only adds the role to the svrl report when it is not empty
+        self.role = assert_elem.get('role') or None
+        # the message is a list of strings and xpaths, whose string values are
+        # filled in. Whitespace only text between elements is dropped, as it is
+        # when the message becomes part of the validation xslt
+        self.message_parts = []
+        self._add_text(assert_elem.text)
+        for child in assert_elem:
+            if not isinstance(child.tag, str):
+                self._add_text(child.tail)
+                continue
+            tag = etree.QName(child)
+            if tag.namespace != SCH_NS or tag.localname not in ('name', 'value-of'):
+                raise Exception(f'Element {child.tag} in assert "{self.test}" is not supported by the xpath engine')
+            if on_document:
+                if tag.localname != 'name' or child.get('path') is not None:
+                    raise Exception(f'Element {child.tag} in assert "{self.test}" on the document node is not supported by the xpath engine')
+                # the document node has no name
+                self.message_parts.append('')
+            elif tag.localname == 'name':
+                self.message_parts.append(compile_xpath(f'name({child.get("path", ".")})'))
+            else:
+                self.message_parts.append(compile_xpath(f'string({child.get("select")})'))
+            self._add_text(child.tail)
+
+    def _add_text(self, text):
+        if text and text.strip():
+            self.message_parts.append(text)
+
+    def message(self, node, variables):
+        message = ''.join(
+            part if isinstance(part, str) else part(node, **variables)
+            for part in self.message_parts
+        )
+        # an empty svrl:text element has no text
+        return message or None
+
+
+class _Pattern:
+    def __init__(self, pattern_elem, compile_xpath):
+        self.id = pattern_elem.get('id')
+        self.lets = [
+            (let.get('name'), compile_xpath(let.get('value')))
+            for let in pattern_elem.iterchildren(f'{{{SCH_NS}}}let')
+        ]
+        self.rules = [_Rule(rule_elem, compile_xpath) for rule_elem in pattern_elem.iterchildren(f'{{{SCH_NS}}}rule')]
+
+
+class _Document:
+    """
+    Per document state used by the key() and current() extension functions
+    """
+    def __init__(self, tree, key_definitions):
+        self.tree = tree
+        self.current = None
+        self._key_definitions = key_definitions
+        self._keys = {}
+        self._order = None
+
+    def order(self, node):
+        """
+        :returns: int, position of the node in document order
+        """
+        if self._order is None:
+            self._order = {n: i for i, n in enumerate(self.tree.getroot().iter())}
+        return self._order[node]
+
+    def key(self, name):
+        """
+        :returns: dict, {value: [nodes]} of the xsl:key with the name
+        """
+        if name not in self._keys:
+            if name not in self._key_definitions:
+                raise Exception(f'Unknown key "{name}"')
+            match_xpath, use_xpath = self._key_definitions[name]
+            index = {}
+            for node in match_xpath(self.tree):
+                values = use_xpath(node)
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    value = value if isinstance(value, str) else _string_value(value)
+                    index.setdefault(value, []).append(node)
+            self._keys[name] = index
+        return self._keys[name]
+
+
+def _string_value(value):
+    """
+    :returns: str, the xpath string value of a node or number
+    """
+    if isinstance(value, etree._Element):
+        return ''.join(value.itertext())
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class XPathValidator:
+    """
+    Schematron which is evaluated with lxml's XPath directly. It is a drop-in
+    replacement for tools.validate_sch.Validator without the XSLT compile step,
+    see the module docstring for how rules are run.
+    """
+
+    def __init__(self, schematron, phase=None, use_cache=True):
+        """
+        :param schematron: str, path to sch or csv file or string containing schematron xml
+        :param phase: str | None, id of the phase to run, runs the default phase (or all phases) if None
+        :param use_cache: bool, if True the expanded schematron is read from the on-disk cache when available
+        """
+        schematron_tree = _load_schematron(schematron)
+        self._phase_patterns = _get_phase_patterns(schematron_tree)
+
+        # as an extra precaution, verify there's a phase with the given ID
+        _select_phases(self._phase_patterns, phase)
+
+        self.phase = phase
+        self.schematron_tree = expand_schematron(schematron_tree, use_cache=use_cache)
+        schema = self.schematron_tree.getroot()
+
+        for unsupported in ('extends', 'report'):
+            if schema.xpath(f'.//sch:{unsupported}', namespaces=SCH_NSMAP):
+                raise Exception(f'sch:{unsupported} is not supported by the xpath engine')
+
+        self._state = threading.local()
+        namespaces = dict(BSYNC_NSMAP)
+        for ns in schema.xpath('sch:ns', namespaces=SCH_NSMAP):
+            namespaces[ns.get('prefix')] = ns.get('uri')
+        extensions = {(None, 'key'): self._key, (None, 'current'): self._current}
+
+        def compile_xpath(expression):
+            try:
+                return etree.XPath(expression, namespaces=namespaces, extensions=extensions, smart_strings=False)
+            except etree.XPathSyntaxError as e:
+                raise Exception(f'Invalid xpath "{expression}": {e}')
+
+        self._key_definitions = {
+            key.get('name'): (compile_xpath(_context_to_select(key.get('match'))), compile_xpath(key.get('use')))
+            for key in schema.xpath('xsl:key', namespaces=XSL_NSMAP)
+        }
+        # lets of the schema are evaluated once per document
+        self._lets = [
+            (let.get('name'), compile_xpath(let.get('value')))
+            for let in schema.iterchildren(f'{{{SCH_NS}}}let')
+        ]
+
+        active_phase = phase or schema.get('defaultPhase')
+        active_patterns = None
+        if active_phase is not None and active_phase != '#ALL':
+            active_patterns = set(schema.xpath(
+                f'sch:phase[@id = "{active_phase}"]/sch:active/@pattern',
+                namespaces=SCH_NSMAP,
+            ))
+        self._patterns = [
+            _Pattern(pattern_elem, compile_xpath)
+            for pattern_elem in schema.iterchildren(f'{{{SCH_NS}}}pattern')
+            if active_patterns is None or pattern_elem.get('id') in active_patterns
+        ]
+        self._catalog = build_catalog(self.schematron_tree)
+        # {selected phases: contexts of the rules expected to fire}
+        self._expected_rules = {}
+
+    @property
+    def phases(self):
+        """
+        Ids of the phases which can be selected when validating
+
+        :returns: list of str
+        """
+        if self.phase is not None:
+            return [self.phase]
+        return list(self._phase_patterns)
+
+    def _get_expected_rules(self, phases):
+        """
+        :param phases: list of str | None, phases run, every phase the validator was built for if None
+        :returns: list of str, contexts of the rules run, in schematron order
+        """
+        key = self.phase if phases is None else tuple(phases)
+        if key not in self._expected_rules:
+            self._expected_rules[key] = expected_rules(self._catalog, self.phase if phases is None else phases)
+        return self._expected_rules[key]
+
+    def _selected_patterns(self, phases):
+        """
+        :param phases: list of str | None, phases to run, every phase compiled if None
+        :returns: list of _Pattern, in schematron order
+        """
+        if phases is None:
+            return self._patterns
+        pattern_ids = {pattern_id for phase in phases for pattern_id in self._phase_patterns[phase]}
+        return [pattern for pattern in self._patterns if pattern.id in pattern_ids]
+
+    def _key(self, context, name, value):
+        document = self._state.document
+        index = document.key(name)
+        values = value if isinstance(value, list) else [value]
+        nodes = []
+        for v in values:
+            nodes += index.get(v if isinstance(v, str) else _string_value(v), [])
+        if len(values) > 1:
+            nodes = sorted(set(nodes), key=document.order)
+        return nodes
+
+    def _current(self, context):
+        current = self._state.document.current
+        return [] if current is None else [current]
+
+    def _fire(self, pattern, document):
+        """
+        Finds the nodes each rule of the pattern fires on
+
+        :returns: list of (node, _Rule), in document order
+        """
+        fired = {}
+        document_rule = None
+        for rule in pattern.rules:
+            if rule.document_asserts is not None and document_rule is None:
+                document_rule = rule
+            if rule.select_xpath is None:
+                continue
+            for node in rule.select_xpath(document.tree):
+                # only elements, comments and processing instructions are visited
+                if isinstance(node, etree._Element) and node not in fired:
+                    fired[node] = rule
+
+        nodes = list(fired)
+        if len(pattern.rules) > 1:
+            nodes.sort(key=document.order)
+        result = [(node, fired[node]) for node in nodes]
+        if document_rule is not None:
+            result.insert(0, (document.tree, document_rule))
+        return result
+
+    def _failure(self, document_tree, node, rule, assert_, message):
+        if isinstance(node, etree._ElementTree):
+            # failures of rules on the document node are reported on the root element
+            node = node.getroot()
+        return Failure(
+            message=message,
+            role=_get_role(assert_.role, message),
+            test=assert_.test,
+            context=rule.context,
+            resolve=functools.partial(_locate_node, document_tree, node),
+        )
+
+    def validate(self, document, result_path=None, strict_context=False, phases=None, aggregate=False):
+        """
+        Runs the schematron on the given document and returns an array of failures
+
+        :param document: str | bytes | file | etree._ElementTree | etree._Element, path to xml file to test, string or bytes containing document xml, a file object or etree
+        :param result_path: must be None, the xpath engine does not produce an svrl report
+        :param strict_context: bool, if True unfired rules are reported as failures
+        :param phases: str | list of str | None, id of the phase, or ids of several phases, to run in this pass; None runs every phase the validator was built for
+        :param aggregate: bool, if True the failures are grouped, see tools.validate_sch.aggregate_failures
+        :returns: Failure[], list of failures, or FailureGroup[] if aggregate is True
+        """
+        failures = self._iter_validate(document, result_path, strict_context, phases)
+        if aggregate:
+            return aggregate_failures(failures)
+        return failures
+
+    def _iter_validate(self, document, result_path=None, strict_context=False, phases=None, with_context=True):
+        """
+        Validates the document, see validate. The context of every failure is
+        always known, so with_context is ignored.
+
+        :returns: Failure[]
+        """
+        if result_path is not None:
+            raise Exception('Saving the svrl result is not supported by the xpath engine')
+
+        phases = _select_phases(self._phase_patterns, phases, self.phase)
+        failures, fired_rules = self._validate_with_fired_rules(_parse_document(document), phases)
+        if strict_context:
+            unfired = [_unfired_rule_failure(rule) for rule in _find_unfired_rules(self._get_expected_rules(phases), fired_rules)]
+            failures = unfired + failures
+        return failures
+
+    def _validate_with_fired_rules(self, document_tree, phases=None):
+        """
+        Validates without strict context checks, but also returns the context of
+        every rule fired, see tools.validate_sch.Validator._validate_with_fired_rules
+
+        :param document_tree: etree._ElementTree
+        :param phases: str | list of str | None, see validate
+        :returns: (Failure[], list of str), failures and the context of each fired rule
+        """
+        patterns = self._selected_patterns(_select_phases(self._phase_patterns, phases, self.phase))
+        document = _Document(document_tree, self._key_definitions)
+        self._state.document = document
+        try:
+            return self._run(document, patterns)
+        finally:
+            self._state.document = None
+
+    def _run(self, document, patterns):
+        global_variables = {}
+        for name, let_xpath in self._lets:
+            global_variables[name] = _as_variable(let_xpath(document.tree, **global_variables))
+        for pattern in patterns:
+            # lets of patterns are global, as in the validation xslt
+            for name, let_xpath in pattern.lets:
+                global_variables[name] = _as_variable(let_xpath(document.tree, **global_variables))
+
+        failures = []
+        fired_rules = []
+        for pattern in patterns:
+            for node, rule in self._fire(pattern, document):
+                fired_rules.append(rule.context)
+                if isinstance(node, etree._ElementTree):
+                    document.current = None
+                    asserts = rule.document_asserts
+                else:
+                    document.current = node
+                    asserts = rule.asserts
+                variables = dict(global_variables)
+                for name, let_xpath in rule.lets:
+                    variables[name] = _as_variable(let_xpath(node, **variables))
+                for assert_ in asserts:
+                    if not assert_.test_xpath(node, **variables):
+                        message = assert_.message(node, variables)
+                        failures.append(self._failure(document.tree, node, rule, assert_, message))
+
+        return failures, fired_rules